@@ -1,7 +1,9 @@
 import { NextResponse } from "next/server";
 import { auth } from "@/auth";
-import { db } from "@/lib/prisma";
-import { getDolarRate } from "@/lib/exchange";
+import {
+  getDividendsWithRates,
+  getTransactionsWithRates,
+} from "@/lib/exchange";
 import { getInflationRate } from "@/lib/inflation";
 
 /**
@@ -24,6 +26,7 @@ interface Transaction {
   userId: string;
   createdAt: Date;
   updatedAt: Date;
+  usdRate: number | null; // USD/TRY rate joined in SQL, null for TRY rows
 }
 
 /**
@@ -91,15 +94,9 @@ export async function POST() {
     const endOfTaxYear = new Date(taxYear, 11, 31, 23, 59, 59, 999);
 
     // Fetch ALL transactions for the user (not just tax year)
-    // We need historical transactions to maintain accurate FIFO queues
-    const allTransactions = await db.transaction.findMany({
-      where: {
-        userId: {
-          equals: userId,
-        },
-      },
-      orderBy: { date: "asc" },
-    });
+    // We need historical transactions to maintain accurate FIFO queues.
+    // USD/TRY rates are joined in the same query.
+    const allTransactions = await getTransactionsWithRates(userId);
     console.log(`Found ${allTransactions.length} total transactions`);
 
     // Add detailed logging for debugging
@@ -155,6 +152,7 @@ export async function POST() {
           date,
           averagePrice,
           currency,
+          usdRate,
         } = transaction;
 
         // Check if this transaction is in the tax year
@@ -172,11 +170,8 @@ export async function POST() {
 
         // Convert price to TRY if in USD
         let price = averagePrice;
-        if (currency === "USD") {
-          const rate = await getDolarRate(date);
-          if (rate) {
-            price *= rate;
-          }
+        if (currency === "USD" && usdRate) {
+          price *= usdRate;
         }
 
         if (operationType === "Alış") {
@@ -328,29 +323,19 @@ export async function POST() {
 
     for (const t of taxYearTransactions) {
       let commission = t.transactionFee;
-      if (t.currency === "USD") {
-        const rate = await getDolarRate(t.date);
-        if (rate) {
-          commission *= rate;
-        }
+      if (t.currency === "USD" && t.usdRate) {
+        commission *= t.usdRate;
       }
       totalCommission += commission;
     }
 
     // Process dividends for the tax year
     console.log(`\nProcessing tax year ${taxYear} dividends...`);
-    const dividends = await db.dividend.findMany({
-      where: {
-        userId: {
-          equals: userId,
-        },
-        paymentDate: {
-          gte: startOfTaxYear,
-          lte: endOfTaxYear,
-        },
-      },
-      orderBy: { paymentDate: "asc" },
-    });
+    const dividends = await getDividendsWithRates(
+      userId,
+      startOfTaxYear,
+      endOfTaxYear
+    );
 
     // Initialize dividend summary
     const dividendSummary: DividendSummary = {
@@ -367,7 +352,7 @@ export async function POST() {
       let netAmount = dividend.netAmount;
 
       // Convert USD amounts to TRY if needed
-      const rate = await getDolarRate(dividend.paymentDate);
+      const rate = dividend.usdRate;
       if (rate) {
         grossAmount *= rate;
         taxWithheld *= rate;
@@ -1,6 +1,7 @@
 import { NextResponse } from "next/server";
 import { auth } from "@/auth";
 import { db } from "@/lib/prisma";
+import { getExtractWorkerPool } from "@/lib/extract-worker";
 
 export async function POST() {
   try {
@@ -11,7 +12,8 @@ export async function POST() {
       return NextResponse.json({ error: "Unauthorized" }, { status: 401 });
     }
 
-    // Delete all transactions and dividends for the user
+    // Delete all transactions and dividends for the user, along with the
+    // FIFO snapshot and precomputed results built from them
     await Promise.all([
       db.transaction.deleteMany({
         where: {
@@ -23,8 +25,26 @@ export async function POST() {
           userId: userId,
         },
       }),
+      db.fifoSnapshot.deleteMany({
+        where: {
+          userId: userId,
+        },
+      }),
+      db.taxResult.deleteMany({
+        where: {
+          userId: userId,
+        },
+      }),
     ]);
 
+    // Drop the history snapshot built from the deleted rows; a failure here
+    // is harmless, as the snapshot no longer matches the database anyway
+    try {
+      await getExtractWorkerPool().refreshHistory(userId);
+    } catch (snapshotError) {
+      console.error("Error refreshing history snapshot:", snapshotError);
+    }
+
     return NextResponse.json({ success: true });
   } catch (error) {
     console.error("Error resetting data:", error);
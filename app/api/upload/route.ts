@@ -1,18 +1,12 @@
-import { writeFile, unlink } from "fs/promises";
+import { writeFile } from "fs/promises";
 import { NextResponse } from "next/server";
-import { join } from "path";
+import { randomUUID } from "crypto";
+import { basename, join } from "path";
 import { auth } from "@/auth";
-import { spawn } from "child_process";
-import type { ChildProcessWithoutNullStreams } from "child_process";
 import fs from "fs/promises";
 import { db } from "@/lib/prisma";
-
-interface PythonResult {
-  success: boolean;
-  message?: string;
-  error?: string;
-  hasData?: boolean;
-}
+import { getExtractWorkerPool } from "@/lib/extract-worker";
+import type { BatchFileEvent, PythonResult } from "@/lib/extract-worker";
 
 export async function POST(req: Request) {
   try {
@@ -81,136 +75,116 @@ export async function POST(req: Request) {
       },
     });
 
+    const sendEvent = (event: Record<string, unknown>) =>
+      writer.write(encoder.encode(`data: ${JSON.stringify(event)}\n\n`));
+
     // Process files in the background
     (async () => {
       try {
-        // Create user-specific directory: uploads/[userId]
-        const userUploadDir = join(process.cwd(), "uploads", userId);
-        await fs.mkdir(userUploadDir, { recursive: true });
+        // Every upload gets its own directory under uploads/[userId], so
+        // concurrent uploads neither overwrite nor clean up each other's files
+        const uploadDir = join(process.cwd(), "uploads", userId, randomUUID());
+        await fs.mkdir(uploadDir, { recursive: true });
 
-        for (let i = 0; i < files.length; i++) {
-          const file = files[i];
-          const isLastFile = i === files.length - 1;
+        const savedFiles: { name: string; path: string; file: File }[] = [];
 
+        for (const file of files) {
           // Send upload start event
-          await writer.write(
-            encoder.encode(
-              `data: ${JSON.stringify({
-                type: "status",
-                file: file.name,
-                status: "processing_start",
-              })}\n\n`
-            )
-          );
+          await sendEvent({
+            type: "status",
+            file: file.name,
+            status: "processing_start",
+          });
 
           // Validate file type
           if (file.type !== "application/pdf") {
-            await writer.write(
-              encoder.encode(
-                `data: ${JSON.stringify({
-                  type: "error",
-                  file: file.name,
-                  error: "PDF dosyası değil",
-                })}\n\n`
-              )
-            );
+            await sendEvent({
+              type: "error",
+              file: file.name,
+              error: "PDF dosyası değil",
+            });
             continue;
           }
 
-          const bytes = await file.arrayBuffer();
-          const buffer = Buffer.from(bytes);
-
-          // Create path and write file in user's directory
-          const filePath = join("uploads", userId, file.name);
-          const absoluteFilePath = join(process.cwd(), filePath);
-          await writeFile(absoluteFilePath, buffer);
-
-          // Process file with Python script
-          const pythonResult = await new Promise<PythonResult>(
-            (resolve, reject) => {
-              let result = "";
-              let error = "";
-
-              const pythonProcess = spawn("python", [
-                "python/run_extract_tables.py",
-                absoluteFilePath,
-                userId,
-              ]) as ChildProcessWithoutNullStreams;
-
-              pythonProcess.stdout.setEncoding("utf-8");
-              pythonProcess.stderr.setEncoding("utf-8");
-
-              pythonProcess.stdout.on("data", async (data: string) => {
-                result += data;
-                // Send processing progress event
-                await writer.write(
-                  encoder.encode(
-                    `data: ${JSON.stringify({
-                      type: "processing_progress",
-                      file: file.name,
-                      data: data.toString(),
-                    })}\n\n`
-                  )
-                );
-              });
+          savedFiles.push({
+            name: file.name,
+            file,
+            // Prefixed with its position, since one upload may hold two
+            // files of the same name
+            path: join(uploadDir, `${savedFiles.length}-${basename(file.name)}`),
+          });
+        }
 
-              pythonProcess.stderr.on("data", async (data: string) => {
-                error += data;
-                console.error(`Python script error: ${data}`);
-                await writer.write(
-                  encoder.encode(
-                    `data: ${JSON.stringify({
-                      type: "error",
-                      file: file.name,
-                      error: "İşlem sırasında hata oluştu: " + data.toString(),
-                    })}\n\n`
-                  )
-                );
-              });
+        try {
+          // The files are small (1,200 KB in total), so write them all at once
+          await Promise.all(
+            savedFiles.map(async ({ path, file }) => {
+              await writeFile(path, Buffer.from(await file.arrayBuffer()));
+            })
+          );
 
-              pythonProcess.on("close", (code: number | null) => {
-                if (code === 0) {
-                  try {
-                    // The Python script now outputs a clean JSON object
-                    const jsonResult = JSON.parse(result.trim());
-                    resolve(jsonResult as PythonResult);
-                  } catch (parseError) {
-                    console.error("JSON parse error:", parseError);
-                    if (error) {
-                      reject(new Error(error));
-                    } else {
-                      resolve({
-                        success: true,
-                        message: "İşlem başarıyla tamamlandı",
-                        hasData: false,
-                      });
-                    }
-                  }
-                } else {
-                  reject(new Error(error || "Python script çalıştırılamadı"));
-                }
+          if (savedFiles.length > 0) {
+            const sendResult = async (name: string, pythonResult: PythonResult) => {
+              await sendEvent({
+                type: "processing_progress",
+                file: name,
+                data: pythonResult.message ?? pythonResult.error ?? "",
               });
-            }
-          );
 
-          // Send completion event
-          await writer.write(
-            encoder.encode(
-              `data: ${JSON.stringify({
+              // Send completion event
+              await sendEvent({
                 type: "status",
-                file: file.name,
+                file: name,
                 status: "processing_complete",
                 result: pythonResult,
-              })}\n\n`
-            )
-          );
-
-          // Clean up the file after processing
-          try {
-            await unlink(absoluteFilePath);
-            if (isLastFile) {
-              await fs.rm(userUploadDir, { recursive: true });
+              });
+            };
+
+            // Files report in as their extraction finishes; unreadable
+            // files and files without rows are done then, the others once
+            // the batch is committed
+            const completed = new Set<number>();
+            let progress: Promise<void> = Promise.resolve();
+            const onFile = ({ index, final, ...pythonResult }: BatchFileEvent) => {
+              const name = savedFiles[index]?.name;
+              if (name === undefined) return;
+              if (final) completed.add(index);
+              progress = progress.then(() =>
+                final
+                  ? sendResult(name, pythonResult)
+                  : sendEvent({
+                      type: "processing_progress",
+                      file: name,
+                      data: pythonResult.message ?? "",
+                    })
+              );
+            };
+
+            // Extract every file in the warm Python worker and insert them
+            // all in one transaction
+            const batch = await getExtractWorkerPool().processBatch(
+              savedFiles.map((file) => file.path),
+              userId,
+              onFile
+            );
+            await progress;
+
+            for (const [i, file] of savedFiles.entries()) {
+              if (completed.has(i)) continue;
+              await sendResult(
+                file.name,
+                batch.results?.[i] ?? {
+                  success: false,
+                  error: batch.error ?? "İşlem sonucu alınamadı",
+                  hasData: false,
+                }
+              );
             }
+          }
+        } finally {
+          // Clean up this upload's files after processing
+          try {
+            await fs.rm(uploadDir, { recursive: true });
           } catch (deleteError) {
             console.error(`Error during cleanup: ${deleteError}`);
           }
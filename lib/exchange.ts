@@ -1,24 +1,78 @@
+import type { Dividend, Transaction } from "@prisma/client";
 import { db } from "./prisma";
 
+// Bayram holidays can close the market for up to nine days in a row, so a
+// lookup may walk back at most this far (same as python/get_dolar.py)
+export const MAX_FALLBACK_DAYS = 15;
+
+export type TransactionWithRate = Transaction & { usdRate: number | null };
+export type DividendWithRate = Dividend & { usdRate: number | null };
+
+/**
+ * Latest USD/TRY rate published on or before `date`, or null if there is
+ * none within MAX_FALLBACK_DAYS
+ */
 export async function getDolarRate(date: Date): Promise<number | null> {
-  const formattedDate = date.toLocaleDateString("tr-TR", {
-    day: "2-digit",
-    month: "2-digit",
-    year: "numeric",
-  });
+  const day = new Date(
+    Date.UTC(date.getFullYear(), date.getMonth(), date.getDate())
+  );
+  const earliest = new Date(day);
+  earliest.setUTCDate(earliest.getUTCDate() - MAX_FALLBACK_DAYS);
 
-  // console.log("Getting dolar rate for date:", formattedDate);
-  // Try to get from database first
   const rate = await db.dolar.findFirst({
     where: {
-      gecerliOlduguTarih: formattedDate,
+      rateDate: { lte: day, gte: earliest },
     },
+    orderBy: [{ rateDate: "desc" }, { id: "desc" }],
   });
-  // console.log("Rate:", rate);
-  if (rate) {
-    return rate.dovizAlis;
-  }
 
-  // If not in database, return null
-  return null;
+  return rate ? rate.dovizAlis : null;
+}
+
+/**
+ * All transactions of a user in (date, id) order, each joined in SQL to
+ * its applicable USD/TRY rate. `usdRate` is null for non-USD rows and for
+ * days without a rate.
+ */
+export async function getTransactionsWithRates(
+  userId: string
+): Promise<TransactionWithRate[]> {
+  return db.$queryRaw<TransactionWithRate[]>`
+    SELECT t.*, r."dovizAlis" AS "usdRate"
+    FROM "Transaction" t
+    LEFT JOIN LATERAL (
+      SELECT d."dovizAlis"
+      FROM "Dolar" d
+      WHERE d."rateDate" <= t.date::date
+        AND d."rateDate" >= t.date::date - ${MAX_FALLBACK_DAYS}::int
+      ORDER BY d."rateDate" DESC, d.id DESC
+      LIMIT 1
+    ) r ON t.currency = 'USD'
+    WHERE t."userId" = ${userId}
+    ORDER BY t.date, t.id
+  `;
+}
+
+/** Dividends paid in [from, to], each joined to the rate of its payment day */
+export async function getDividendsWithRates(
+  userId: string,
+  from: Date,
+  to: Date
+): Promise<DividendWithRate[]> {
+  return db.$queryRaw<DividendWithRate[]>`
+    SELECT v.*, r."dovizAlis" AS "usdRate"
+    FROM "Dividend" v
+    LEFT JOIN LATERAL (
+      SELECT d."dovizAlis"
+      FROM "Dolar" d
+      WHERE d."rateDate" <= v."paymentDate"::date
+        AND d."rateDate" >= v."paymentDate"::date - ${MAX_FALLBACK_DAYS}::int
+      ORDER BY d."rateDate" DESC, d.id DESC
+      LIMIT 1
+    ) r ON true
+    WHERE v."userId" = ${userId}
+      AND v."paymentDate" >= ${from}
+      AND v."paymentDate" <= ${to}
+    ORDER BY v."paymentDate"
+  `;
 }
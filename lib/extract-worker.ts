@@ -0,0 +1,207 @@
+import { spawn } from "child_process";
+import type { ChildProcessWithoutNullStreams } from "child_process";
+import { createInterface } from "readline";
+
+export interface PythonResult {
+  success: boolean;
+  message?: string;
+  error?: string;
+  hasData?: boolean;
+}
+
+export interface BatchFileResult extends PythonResult {
+  file: string;
+}
+
+/** Sent by processBatch as each file's extraction finishes, before the commit */
+export interface BatchFileEvent extends PythonResult {
+  index: number;
+  file: string;
+  // true when the file is already settled (unreadable or without rows);
+  // otherwise its result only comes with the BatchResult
+  final: boolean;
+}
+
+export interface BatchResult {
+  success: boolean;
+  error?: string;
+  results?: BatchFileResult[];
+}
+
+interface Job {
+  payload: Record<string, unknown>;
+  // Progress lines ({"event": ...}) the job writes before its result
+  onEvent?: (event: unknown) => void;
+  resolve: (result: unknown) => void;
+  reject: (error: Error) => void;
+}
+
+// Python processes extracting at the same time; each runs one job at a time
+const POOL_SIZE = Math.max(1, Number(process.env.EXTRACT_WORKER_POOL_SIZE) || 2);
+
+// A job that has not answered this long after its worker started it is
+// failed and that worker replaced, so one stuck PDF does not hold up
+// later uploads. Time spent waiting in the queue does not count.
+const JOB_TIMEOUT_MS = Number(process.env.EXTRACT_JOB_TIMEOUT_MS) || 10 * 60 * 1000;
+
+/**
+ * Long-lived python/extract_worker.py process running one job at a time.
+ * Jobs are written to its stdin as NDJSON and answered line by line on stdout,
+ * so pandas/pdfplumber are imported once instead of once per uploaded file.
+ */
+class ExtractWorker {
+  private child: ChildProcessWithoutNullStreams;
+  private job: { id: string; job: Job; timer: ReturnType<typeof setTimeout> } | null = null;
+  private nextId = 0;
+  alive = true;
+
+  constructor(
+    private onIdle: (worker: ExtractWorker) => void,
+    private onExit: (worker: ExtractWorker) => void
+  ) {
+    this.child = spawn("python", ["python/extract_worker.py"]);
+    this.child.stdout.setEncoding("utf-8");
+    this.child.stderr.setEncoding("utf-8");
+
+    createInterface({ input: this.child.stdout }).on("line", (line) => {
+      if (!line.trim()) return;
+      try {
+        const { id, event, ...result } = JSON.parse(line);
+        const current = this.job;
+        if (current && current.id === id && event) {
+          current.job.onEvent?.(result);
+        } else if (current && current.id === id) {
+          clearTimeout(current.timer);
+          this.job = null;
+          current.job.resolve(result);
+          this.onIdle(this);
+        }
+      } catch (parseError) {
+        console.error("Extract worker sent invalid JSON:", line, parseError);
+      }
+    });
+
+    // stderr only carries log output
+    this.child.stderr.on("data", (data: string) => {
+      console.log(`[extract_worker] ${data.trimEnd()}`);
+    });
+
+    this.child.on("close", (code: number | null) => {
+      this.fail(new Error(`Python işlemi sonlandı (kod: ${code})`));
+    });
+
+    // Spawn failures (python not on PATH) and writes after the process
+    // died (EPIPE) arrive as "error" events; unhandled, they would take
+    // down the server
+    this.child.on("error", (error: Error) => {
+      this.fail(new Error(`Python işlemi başlatılamadı: ${error.message}`));
+    });
+    this.child.stdin.on("error", (error: Error) => {
+      this.fail(new Error(`Python işlemine yazılamadı: ${error.message}`));
+    });
+  }
+
+  get busy(): boolean {
+    return this.job !== null;
+  }
+
+  /** Start a job; the worker must be alive and idle */
+  run(job: Job) {
+    const id = String(++this.nextId);
+    const timer = setTimeout(() => {
+      this.fail(
+        new Error(
+          `Python işlemi ${JOB_TIMEOUT_MS / 1000} saniyede yanıt vermedi; ` +
+            "verilerin kaydedilip kaydedilmediğini kontrol edin"
+        )
+      );
+    }, JOB_TIMEOUT_MS);
+    this.job = { id, job, timer };
+    this.child.stdin.write(JSON.stringify({ id, ...job.payload }) + "\n");
+  }
+
+  /** Mark the worker dead, reject its current job and stop the process */
+  private fail(error: Error) {
+    if (!this.alive) return;
+    this.alive = false;
+    const current = this.job;
+    this.job = null;
+    if (current) {
+      clearTimeout(current.timer);
+      current.job.reject(error);
+    }
+    if (this.child.exitCode === null && !this.child.killed) {
+      this.child.kill();
+    }
+    this.onExit(this);
+  }
+}
+
+/**
+ * Up to POOL_SIZE workers fed from one queue in arrival order. Workers are
+ * started on demand and replaced when they exit, so a crash or timeout
+ * only fails the job that worker was running.
+ */
+class ExtractWorkerPool {
+  private workers: ExtractWorker[] = [];
+  private queue: Job[] = [];
+
+  private send<T>(payload: Record<string, unknown>, onEvent?: (event: unknown) => void): Promise<T> {
+    return new Promise<T>((resolve, reject) => {
+      this.queue.push({ payload, onEvent, resolve: (result) => resolve(result as T), reject });
+      this.dispatch();
+    });
+  }
+
+  private dispatch() {
+    while (this.queue.length > 0) {
+      let worker = this.workers.find((candidate) => candidate.alive && !candidate.busy);
+      if (!worker) {
+        if (this.workers.length >= POOL_SIZE) return;
+        worker = new ExtractWorker(
+          () => this.dispatch(),
+          (exited) => {
+            this.workers = this.workers.filter((candidate) => candidate !== exited);
+            this.dispatch();
+          }
+        );
+        this.workers.push(worker);
+      }
+      worker.run(this.queue.shift()!);
+    }
+  }
+
+  processFile(pdfPath: string, userId: string): Promise<PythonResult> {
+    return this.send<PythonResult>({ pdf_path: pdfPath, user_id: userId });
+  }
+
+  /**
+   * Extract several files and insert them in a single transaction.
+   * `onFile` is called as each file's extraction finishes.
+   */
+  processBatch(
+    pdfPaths: string[],
+    userId: string,
+    onFile?: (event: BatchFileEvent) => void
+  ): Promise<BatchResult> {
+    return this.send<BatchResult>(
+      { pdf_paths: pdfPaths, user_id: userId },
+      onFile && ((event) => onFile(event as BatchFileEvent))
+    );
+  }
+
+  /** Rebuild the user's history snapshot after their data changed */
+  refreshHistory(userId: string): Promise<PythonResult> {
+    return this.send<PythonResult>({ action: "refresh_history", user_id: userId });
+  }
+}
+
+let pool: ExtractWorkerPool | null = null;
+
+/** Shared worker pool for this server process */
+export function getExtractWorkerPool(): ExtractWorkerPool {
+  if (!pool) {
+    pool = new ExtractWorkerPool();
+  }
+  return pool;
+}
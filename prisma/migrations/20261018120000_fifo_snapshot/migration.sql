@@ -0,0 +1,19 @@
+-- CreateTable
+CREATE TABLE "FifoSnapshot" (
+    "userId" TEXT NOT NULL,
+    "version" INTEGER NOT NULL,
+    "watermarkDate" TIMESTAMP(3) NOT NULL,
+    "watermarkId" INTEGER NOT NULL,
+    "transactionCount" INTEGER NOT NULL,
+    "transactionIdSum" BIGINT NOT NULL,
+    "state" JSONB NOT NULL,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "FifoSnapshot_pkey" PRIMARY KEY ("userId")
+);
+
+-- CreateIndex
+CREATE INDEX "Transaction_userId_date_id_idx" ON "Transaction"("userId", "date", "id");
+
+-- AddForeignKey
+ALTER TABLE "FifoSnapshot" ADD CONSTRAINT "FifoSnapshot_userId_fkey" FOREIGN KEY ("userId") REFERENCES "User"("id") ON DELETE CASCADE ON UPDATE CASCADE;
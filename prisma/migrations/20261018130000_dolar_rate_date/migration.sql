@@ -0,0 +1,25 @@
+-- AlterTable
+ALTER TABLE "Dolar" ADD COLUMN "rateDate" DATE;
+
+-- Keep "rateDate" in sync with the DD.MM.YYYY text column for every writer
+-- (Prisma, transfer.py, manual imports). Unparseable dates are left NULL.
+CREATE OR REPLACE FUNCTION "Dolar_set_rateDate"() RETURNS trigger AS $$
+BEGIN
+    BEGIN
+        NEW."rateDate" := to_date(NEW."gecerliOlduguTarih", 'DD.MM.YYYY');
+    EXCEPTION WHEN others THEN
+        NEW."rateDate" := NULL;
+    END;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "Dolar_rateDate_trigger"
+    BEFORE INSERT OR UPDATE OF "gecerliOlduguTarih" ON "Dolar"
+    FOR EACH ROW EXECUTE FUNCTION "Dolar_set_rateDate"();
+
+-- Backfill existing rows through the trigger
+UPDATE "Dolar" SET "gecerliOlduguTarih" = "gecerliOlduguTarih";
+
+-- CreateIndex
+CREATE INDEX "Dolar_rateDate_idx" ON "Dolar"("rateDate");
@@ -0,0 +1,12 @@
+-- CreateTable
+CREATE TABLE "TaxResult" (
+    "userId" TEXT NOT NULL,
+    "taxYear" INTEGER NOT NULL,
+    "result" JSONB NOT NULL,
+    "computedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "TaxResult_pkey" PRIMARY KEY ("userId","taxYear")
+);
+
+-- AddForeignKey
+ALTER TABLE "TaxResult" ADD CONSTRAINT "TaxResult_userId_fkey" FOREIGN KEY ("userId") REFERENCES "User"("id") ON DELETE CASCADE ON UPDATE CASCADE;
@@ -0,0 +1,17 @@
+-- AlterTable
+-- Months not yet published are left NULL, so the current year can be stored
+-- (and refreshed month by month, see python/import_rates.py) before December
+ALTER TABLE "YiUfe" ALTER COLUMN "ocak" DROP NOT NULL,
+ALTER COLUMN "subat" DROP NOT NULL,
+ALTER COLUMN "mart" DROP NOT NULL,
+ALTER COLUMN "nisan" DROP NOT NULL,
+ALTER COLUMN "mayis" DROP NOT NULL,
+ALTER COLUMN "haziran" DROP NOT NULL,
+ALTER COLUMN "temmuz" DROP NOT NULL,
+ALTER COLUMN "agustos" DROP NOT NULL,
+ALTER COLUMN "eylul" DROP NOT NULL,
+ALTER COLUMN "ekim" DROP NOT NULL,
+ALTER COLUMN "kasim" DROP NOT NULL;
+
+-- CreateIndex
+CREATE INDEX "YiUfe_yil_idx" ON "YiUfe"("yil");
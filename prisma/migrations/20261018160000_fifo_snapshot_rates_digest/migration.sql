@@ -0,0 +1,4 @@
+-- AlterTable
+-- Digest of the Dolar and YiUfe rows a snapshot was computed with; existing
+-- snapshots get NULL, never match, and are rebuilt on their next run
+ALTER TABLE "FifoSnapshot" ADD COLUMN "ratesDigest" TEXT;
@@ -0,0 +1,283 @@
+"""
+Asyncio variant of the database access in db_connection.py.
+
+Queries run on an asyncpg pool sized by the same PG_POOL_* settings, so one
+event loop can serve many users at once: while one query waits on the
+server the others proceed. Rows are asyncpg Records, which support
+`row['column']`, `row.get('column')` and iteration like the psycopg2
+DictRows returned by the blocking functions, so the same calculation code
+consumes either.
+
+Each event loop gets its own pool (asyncpg connections are bound to the
+loop that created them); call close_async_pool() before the loop ends.
+"""
+
+import asyncio
+import json
+import os
+import re
+
+import asyncpg
+
+import metrics
+from db_connection import (
+    BULK_BATCH_SIZE, TRANSACTION_COLUMNS, DIVIDEND_COLUMNS, FIFO_SNAPSHOT_FINGERPRINT_QUERY,
+    _TAX_SELECT, _connection_params, _transaction_rows, _dividend_rows,
+    fifo_snapshot_fingerprint_params, transactions_with_rates_query
+)
+from get_dolar import DolarRateTable, MAX_FALLBACK_DAYS, RATES_QUERY, get_rate_table
+from inflation_calculator import YiUfeSeries, get_inflation_series, month_index, months
+from logger import get_logger
+from transaction_array import TransactionArray
+
+logger = get_logger('async_db')
+
+POOL_TIMEOUT = float(os.getenv('PG_POOL_TIMEOUT', '30'))
+
+# Event loop -> task creating that loop's pool
+_pools = {}
+
+
+async def _init_connection(connection):
+    # JSON columns (FifoSnapshot.state, TaxResult.result) as Python objects
+    for type_name in ('json', 'jsonb'):
+        await connection.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def _create_pool():
+    params = _connection_params()
+    pool = await asyncpg.create_pool(
+        host=params['host'],
+        user=params['user'],
+        password=params['password'],
+        database=params['database'],
+        port=params['port'],
+        min_size=int(os.getenv('PG_POOL_MIN', '1')),
+        max_size=int(os.getenv('PG_POOL_MAX', '10')),
+        init=_init_connection,
+    )
+    logger.info(f"Async connection pool created (min={pool.get_min_size()}, max={pool.get_max_size()})")
+    return pool
+
+
+async def get_async_pool():
+    """Return the pool of the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    task = _pools.get(loop)
+    if task is None:
+        # Concurrent first callers all wait for the same pool
+        task = _pools[loop] = loop.create_task(_create_pool())
+    try:
+        return await asyncio.shield(task)
+    except Exception:
+        _pools.pop(loop, None)
+        raise
+
+
+async def close_async_pool():
+    task = _pools.pop(asyncio.get_running_loop(), None)
+    if task is not None:
+        await (await task).close()
+
+
+def _numbered(query, params):
+    """Convert a psycopg2 query with %(name)s placeholders to asyncpg $n form"""
+    args = []
+
+    def placeholder(match):
+        args.append(params[match.group(1)])
+        return f"${len(args)}"
+
+    return re.sub(r"%\((\w+)\)s", placeholder, query), args
+
+
+async def fetch(query, *args):
+    metrics.count("db_round_trips")
+    pool = await get_async_pool()
+    async with pool.acquire(timeout=POOL_TIMEOUT) as connection:
+        return await connection.fetch(query, *args)
+
+
+async def fetchrow(query, *args):
+    metrics.count("db_round_trips")
+    pool = await get_async_pool()
+    async with pool.acquire(timeout=POOL_TIMEOUT) as connection:
+        return await connection.fetchrow(query, *args)
+
+
+async def execute(query, *args):
+    metrics.count("db_round_trips")
+    pool = await get_async_pool()
+    async with pool.acquire(timeout=POOL_TIMEOUT) as connection:
+        return await connection.execute(query, *args)
+
+
+async def get_user_dividends(user_id):
+    return await fetch('SELECT * FROM "Dividend" WHERE "userId" = $1', user_id)
+
+
+async def get_user_transactions(user_id):
+    return await fetch('SELECT * FROM "Transaction" WHERE "userId" = $1', user_id)
+
+
+async def get_user_transactions_since(user_id, after=None):
+    """See db_connection.get_user_transactions_since"""
+    if after is None:
+        rows = await fetch(f'SELECT {_TAX_SELECT} FROM "Transaction" t WHERE t."userId" = $1 ORDER BY t.date, t.id', user_id)
+    else:
+        rows = await fetch(
+            f'SELECT {_TAX_SELECT} FROM "Transaction" t WHERE t."userId" = $1 AND (t.date, t.id) > ($2, $3) '
+            'ORDER BY t.date, t.id',
+            user_id, *after
+        )
+    return TransactionArray.from_rows(rows)
+
+
+async def get_user_transactions_with_rates(user_id, after=None, max_fallback_days=MAX_FALLBACK_DAYS):
+    """See db_connection.get_user_transactions_with_rates"""
+    params = {"user_id": user_id, "max_fallback_days": max_fallback_days}
+    if after is not None:
+        params["after_date"], params["after_id"] = after
+    query, args = _numbered(transactions_with_rates_query(after), params)
+    return TransactionArray.from_rows(await fetch(query, *args))
+
+
+async def get_fifo_snapshot_fingerprint(user_id, until, max_fallback_days=MAX_FALLBACK_DAYS):
+    """See db_connection.get_fifo_snapshot_fingerprint"""
+    query, args = _numbered(
+        FIFO_SNAPSHOT_FINGERPRINT_QUERY, fifo_snapshot_fingerprint_params(user_id, until, max_fallback_days)
+    )
+    row = await fetchrow(query, *args)
+    return int(row[0]), int(row[1]), row[2]
+
+
+async def get_fifo_snapshot(user_id):
+    return await fetchrow('SELECT * FROM "FifoSnapshot" WHERE "userId" = $1', user_id)
+
+
+async def save_fifo_snapshot(user_id, version, watermark, transaction_count, transaction_id_sum, rates_digest, state):
+    await execute(
+        '''
+        INSERT INTO "FifoSnapshot"
+            ("userId", version, "watermarkDate", "watermarkId", "transactionCount", "transactionIdSum",
+             "ratesDigest", state, "updatedAt")
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, now() AT TIME ZONE 'UTC')
+        ON CONFLICT ("userId") DO UPDATE SET
+            version = EXCLUDED.version,
+            "watermarkDate" = EXCLUDED."watermarkDate",
+            "watermarkId" = EXCLUDED."watermarkId",
+            "transactionCount" = EXCLUDED."transactionCount",
+            "transactionIdSum" = EXCLUDED."transactionIdSum",
+            "ratesDigest" = EXCLUDED."ratesDigest",
+            state = EXCLUDED.state,
+            "updatedAt" = EXCLUDED."updatedAt"
+        ''',
+        user_id, version, watermark[0], watermark[1], transaction_count, transaction_id_sum, rates_digest, state
+    )
+
+
+async def delete_fifo_snapshot(user_id):
+    await execute('DELETE FROM "FifoSnapshot" WHERE "userId" = $1', user_id)
+
+
+# Rate and inflation lookups use the same in-memory tables as the blocking
+# code; only loading them goes through the async pool.
+
+async def refresh_rates():
+    """Reload the process-wide exchange rate table"""
+    rows = await fetch(RATES_QUERY)
+    get_rate_table().load_arrays(*DolarRateTable.from_dated_rows(rows).to_arrays())
+    print(f"💱 Loaded {len(rows)} exchange rates")
+
+
+async def refresh_inflation():
+    """Reload the process-wide YiUfe series"""
+    rows = await fetch(f'SELECT yil, {", ".join(months)} FROM "YiUfe"')
+    get_inflation_series().load_arrays(*YiUfeSeries.from_rows(rows).to_arrays())
+    print(f"📊 Loaded inflation data for {len(rows)} years")
+
+
+async def get_dolar(tarih):
+    """USD/TRY rate valid on `tarih` (see get_dolar.get_dolar), or None"""
+    if not get_rate_table().loaded:
+        await refresh_rates()
+    rate = get_rate_table().lookup(tarih)
+    if rate is None:
+        print(f"⚠️  No exchange rate found for date: {tarih}")
+    return rate
+
+
+async def calculate_inflation(first_year, first_month, second_year, second_month):
+    """See inflation_calculator.calculate_inflation"""
+    if not get_inflation_series().loaded:
+        await refresh_inflation()
+    return get_inflation_series().inflation_rate(
+        month_index(first_year, first_month),
+        month_index(second_year, second_month)
+    )
+
+
+async def bulk_insert(connection, table, columns, rows, row_index, batch_size=None):
+    """
+    Async db_connection.bulk_insert: each batch is sent with COPY under its
+    own savepoint, and rows of a failed batch are retried one by one to
+    name the offending indices before the batch is rolled back. Must be
+    called inside a transaction; does not commit.
+    """
+    batch_size = max(1, batch_size or BULK_BATCH_SIZE)
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    placeholders = ", ".join(f"${position}" for position in range(1, len(columns) + 1))
+    single_query = f'INSERT INTO "{table}" ({column_list}) VALUES ({placeholders})'
+    report = {"inserted": 0, "failed_batches": []}
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        batch_index = list(row_index[start:start + batch_size])
+        try:
+            async with connection.transaction():
+                await connection.copy_records_to_table(table, records=batch, columns=columns)
+            report["inserted"] += len(batch)
+            continue
+        except asyncpg.PostgresError as err:
+            batch_error = str(err).strip()
+
+        offending = []
+        batch_savepoint = connection.transaction()
+        await batch_savepoint.start()
+        for index, row in zip(batch_index, batch):
+            try:
+                async with connection.transaction():
+                    await connection.execute(single_query, *row)
+            except asyncpg.PostgresError:
+                offending.append(index)
+        await batch_savepoint.rollback()
+
+        logger.error(f"{table} batch of rows {batch_index[0]}..{batch_index[-1]} failed, offending rows {offending}: {batch_error}")
+        report["failed_batches"].append({
+            "rows": batch_index,
+            "offending_rows": offending,
+            "error": batch_error
+        })
+
+    return report
+
+
+async def _insert(table, columns, rows, row_index, batch_size, connection):
+    if connection is not None:
+        return await bulk_insert(connection, table, columns, rows, row_index, batch_size)
+    pool = await get_async_pool()
+    async with pool.acquire(timeout=POOL_TIMEOUT) as connection:
+        async with connection.transaction():
+            return await bulk_insert(connection, table, columns, rows, row_index, batch_size)
+
+
+async def bulk_insert_transactions(transactions_df, user_id, batch_size=None, connection=None):
+    """Commits on its own pooled connection unless the caller passes `connection`"""
+    rows = _transaction_rows(transactions_df, user_id)
+    return await _insert("Transaction", TRANSACTION_COLUMNS, rows, transactions_df.index, batch_size, connection)
+
+
+async def bulk_insert_dividends(dividends_df, user_id, batch_size=None, connection=None):
+    """Commits on its own pooled connection unless the caller passes `connection`"""
+    rows = _dividend_rows(dividends_df, user_id)
+    return await _insert("Dividend", DIVIDEND_COLUMNS, rows, dividends_df.index, batch_size, connection)
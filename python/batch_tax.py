@@ -0,0 +1,257 @@
+"""
+Year-end tax run over many users.
+
+Computes the tax_calculator_db result of one tax year for every user with
+transactions (or for the given users) in a process pool and writes the
+results to the TaxResult table or to an NDJSON file, so they can be
+precomputed overnight instead of at request time.
+
+The exchange rate and inflation tables are loaded once here and handed to
+the workers when they start, so a worker only queries its users'
+transactions. Each user resumes from their FIFO snapshot, so a rerun only
+replays trades added since the last one.
+
+Usage:
+    python batch_tax.py 2025                                  # all users, into TaxResult
+    python batch_tax.py 2025 --users ID1,ID2 --output results.ndjson
+    python batch_tax.py 2025 --users-file ids.txt --workers 8 --full
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from logger import get_logger, set_console_stream
+
+# stdout may carry NDJSON results, so console logging goes to stderr
+set_console_stream(sys.stderr)
+
+from db_connection import get_user_ids_with_transactions, save_tax_results
+from get_dolar import get_rate_table
+from inflation_calculator import get_inflation_series
+import metrics
+from tax_calculator_db import tax_calculator_db
+
+logger = get_logger('batch_tax')
+
+BATCH_TAX_WORKERS = int(os.getenv('BATCH_TAX_WORKERS', '0')) or (os.cpu_count() or 1)
+# Results are written to TaxResult in groups of this many users
+RESULT_FLUSH_SIZE = int(os.getenv('BATCH_TAX_FLUSH_SIZE', '500'))
+PROGRESS_INTERVAL = float(os.getenv('BATCH_TAX_PROGRESS_SECONDS', '10'))
+
+
+def _init_worker(rate_arrays, inflation_arrays):
+    """Process pool initializer: install the tables loaded by the parent"""
+    get_rate_table().load_arrays(*rate_arrays)
+    get_inflation_series().load_arrays(*inflation_arrays)
+
+
+def _calculate_user(user_id, tax_year, incremental):
+    """Returns (user_id, result or None, error or None, seconds, metrics dict or None)"""
+    started = time.perf_counter()
+    # Collected here rather than per result, and summed over all users
+    with metrics.collect() as run:
+        try:
+            # The per-user report printed by tax_calculator_db is not needed here
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = tax_calculator_db(user_id, incremental, tax_year, join_rates=False)
+            error = None
+        except Exception as e:
+            result, error = None, str(e)
+    return user_id, result, error, time.perf_counter() - started, run and run.to_dict()
+
+
+def _calculate_all(user_ids, tax_year, incremental, workers, rate_arrays, inflation_arrays):
+    """Yields _calculate_user outcomes in completion order"""
+    if workers <= 1 or len(user_ids) <= 1:
+        # The tables are already loaded in this process
+        for user_id in user_ids:
+            yield _calculate_user(user_id, tax_year, incremental)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(rate_arrays, inflation_arrays)
+    ) as executor:
+        futures = [executor.submit(_calculate_user, user_id, tax_year, incremental) for user_id in user_ids]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+class _Progress:
+    """Counts finished users and logs throughput at most every PROGRESS_INTERVAL seconds"""
+
+    def __init__(self, tax_year, total):
+        self.tax_year = tax_year
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.user_seconds = 0.0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    def update(self, seconds, failed=False, skipped=False):
+        self.done += 1
+        self.failed += failed
+        self.skipped += skipped
+        self.user_seconds += seconds
+        now = time.perf_counter()
+        if now - self._last_report >= PROGRESS_INTERVAL:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        remaining = (self.total - self.done) / self.rate if self.rate else float("inf")
+        logger.info(
+            f"Tax year {self.tax_year}: {self.done}/{self.total} users "
+            f"({self.done / max(self.total, 1):.1%}), {self.rate:.1f} users/s, "
+            f"ETA {remaining:.0f}s, {self.failed} failed, {self.skipped} without data"
+        )
+
+
+class _ResultWriter:
+    """Writes results to TaxResult in batches, or as NDJSON lines to a file or stdout ("-")"""
+
+    def __init__(self, tax_year, output=None):
+        self.tax_year = tax_year
+        self.output = output
+        self._pending = []
+        if output is None:
+            self._file = None
+        elif output == "-":
+            self._file = sys.stdout
+        else:
+            self._file = open(output, "w", encoding="utf-8")
+
+    def _write_line(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def add(self, user_id, result):
+        if self._file is not None:
+            self._write_line({"userId": user_id, "taxYear": self.tax_year, "result": result})
+            return
+        self._pending.append((user_id, result))
+        if len(self._pending) >= RESULT_FLUSH_SIZE:
+            self.flush()
+
+    def add_error(self, user_id, error):
+        if self._file is not None:
+            self._write_line({"userId": user_id, "taxYear": self.tax_year, "error": error})
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+        elif self._pending:
+            save_tax_results(self.tax_year, self._pending)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        if self._file is not None and self._file is not sys.stdout:
+            self._file.close()
+
+
+def run_tax_year(tax_year, user_ids=None, workers=None, output=None, incremental=True):
+    """
+    Calculate `tax_year` for `user_ids` (default: every user with
+    transactions) and store the results; see _ResultWriter for `output`.
+
+    Returns a summary with counts, failures, elapsed time and throughput.
+    """
+    workers = BATCH_TAX_WORKERS if workers is None else max(1, int(workers))
+    if user_ids is None:
+        user_ids = get_user_ids_with_transactions()
+
+    # Loaded once here and copied into each worker at startup
+    rate_arrays = get_rate_table().to_arrays()
+    inflation_arrays = get_inflation_series().to_arrays()
+    logger.info(
+        f"Calculating tax year {tax_year} for {len(user_ids)} users with {workers} workers "
+        f"({len(rate_arrays[1])} exchange rates, {len(inflation_arrays[1]) // 12} inflation years shared)"
+    )
+
+    progress = _Progress(tax_year, len(user_ids))
+    writer = _ResultWriter(tax_year, output)
+    failures = []
+    with metrics.collect() as run:
+        try:
+            for user_id, result, error, seconds, user_metrics in _calculate_all(
+                user_ids, tax_year, incremental, workers, rate_arrays, inflation_arrays
+            ):
+                if user_metrics is not None:
+                    run.merge(user_metrics)
+                if error is not None:
+                    logger.error(f"Tax calculation failed for user {user_id}: {error}")
+                    failures.append({"userId": user_id, "error": error})
+                    writer.add_error(user_id, error)
+                elif result is not None:
+                    with metrics.stage("write_results"):
+                        writer.add(user_id, result)
+                progress.update(seconds, failed=error is not None, skipped=error is None and result is None)
+        finally:
+            with metrics.stage("write_results"):
+                writer.close()
+    progress.report()
+
+    summary = {
+        "taxYear": tax_year,
+        "users": len(user_ids),
+        "calculated": progress.done - progress.failed - progress.skipped,
+        "withoutData": progress.skipped,
+        "failed": failures,
+        "workers": workers,
+        "seconds": round(progress.elapsed, 3),
+        "usersPerSecond": round(progress.rate, 2),
+        "meanUserSeconds": round(progress.user_seconds / max(progress.done, 1), 4),
+        "output": output or "TaxResult",
+    }
+    if run is not None:
+        # Stage times are summed over users and workers
+        summary["metrics"] = metrics.report(run, f"Tax year {tax_year} batch", logger)
+    return summary
+
+
+def _read_user_ids(args):
+    if args.users:
+        return [user_id for user_id in args.users.split(",") if user_id]
+    if args.users_file:
+        with open(args.users_file, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute year-end tax results for many users")
+    parser.add_argument("tax_year", type=int)
+    parser.add_argument("--users", help="comma separated user ids (default: every user with transactions)")
+    parser.add_argument("--users-file", help="file with one user id per line")
+    parser.add_argument("--workers", type=int, help=f"worker processes (default: {BATCH_TAX_WORKERS})")
+    parser.add_argument("--output", help="NDJSON file, or - for stdout (default: the TaxResult table)")
+    parser.add_argument("--full", action="store_true", help="ignore FIFO snapshots and replay all transactions")
+    args = parser.parse_args()
+
+    summary = run_tax_year(
+        args.tax_year, _read_user_ids(args), args.workers, args.output, incremental=not args.full
+    )
+    logger.info(f"Batch summary: {json.dumps(summary)}")
+    if args.output != "-":
+        print(json.dumps(summary, indent=2))
+
+    if summary["failed"]:
+        sys.exit(1)
@@ -0,0 +1,132 @@
+"""
+Benchmark for FIFO lot matching: the deque based loop tax_calculator_db used
+before vs fifo_engine.match_fifo, on synthetic trades in chronological
+order, buys and sells interleaved as tax_calculator_db feeds them.
+
+Usage: python benchmark_fifo.py [--sizes 10000 100000 1000000] [--symbols N] [--seed S]
+"""
+
+import argparse
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+from fifo_engine import match_fifo
+from inflation_calculator import YiUfeSeries
+
+INFLATION_THRESHOLD = 10
+
+
+def make_inflation_series(first_year=2015, last_year=2025):
+    """Monthly index growing ~3% a month, enough to cross the threshold"""
+    rows = []
+    value = 250.0
+    for year in range(first_year, last_year + 1):
+        values = []
+        for _ in range(12):
+            value *= 1.03
+            values.append(value)
+        rows.append([year] + values)
+    return YiUfeSeries.from_rows(rows)
+
+
+def make_trades(count, symbol_count, rng):
+    """
+    Trades in date order with buys and sells of each symbol interleaved.
+    Sells are slightly fewer than buys; some still exceed the lots held,
+    and a tenth of the quantities are fractional (partial fills).
+    """
+    symbols = np.array([f"SYM{i}" for i in rng.integers(0, symbol_count, count)], dtype=object)
+    is_buy = rng.random(count) < 0.55
+    quantities = rng.integers(1, 200, count).astype(np.float64)
+    quantities[rng.random(count) < 0.1] += 0.5
+    prices = rng.uniform(5, 500, count)
+    months = np.sort(rng.integers(2016 * 12, 2025 * 12, count))
+    return symbols, is_buy, quantities, prices, months
+
+
+def reference_fifo(symbols, is_buy, quantities, prices, months, series, threshold=INFLATION_THRESHOLD):
+    """
+    The previous deque of per-lot dicts, one trade and lot at a time.
+    Returns the profit of every trade like match_fifo: NaN for buys and for
+    sells without an open lot.
+    """
+    fifo_queues = {}
+    sale_profit = np.full(len(symbols), np.nan)
+    for i in range(len(symbols)):
+        symbol = symbols[i]
+        if is_buy[i]:
+            if quantities[i] > 0:
+                fifo_queues.setdefault(symbol, deque()).append(
+                    {"quantity": float(quantities[i]), "price": float(prices[i]), "month": int(months[i])}
+                )
+            continue
+        if symbol not in fifo_queues or not fifo_queues[symbol]:
+            continue
+        total_profit = 0.0
+        remaining = float(quantities[i])
+        sell_price = float(prices[i])
+        while remaining > 0 and fifo_queues[symbol]:
+            buy = fifo_queues[symbol][0]
+            buy_price = buy["price"]
+            rate = series.inflation_rate(buy["month"], int(months[i]) - 1)
+            if rate and rate > threshold:
+                buy_price *= (1 + rate / 100)
+            if buy["quantity"] <= remaining:
+                total_profit += (sell_price - buy_price) * buy["quantity"]
+                remaining -= buy["quantity"]
+                fifo_queues[symbol].popleft()
+            else:
+                total_profit += (sell_price - buy_price) * remaining
+                buy["quantity"] -= remaining
+                remaining = 0
+        sale_profit[i] = total_profit
+    return sale_profit
+
+
+def array_fifo(symbols, is_buy, quantities, prices, months, series):
+    sale_profit, _ = match_fifo(symbols, is_buy, quantities, prices, months, series, INFLATION_THRESHOLD)
+    return sale_profit
+
+
+def same_results(left, right):
+    """Same sales matched, with the same profit of each"""
+    matched = ~np.isnan(left)
+    if not np.array_equal(matched, ~np.isnan(right)):
+        return False
+    return bool(np.allclose(left[matched], right[matched], rtol=1e-9, atol=1e-6))
+
+
+def run(size, symbol_count, seed, series):
+    rng = np.random.default_rng(seed)
+    trades = make_trades(size, symbol_count, rng)
+
+    started = time.perf_counter()
+    reference = reference_fifo(*trades, series)
+    reference_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectorized = array_fifo(*trades, series)
+    vectorized_time = time.perf_counter() - started
+
+    return {
+        "transactions": size,
+        "symbols": symbol_count,
+        "deque_seconds": reference_time,
+        "array_seconds": vectorized_time,
+        "speedup": reference_time / vectorized_time if vectorized_time else None,
+        "identical": same_results(reference, vectorized),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    series = make_inflation_series()
+    print(json.dumps([run(size, args.symbols, args.seed, series) for size in args.sizes], indent=2))
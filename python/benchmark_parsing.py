@@ -0,0 +1,147 @@
+"""
+Benchmark for statement row parsing: per-cell scalar functions vs the
+parse stage in extract_tables (column-wise for transaction tables of
+EXTRACT_COLUMNWISE_MIN_ROWS rows or more, per cell below that).
+
+Usage: python benchmark_parsing.py [--rows N] [--invalid-ratio R] [--repeat K] [--seed S]
+"""
+
+import argparse
+import json
+import random
+import time
+
+import pandas as pd
+
+from extract_tables import (
+    TRANSACTION_COLUMNS, DIVIDEND_COLUMNS,
+    clean_number, parse_date, parse_dividend_date,
+    parse_transaction_rows, parse_dividend_rows
+)
+from synthetic_statements import turkish_number
+
+SYMBOLS = ["AAPL", "TSLA", "NVDA", "MSFT", "THYAO", "ASELS", "KO", "SPY"]
+
+
+def make_transaction_rows(count, invalid_ratio, rng):
+    rows = []
+    for _ in range(count):
+        quantity = rng.randint(1, 500)
+        price = rng.uniform(1, 2000)
+        row = [
+            f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(20, 25)} "
+            f"{rng.randint(9, 17):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+            "Hisse", rng.choice(SYMBOLS), rng.choice(["Alış", "Satış"]), "Gerçekleşti",
+            rng.choice(["USD", "TRY"]),
+            str(quantity), turkish_number(quantity * price), str(quantity),
+            turkish_number(price), rng.choice(["-", turkish_number(price * 0.002)]),
+            turkish_number(quantity * price) + " TL",
+        ]
+        if rng.random() < invalid_ratio:
+            row[rng.choice([0, 6, 9])] = "n/a"
+        rows.append(row)
+    return rows
+
+
+def make_dividend_rows(count, invalid_ratio, rng):
+    rows = []
+    for _ in range(count):
+        gross = rng.uniform(0.1, 500)
+        row = [
+            f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(20, 25)}",
+            rng.choice(SYMBOLS), turkish_number(gross), turkish_number(gross * 0.15),
+            turkish_number(gross * 0.85),
+        ]
+        if rng.random() < invalid_ratio:
+            row[rng.choice([0, 2])] = "n/a"
+        rows.append(row)
+    return rows
+
+
+def scalar_transaction_rows(raw_rows):
+    """The per-cell conversion extract_tables used before the column-wise stage"""
+    cleaned = []
+    for row in raw_rows:
+        cleaned_row = [
+            parse_date(row[0]) if i == 0 else
+            clean_number(row[i]) if i in [6, 7, 8, 9, 10, 11] else
+            str(row[i]).strip()
+            for i in range(len(row))
+        ]
+        if cleaned_row[0]:
+            cleaned.append(cleaned_row)
+    return pd.DataFrame(cleaned, columns=TRANSACTION_COLUMNS)
+
+
+def scalar_dividend_rows(raw_rows):
+    cleaned = []
+    for row in raw_rows:
+        cleaned_row = [
+            parse_dividend_date(row[0]) if i == 0 else
+            clean_number(row[i]) if i in [2, 3, 4] else
+            str(row[i]).strip()
+            for i in range(len(row))
+        ]
+        if cleaned_row[0]:
+            cleaned.append(cleaned_row)
+    return pd.DataFrame(cleaned, columns=DIVIDEND_COLUMNS)
+
+
+def timed(func, *args, repeat=1):
+    """Run `func` `repeat` times; returns the last result and the best time"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def same_frames(left, right):
+    try:
+        pd.testing.assert_frame_equal(left, right, check_dtype=False)
+        return True
+    except AssertionError as e:
+        print(f"Mismatch: {e}")
+        return False
+
+
+def run(rows, invalid_ratio, seed, repeat=3):
+    rng = random.Random(seed)
+    transactions = make_transaction_rows(rows, invalid_ratio, rng)
+    dividends = make_dividend_rows(max(1, rows // 10), invalid_ratio, rng)
+
+    scalar_tx, scalar_tx_time = timed(scalar_transaction_rows, transactions, repeat=repeat)
+    (vector_tx, _), vector_tx_time = timed(parse_transaction_rows, transactions, repeat=repeat)
+    scalar_div, scalar_div_time = timed(scalar_dividend_rows, dividends, repeat=repeat)
+    (vector_div, _), vector_div_time = timed(parse_dividend_rows, dividends, repeat=repeat)
+
+    return {
+        "rows": rows,
+        "invalid_ratio": invalid_ratio,
+        "repeat": repeat,
+        "transactions": {
+            "scalar_seconds": scalar_tx_time,
+            "vectorized_seconds": vector_tx_time,
+            "speedup": scalar_tx_time / vector_tx_time if vector_tx_time else None,
+            "identical": same_frames(scalar_tx, vector_tx),
+        },
+        "dividends": {
+            "rows": len(dividends),
+            "scalar_seconds": scalar_div_time,
+            "vectorized_seconds": vector_div_time,
+            "speedup": scalar_div_time / vector_div_time if vector_div_time else None,
+            "identical": same_frames(scalar_div, vector_div),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--invalid-ratio", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.rows, args.invalid_ratio, args.seed, args.repeat), indent=2))
@@ -0,0 +1,128 @@
+"""
+Benchmark for converting a user's transactions to TRY: one rate query per
+USD transaction on the DD.MM.YYYY text column (the old lib/exchange.ts
+path) vs a single query joining each transaction to its rate through the
+indexed "rateDate" column.
+
+Prints timings and the EXPLAIN (ANALYZE, BUFFERS) plans of both queries,
+and checks the joined query against the in-process rate table
+(get_dolar.DolarRateTable), which applies the same fallback rule: every
+joined rate must equal the table's, and the plan should use the
+"Dolar_rateDate_idx" index. Needs a database with the rateDate migration
+applied; --output also writes the results to a file.
+
+Usage: python benchmark_rate_join.py <user_id> [--repeat K] [--output FILE]
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+
+import psycopg2
+
+from db_connection import pooled_connection, transactions_with_rates_query
+from get_dolar import MAX_FALLBACK_DAYS, get_rate_table
+
+RATE_INDEX = "Dolar_rateDate_idx"
+
+PER_ROW_QUERY = 'SELECT "dovizAlis" FROM "Dolar" WHERE "gecerliOlduguTarih" = %s LIMIT 1'
+
+
+def per_row(cursor, user_id):
+    cursor.execute('SELECT id, date, currency FROM "Transaction" WHERE "userId" = %s ORDER BY date, id', (user_id,))
+    rates = {}
+    for transaction_id, date, currency in cursor.fetchall():
+        if currency == 'USD':
+            cursor.execute(PER_ROW_QUERY, (date.strftime("%d.%m.%Y"),))
+            row = cursor.fetchone()
+            rates[transaction_id] = row[0] if row else None
+    return rates
+
+
+def joined(cursor, user_id):
+    cursor.execute(transactions_with_rates_query(), {"user_id": user_id, "max_fallback_days": MAX_FALLBACK_DAYS})
+    return {row[0]: row[-1] for row in cursor.fetchall()}
+
+
+def rate_mismatches(cursor, user_id, joined_rates):
+    """Transactions whose joined rate differs from the rate table's lookup of their day"""
+    cursor.execute('SELECT id, date, currency FROM "Transaction" WHERE "userId" = %s', (user_id,))
+    table = get_rate_table()
+    mismatches = []
+    for transaction_id, date, currency in cursor.fetchall():
+        expected = table.lookup(date) if currency == 'USD' else None
+        actual = joined_rates.get(transaction_id)
+        actual = None if actual is None else float(actual)
+        if (expected is None) != (actual is None) or (expected is not None and not math.isclose(expected, actual)):
+            mismatches.append({"id": transaction_id, "date": date, "joined": actual, "rate_table": expected})
+    return mismatches
+
+
+def explain(cursor, query, params):
+    cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def timed(func, cursor, user_id, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(cursor, user_id)
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def run(user_id, repeat):
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            per_row_rates, per_row_time = timed(per_row, cursor, user_id, repeat)
+            joined_rates, joined_time = timed(joined, cursor, user_id, repeat)
+
+            cursor.execute('SELECT date FROM "Transaction" WHERE "userId" = %s AND currency = %s LIMIT 1', (user_id, 'USD'))
+            sample = cursor.fetchone()
+            per_row_plan = explain(cursor, PER_ROW_QUERY, (sample[0].strftime("%d.%m.%Y"),)) if sample else []
+            joined_plan = explain(
+                cursor, transactions_with_rates_query(), {"user_id": user_id, "max_fallback_days": MAX_FALLBACK_DAYS}
+            )
+            mismatches = rate_mismatches(cursor, user_id, joined_rates)
+        connection.rollback()
+
+    # The joined path also falls back to the last earlier rate, so it can
+    # only fill in rates the exact-match path missed
+    filled = sum(1 for key, rate in per_row_rates.items() if rate is None and joined_rates.get(key) is not None)
+    return {
+        "usd_transactions": len(per_row_rates),
+        "per_row_seconds": per_row_time,
+        "per_row_queries": len(per_row_rates) + 1,
+        "joined_seconds": joined_time,
+        "joined_queries": 1,
+        "speedup": per_row_time / joined_time if joined_time else None,
+        "rates_filled_by_fallback": filled,
+        "rate_table_mismatches": len(mismatches),
+        "rate_table_mismatch_examples": mismatches[:10],
+        "joined_uses_rate_index": any(RATE_INDEX in line for line in joined_plan),
+        "explain_per_row_lookup": per_row_plan,
+        "explain_joined": joined_plan,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("user_id")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        results = run(args.user_id, args.repeat)
+    except psycopg2.OperationalError as e:
+        sys.exit(f"❌ Could not run against the database: {str(e).strip()}")
+    report = json.dumps(results, indent=2, default=str)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    if results["rate_table_mismatches"]:
+        sys.exit(1)
@@ -0,0 +1,403 @@
+"""
+End-to-end benchmark suite on synthetic statements (synthetic_statements.py).
+
+Cases, each timed over --repeat runs:
+    extract/<N>p       extract_pdf_rows on an N-page statement (statement cache off),
+                       checked against the rows written into the PDF
+    parse/<N>          parse_transaction_rows and parse_dividend_rows on N raw rows
+    tax/<N>            rate lookup and FIFO replay of an N-transaction history
+                       (apply_transactions + tax_results) on in-memory rate and YiUfe tables
+    history_load/<N>   cold load of an N-transaction history snapshot (history_snapshot.py),
+                       evicted from the page cache before each run, reading every column
+
+With --database, against the PostgreSQL database configured in .env, as a
+throwaway user that is deleted afterwards:
+    save/<N>p          extract_tables_and_save end to end
+    bulk_insert/<N>    bulk_insert_transactions, rolled back
+    tax_db/<N>/full    tax_calculator_db replaying the whole history
+    tax_db/<N>/resume  tax_calculator_db resuming from its FIFO snapshot
+    history_db/<N>     the same history streamed from the database with rates joined
+    history_snapshot/<N>  the same history from its snapshot, fingerprint check included
+
+Every case records the best and median time and the metrics (metrics.py)
+of the best run. Results are printed or written as JSON with --output;
+--compare BASELINE.json marks cases more than --tolerance slower than the
+baseline and exits with status 1 if there are any.
+
+Usage: python benchmark_suite.py [--pages 1 10 100] [--transactions 10000 100000] [--symbols N]
+                                 [--repeat K] [--workers N] [--database]
+                                 [--output FILE] [--compare FILE] [--tolerance T]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from logger import set_console_stream
+
+# stdout may carry the JSON results, so console logging goes to stderr
+set_console_stream(sys.stderr)
+
+import metrics
+from db_connection import bulk_insert_transactions, insert_transactions, pooled_connection, stream_user_transaction_chunks
+from extract_tables import extract_pdf_rows, extract_tables_and_save, parse_transaction_rows, parse_dividend_rows
+from fifo_snapshot import FifoState
+from get_dolar import MAX_FALLBACK_DAYS, get_rate_table, invalidate_rates, usd_rates
+from history_snapshot import DIVIDEND_DTYPE, build_history_snapshot, load_history_snapshot, write_history_snapshot
+from inflation_calculator import get_inflation_series, invalidate_inflation
+from statement_cache import get_statement_cache
+from synthetic_statements import (
+    make_statement, make_history, make_dividends, history_transactions, make_rate_arrays, make_inflation_arrays
+)
+from tax_calculator_db import apply_transactions, tax_results, tax_calculator_db
+from transaction_array import TransactionArray
+
+
+def measure(function, repeat, setup=None):
+    """
+    Run `function` `repeat` times, each after `setup`. Returns the value of
+    the last run and {"seconds": best, "median", "runs", "metrics" of the best run}.
+    """
+    runs = []
+    best_metrics = None
+    value = None
+    for _ in range(max(1, repeat)):
+        if setup is not None:
+            setup()
+        with metrics.collect() as run:
+            started = time.perf_counter()
+            value = function()
+            seconds = time.perf_counter() - started
+        if not runs or seconds < min(runs):
+            best_metrics = run.to_dict() if run is not None else None
+        runs.append(seconds)
+    return value, {
+        "seconds": round(min(runs), 4),
+        "median": round(statistics.median(runs), 4),
+        "runs": [round(seconds, 4) for seconds in runs],
+        "metrics": best_metrics,
+    }
+
+
+@contextlib.contextmanager
+def _quiet():
+    # The calculators print per-run reports
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+@contextlib.contextmanager
+def _statement_cache_disabled():
+    cache = get_statement_cache()
+    max_bytes, cache.max_bytes = cache.max_bytes, 0
+    try:
+        yield
+    finally:
+        cache.max_bytes = max_bytes
+
+
+def bench_extract(pages, directory, repeat, workers, symbols):
+    path = os.path.join(directory, f"statement-{pages}p.pdf")
+    history, dividends = make_statement(path, pages, symbol_count=symbols)
+    with _statement_cache_disabled():
+        (df, _, df_dividend, _), case = measure(lambda: extract_pdf_rows(path, workers=workers), repeat)
+    case.update({
+        "pages": pages,
+        "transactions": len(df),
+        "dividends": len(df_dividend),
+        "identical": (df.equals(parse_transaction_rows(history)[0])
+                      and df_dividend.equals(parse_dividend_rows(dividends)[0])),
+    })
+    return case
+
+
+def bench_parse(count, repeat, symbols):
+    history = make_history(count, symbols)
+    dividends = make_dividends(history, max(1, count // 10))
+
+    def parse():
+        return parse_transaction_rows(history), parse_dividend_rows(dividends)
+
+    ((df, _), (df_dividend, _)), case = measure(parse, repeat)
+    case.update({"transactions": len(df), "dividends": len(df_dividend)})
+    return case
+
+
+def bench_tax(count, repeat, symbols):
+    transactions = history_transactions(make_history(count, symbols))
+    get_rate_table().load_arrays(*make_rate_arrays())
+    get_inflation_series().load_arrays(*make_inflation_arrays())
+
+    def calculate():
+        state = FifoState()
+        with _quiet():
+            with metrics.stage("rate_lookup"):
+                rates = usd_rates(transactions)
+            apply_transactions(state, transactions, rates)
+            return tax_results(state)
+
+    try:
+        results, case = measure(calculate, repeat)
+    finally:
+        # Later cases read the real tables from the database
+        invalidate_rates()
+        invalidate_inflation()
+    case.update({"transactions": count, "symbols": symbols, "totalProfitLoss": results["total_profit_loss"]})
+    return case
+
+
+def _evict_page_cache(directory):
+    """Write back and drop the files under `directory` from the OS page cache, so the next read is cold"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for root, _, names in os.walk(directory):
+        for name in names:
+            fd = os.open(os.path.join(root, name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def _read_columns(transactions):
+    """Read every column once, as a replay would; returns a checksum"""
+    rows = transactions.rows
+    total = float(rows["id"].sum()) + float(rows["date"].astype(np.int64).sum()) + float(rows["symbol"].sum())
+    for field in ("operation", "quantity", "price", "fee", "rate"):
+        total += float(np.nansum(rows[field]))
+    return total
+
+
+def bench_history_load(count, directory, repeat, symbols):
+    transactions = history_transactions(make_history(count, symbols))
+    get_rate_table().load_arrays(*make_rate_arrays())
+    try:
+        transactions.rows["rate"] = usd_rates(transactions)
+    finally:
+        invalidate_rates()
+    path = write_history_snapshot(
+        "benchmark", transactions, np.empty(0, dtype=DIVIDEND_DTYPE), [], (), directory=directory
+    )
+
+    checksum, case = measure(
+        lambda: _read_columns(load_history_snapshot("benchmark", directory, validate=False).transactions),
+        repeat, setup=lambda: _evict_page_cache(path)
+    )
+    case.update({
+        "transactions": count,
+        "snapshotKb": round(sum(entry.stat().st_size for entry in os.scandir(path)) / 1024, 1),
+        "identical": checksum == _read_columns(transactions),
+    })
+    return case
+
+
+# Database cases
+
+@contextlib.contextmanager
+def _benchmark_user():
+    """A user created for the run; it and everything it owns is deleted afterwards"""
+    user_id = str(uuid.uuid4())
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO "User" (id, email, password, name, "updatedAt") VALUES (%s, %s, %s, %s, now())',
+                (user_id, f"benchmark-{user_id}@example.invalid", "-", "Benchmark")
+            )
+        connection.commit()
+    try:
+        yield user_id
+    finally:
+        _clear_user(user_id)
+        with pooled_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM "User" WHERE id = %s', (user_id,))
+            connection.commit()
+
+
+def _clear_user(user_id):
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            for table in ("Transaction", "Dividend", "FifoSnapshot", "TaxResult"):
+                cursor.execute(f'DELETE FROM "{table}" WHERE "userId" = %s', (user_id,))
+        connection.commit()
+
+
+def bench_save(pages, directory, repeat, workers, symbols, user_id):
+    path = os.path.join(directory, f"statement-{pages}p.pdf")
+    if not os.path.exists(path):
+        make_statement(path, pages, symbol_count=symbols)
+    with _statement_cache_disabled():
+        result, case = measure(
+            lambda: extract_tables_and_save(path, user_id, workers=workers, streaming=False),
+            repeat, setup=lambda: _clear_user(user_id)
+        )
+    # extract_tables_and_save collects its own metrics
+    case["metrics"] = result.get("metrics")
+    case.update({"pages": pages, "success": result["success"]})
+    return case
+
+
+def bench_bulk_insert(count, repeat, symbols, user_id):
+    df, _ = parse_transaction_rows(make_history(count, symbols))
+
+    def insert():
+        with pooled_connection() as connection:
+            try:
+                return bulk_insert_transactions(df, user_id, connection=connection)
+            finally:
+                connection.rollback()
+
+    report, case = measure(insert, repeat)
+    case.update({"transactions": report["inserted"], "failedBatches": len(report["failed_batches"])})
+    return case
+
+
+def bench_tax_db(count, repeat, symbols, user_id):
+    _clear_user(user_id)
+    df, _ = parse_transaction_rows(make_history(count, symbols))
+    if not insert_transactions(df, user_id):
+        raise RuntimeError(f"Could not insert {count} benchmark transactions")
+
+    with _quiet():
+        _, full = measure(lambda: tax_calculator_db(user_id, incremental=False), repeat)
+        _, resume = measure(lambda: tax_calculator_db(user_id, incremental=True), repeat)
+    for case in (full, resume):
+        case.update({"transactions": count, "symbols": symbols})
+    return full, resume
+
+
+def bench_history_db(count, directory, repeat, symbols, user_id):
+    _clear_user(user_id)
+    df, _ = parse_transaction_rows(make_history(count, symbols))
+    if not insert_transactions(df, user_id):
+        raise RuntimeError(f"Could not insert {count} benchmark transactions")
+
+    def from_database():
+        return _read_columns(TransactionArray.concatenate(
+            stream_user_transaction_chunks(user_id, with_rates=True, max_fallback_days=MAX_FALLBACK_DAYS)
+        ))
+
+    checksum, database = measure(from_database, repeat)
+    build_history_snapshot(user_id, directory)
+    path = os.path.join(directory, user_id)
+    snapshot_checksum, snapshot = measure(
+        lambda: _read_columns(load_history_snapshot(user_id, directory).transactions),
+        repeat, setup=lambda: _evict_page_cache(path)
+    )
+    snapshot["identical"] = snapshot_checksum == checksum
+    for case in (database, snapshot):
+        case.update({"transactions": count, "symbols": symbols})
+    return database, snapshot
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(pages, transactions, symbols=50, repeat=3, workers=1, database=False, pdf_dir=None):
+    results = {
+        "createdAt": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"repeat": repeat, "workers": workers, "symbols": symbols},
+        "cases": {},
+    }
+    cases = results["cases"]
+
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = pdf_dir or temporary
+        os.makedirs(directory, exist_ok=True)
+        for count in pages:
+            cases[f"extract/{count}p"] = bench_extract(count, directory, repeat, workers, symbols)
+        for count in transactions:
+            cases[f"parse/{count}"] = bench_parse(count, repeat, symbols)
+            cases[f"tax/{count}"] = bench_tax(count, repeat, symbols)
+            cases[f"history_load/{count}"] = bench_history_load(count, directory, repeat, symbols)
+
+        if database:
+            with _benchmark_user() as user_id:
+                for count in pages:
+                    cases[f"save/{count}p"] = bench_save(count, directory, repeat, workers, symbols, user_id)
+                for count in transactions:
+                    cases[f"bulk_insert/{count}"] = bench_bulk_insert(count, repeat, symbols, user_id)
+                    cases[f"tax_db/{count}/full"], cases[f"tax_db/{count}/resume"] = bench_tax_db(
+                        count, repeat, symbols, user_id
+                    )
+                    cases[f"history_db/{count}"], cases[f"history_snapshot/{count}"] = bench_history_db(
+                        count, directory, repeat, symbols, user_id
+                    )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Annotate cases with their baseline time; returns the names of regressed cases"""
+    regressions = []
+    for name, case in results["cases"].items():
+        before = baseline.get("cases", {}).get(name)
+        if not before or not before.get("seconds"):
+            continue
+        case["baselineSeconds"] = before["seconds"]
+        case["ratio"] = round(case["seconds"] / before["seconds"], 3)
+        if case["ratio"] > 1 + tolerance:
+            regressions.append(name)
+    results["regressions"] = regressions
+    return regressions
+
+
+def print_summary(results, stream=sys.stderr):
+    for name, case in results["cases"].items():
+        line = f"{name:<26} {case['seconds']:>9.4f}s  median {case['median']:.4f}s"
+        if "ratio" in case:
+            line += f"  x{case['ratio']:.2f} vs {case['baselineSeconds']:.4f}s"
+        print(line, file=stream)
+    for name in results.get("regressions", []):
+        print(f"REGRESSION: {name}", file=stream)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="*", default=[1, 10, 100])
+    parser.add_argument("--transactions", type=int, nargs="*", default=[10000, 100000])
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1, help="extraction worker processes")
+    parser.add_argument("--database", action="store_true", help="also run the database cases")
+    parser.add_argument("--pdf-dir", help="keep the generated statements in this directory")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a case counts as regressed")
+    args = parser.parse_args()
+
+    results = run(args.pages, args.transactions, args.symbols, args.repeat, args.workers, args.database, args.pdf_dir)
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    sys.exit(1 if regressions else 0)
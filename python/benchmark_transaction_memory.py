@@ -0,0 +1,132 @@
+"""
+Memory benchmark for the transactions held by the tax calculation: psycopg2
+DictRows of `SELECT t.*` with the joined rate (what the calculation used to
+fetch) vs a TransactionArray filled from the TAX_COLUMNS projection.
+
+No database is needed: rows are built the way the driver builds them, with
+a fresh object for every value. Memory is measured with tracemalloc and
+reported per million transactions.
+
+Usage: python benchmark_transaction_memory.py [--transactions N] [--symbols N] [--seed S]
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import psycopg2.extras
+
+from transaction_array import TAX_COLUMNS, TransactionArray
+from synthetic_statements import symbol_names
+
+# Every column of "Transaction" in table order, plus the joined rate
+ALL_COLUMNS = [
+    "id", "date", "transactionType", "symbol", "operationType", "status", "currency",
+    "orderQuantity", "orderAmount", "executedQuantity", "averagePrice", "transactionFee",
+    "transactionAmount", "userId", "createdAt", "updatedAt", "usdRate",
+]
+
+
+class _DictCursor:
+    """What DictRow needs from a cursor"""
+
+    def __init__(self, columns):
+        self.description = columns
+        self.index = OrderedDict((column, i) for i, column in enumerate(columns))
+
+
+def _fresh(text):
+    # The driver decodes every value into a new object
+    return "".join(list(text))
+
+
+def make_rows(count, symbol_count, seed):
+    """Full-width rows of one user, in date order"""
+    rng = random.Random(seed)
+    symbols = symbol_names(symbol_count)
+    user_id = str(uuid.uuid4())
+    start = datetime(2019, 1, 1)
+    created = datetime(2025, 1, 1)
+    rows = []
+    for i in range(1, count + 1):
+        quantity = float(rng.randint(1, 200))
+        price = rng.uniform(5, 500)
+        rows.append([
+            i, start + timedelta(seconds=i * 60), _fresh("Hisse"), _fresh(rng.choice(symbols)),
+            _fresh(rng.choice(("Alış", "Satış"))), _fresh("Gerçekleşti"), _fresh("USD"),
+            quantity, quantity * price, quantity, price, price * 0.002, quantity * price,
+            _fresh(user_id), created + timedelta(microseconds=i), created + timedelta(microseconds=i),
+            rng.uniform(5, 40),
+        ])
+    return rows
+
+
+def measure(build):
+    """(result, bytes still allocated by it, peak bytes while building, seconds)"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, seconds
+
+
+def run(count, symbol_count, seed):
+    raw = make_rows(count, symbol_count, seed)
+
+    def dict_rows():
+        cursor = _DictCursor(ALL_COLUMNS)
+        rows = []
+        for values in raw:
+            row = psycopg2.extras.DictRow(cursor)
+            row[:] = [_fresh(value) if isinstance(value, str) else
+                      value + 0.0 if isinstance(value, float) else
+                      value + timedelta(0) if isinstance(value, datetime) else value
+                      for value in values]
+            rows.append(row)
+        return rows
+
+    projection = [ALL_COLUMNS.index(column) for column in TAX_COLUMNS + ["usdRate"]]
+
+    def compact():
+        # The driver's tuples for the projected query only live while the array is filled
+        return TransactionArray.from_rows([tuple(values[i] for i in projection) for values in raw])
+
+    rows, dict_bytes, dict_peak, dict_seconds = measure(dict_rows)
+    del rows
+    array, array_bytes, array_peak, array_seconds = measure(compact)
+
+    per_million = 1_000_000 / count
+    return {
+        "transactions": count,
+        "symbols": symbol_count,
+        "dictRows": {
+            "mbPerMillion": round(dict_bytes * per_million / 2**20, 1),
+            "bytesPerRow": round(dict_bytes / count, 1),
+            "buildSeconds": round(dict_seconds, 3),
+        },
+        "transactionArray": {
+            "mbPerMillion": round(array_bytes * per_million / 2**20, 1),
+            "bytesPerRow": round(array_bytes / count, 1),
+            "peakMbPerMillionWhileFilling": round(array_peak * per_million / 2**20, 1),
+            "buildSeconds": round(array_seconds, 3),
+            "arrayBytes": array.nbytes,
+        },
+        "reduction": round(dict_bytes / array_bytes, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.transactions, args.symbols, args.seed), indent=2))
@@ -1,11 +1,19 @@
 import mysql.connector
 import psycopg2  # Add PostgreSQL connector
 import psycopg2.extras  # Add PostgreSQL extras for DictCursor
+import psycopg2.extensions
+import pandas as pd
+from contextlib import contextmanager
 from datetime import datetime
 import locale
 import os
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
 from logger import get_logger
+import metrics
+from transaction_array import TAX_COLUMNS, TransactionArray
 
 # Initialize logger
 logger = get_logger('db_connection')
@@ -31,28 +39,24 @@ except locale.Error:
             locale.setlocale(locale.LC_ALL, '')
 
 
+def _connection_params():
+    """PostgreSQL connection settings from the environment"""
+    return {
+        'host': os.getenv('PG_HOST', '127.0.0.1'),
+        'user': os.getenv('PG_USER', 'postgres'),
+        'password': os.getenv('PG_PASSWORD', ''),
+        'database': os.getenv('PG_DATABASE', 'midas_tax'),
+        'port': int(os.getenv('PG_PORT', '5432')),
+    }
+
 def get_db_connection():
+    """Open a dedicated connection. Prefer pooled_connection() for regular queries."""
     try:
-        # Load environment variables
-        load_dotenv()
-        
-        # Get PostgreSQL environment variables
-        host = os.getenv('PG_HOST', '127.0.0.1')
-        user = os.getenv('PG_USER', 'postgres')
-        password = os.getenv('PG_PASSWORD', '')
-        database = os.getenv('PG_DATABASE', 'midas_tax')
-        port = int(os.getenv('PG_PORT', '5432'))
-        
-        logger.debug(f"Connecting to PostgreSQL database: {database} on {host}:{port}")
+        params = _connection_params()
+        logger.debug(f"Connecting to PostgreSQL database: {params['database']} on {params['host']}:{params['port']}")
         
         # Create PostgreSQL connection
-        connection = psycopg2.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database,
-            port=port
-        )
+        connection = psycopg2.connect(**params)
         
         logger.info("PostgreSQL database connection established")
         return connection
@@ -87,248 +91,807 @@ def get_db_connection():
         logger.error(f"General database connection error: {err}", exc_info=True)
         return None
 
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections shared by the whole process.
+
+    Keeps between `minconn` and `maxconn` connections open. Checkouts block
+    until a connection is free (up to `timeout` seconds), and connections that
+    sat idle longer than `health_check_interval` are pinged before being handed
+    out so a dropped server connection is replaced instead of failing the query.
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=30.0, health_check_interval=30.0, connect_kwargs=None):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: min={minconn}, max={maxconn}")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._connect_kwargs = connect_kwargs or _connection_params()
+        self._idle = []  # (connection, returned_at)
+        self._in_use = set()
+        # Slots taken by checkouts connecting or health-checking outside the lock
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {
+            "connects": 0,
+            "checkouts": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._count_connect()
+
+    def _connect(self):
+        return psycopg2.connect(**self._connect_kwargs)
+
+    def _count_connect(self):
+        self._stats["connects"] += 1
+        logger.debug(f"Pool opened connection #{self._stats['connects']}")
+
+    def _is_healthy(self, connection, idle_for):
+        if connection.closed:
+            return False
+        if idle_for < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def _discard(self, connection):
+        self._stats["discarded"] += 1
+        self._close(connection)
+
+    def _reserve(self, deadline, timeout):
+        """
+        Take a slot under the lock: an idle (connection, returned_at) to
+        check, or (None, None) for a new connection to open
+        """
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("Connection pool is closed")
+                if self._idle:
+                    self._pending += 1
+                    return self._idle.pop()
+                if len(self._in_use) + self._pending < self.maxconn:
+                    self._pending += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection available after {timeout:.1f}s")
+                self._cond.wait(remaining)
+
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to `timeout` seconds for one to free up"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            connection, returned_at = self._reserve(deadline, timeout)
+            # Connecting and the health check run outside the lock, so a slow
+            # connect or a dead socket only holds up this checkout
+            try:
+                if connection is None:
+                    connection = self._connect()
+                    connected, healthy = True, True
+                else:
+                    connected, healthy = False, self._is_healthy(connection, time.monotonic() - returned_at)
+            except BaseException:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify()
+                raise
+            if not healthy:
+                logger.warning("Discarding unhealthy pooled connection")
+                self._close(connection)
+
+            with self._cond:
+                self._pending -= 1
+                if not healthy:
+                    self._stats["health_check_failures"] += 1
+                    self._stats["discarded"] += 1
+                    self._cond.notify()
+                    continue
+                if connected:
+                    self._count_connect()
+                if self._closed:
+                    self._discard(connection)
+                    raise psycopg2.InterfaceError("Connection pool is closed")
+                waited = time.monotonic() - started
+                self._in_use.add(connection)
+                self._stats["checkouts"] += 1
+                self._stats["wait_time_total"] += waited
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+                return connection
+
+    def putconn(self, connection, discard=False):
+        """Return a connection to the pool, resetting any open transaction"""
+        if not discard and not connection.closed:
+            status = connection.info.transaction_status
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    connection.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+        with self._cond:
+            self._in_use.discard(connection)
+            if discard or connection.closed or self._closed or len(self._idle) >= self.maxconn:
+                self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Check out a connection for the duration of a `with` block"""
+        connection = self.getconn(timeout)
+        broken = False
+        try:
+            yield connection
+        except psycopg2.OperationalError:
+            broken = True
+            raise
+        finally:
+            self.putconn(connection, discard=broken)
+
+    def stats(self):
+        """Snapshot of pool counters plus current sizes"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = len(self._in_use)
+            stats["wait_time_avg"] = stats["wait_time_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+            return stats
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for connection, _ in self._idle:
+                self._discard(connection)
+            self._idle.clear()
+            self._cond.notify_all()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Pools inherited from the parent by a forked child (batch_tax and extract
+# workers). Their connections share sockets with the parent's, and closing
+# them - which the garbage collector would do once nothing references them -
+# sends a terminate message that ends the parent's sessions. They are kept
+# here, never used and never closed; pool processes leave with os._exit,
+# which skips the cleanup as well.
+_inherited_pools = []
+
+def _retire_inherited_pool():
+    global _pool
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+    _pool = None
+
+def _after_fork_in_child():
+    global _pool_lock
+    _retire_inherited_pool()
+    # Another thread of the parent may have held the lock at fork time
+    _pool_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A forked child must not reuse the parent's sockets
+        if _pool is not None and _pool_pid != os.getpid():
+            _retire_inherited_pool()
+        if _pool is None:
+            _pool = ConnectionPool(
+                minconn=int(os.getenv('PG_POOL_MIN', '1')),
+                maxconn=int(os.getenv('PG_POOL_MAX', '10')),
+                timeout=float(os.getenv('PG_POOL_TIMEOUT', '30')),
+                health_check_interval=float(os.getenv('PG_POOL_HEALTH_CHECK_INTERVAL', '30')),
+            )
+            _pool_pid = os.getpid()
+            logger.info(f"Connection pool created (min={_pool.minconn}, max={_pool.maxconn})")
+        return _pool
+
+@contextmanager
+def pooled_connection(timeout=None):
+    """Borrow a connection from the process-wide pool"""
+    with get_pool().connection(timeout) as connection:
+        yield connection
+
+def get_pool_stats():
+    return get_pool().stats()
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+
 def safe_float(value):
     try:
         if value is None or (isinstance(value, str) and value.strip() == ''):
             return 0.0
         return float(value)
     except (ValueError, TypeError) as e:
-        logger.warning(f"Error converting value '{value}' to float: {str(e)}")
+        logger.warning("Error converting value '%s' to float: %s", value, e)
         return 0.0
 
-def insert_transactions(transactions_df, user_id):
-    connection = None
-    success = True
-    
-    logger.info(f"Inserting {len(transactions_df)} transactions for user {user_id}")
-    
-    try:
-        connection = get_db_connection()
-        if not connection:
-            logger.error("Failed to establish database connection")
-            return False
-        
-        cursor = connection.cursor()
-        
-        # Add diagnostic code to check tables
-        try:
-            logger.info("Checking available tables in the database...")
-            # Modify for PostgreSQL syntax
-            cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'")
-            tables = cursor.fetchall()
-            logger.info(f"Available tables: {[t[0] for t in tables]}")
-            
-        except Exception as e:
-            logger.error(f"Error checking tables: {str(e)}", exc_info=True)
-        
-        # Define the SQL query
-        insert_query = """
-        INSERT INTO "Transaction" (
-            date, "transactionType", symbol, "operationType", 
-            status, currency, "orderQuantity", "orderAmount", 
-            "executedQuantity", "averagePrice", "transactionFee", "transactionAmount",
-            "userId", "createdAt", "updatedAt"
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        logger.debug("SQL query prepared")
+BULK_BATCH_SIZE = int(os.getenv('BULK_INSERT_BATCH_SIZE', '1000'))
+
+TRANSACTION_COLUMNS = [
+    "date", "transactionType", "symbol", "operationType",
+    "status", "currency", "orderQuantity", "orderAmount",
+    "executedQuantity", "averagePrice", "transactionFee", "transactionAmount",
+    "userId", "createdAt", "updatedAt"
+]
+DIVIDEND_COLUMNS = [
+    "paymentDate", "symbol", "grossAmount", "taxWithheld",
+    "netAmount", "userId", "createdAt", "updatedAt"
+]
+
+def _text_column(series):
+    return series.fillna('').astype(str).str.strip().tolist()
 
-        for index, row in transactions_df.iterrows():
+def _numeric_column(series, name):
+    """Column-wise safe_float: blanks become 0.0, unparseable values are logged once and become 0.0"""
+    values = pd.to_numeric(series, errors='coerce')
+    invalid = values.isna() & series.notna() & (series.astype(str).str.strip() != '')
+    if invalid.any():
+        logger.warning(f"Column '{name}' has {int(invalid.sum())} non-numeric values at rows {list(series.index[invalid])}, using 0.0")
+    return values.fillna(0.0).astype(float).tolist()
+
+def _datetime_column(series):
+    return [None if pd.isna(value) else value for value in pd.to_datetime(series).astype(object)]
+
+def _parse_payment_dates(series):
+    """Parse DD/MM/YY payment dates column-wise; datetimes pass through"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
+    is_text = series.map(type) == str
+    values = series.where(~is_text, series[is_text].str.strip())
+    parsed = pd.to_datetime(values, format="%d/%m/%y", errors='coerce')
+
+    # %y maps 50-68 to 20xx, statements mean 19xx for anything from 50 up
+    late = is_text & (parsed.dt.year >= 2050)
+    parsed[late] = parsed[late] - pd.DateOffset(years=100)
+
+    invalid = parsed.isna()
+    if invalid.any():
+        logger.warning(f"Unparseable payment dates at rows {list(series.index[invalid])}, using current date as fallback")
+        parsed[invalid] = pd.Timestamp(datetime.now())
+    return parsed
+
+def _transaction_rows(transactions_df, user_id):
+    now = datetime.utcnow()
+    size = len(transactions_df)
+    columns = [
+        _datetime_column(transactions_df["Tarih"]),
+        _text_column(transactions_df["İşlem Türü"]),
+        _text_column(transactions_df["Sembol"]),
+        _text_column(transactions_df["İşlem Tipi"]),
+        _text_column(transactions_df["İşlem Durumu"]),
+        _text_column(transactions_df["Para Birimi"]),
+    ]
+    for name in ("Emir Adedi", "Emir Tutarı", "Gerçekleşen Adet", "Ortalama İşlem Fiyatı", "İşlem Ücreti", "İşlem Tutarı"):
+        columns.append(_numeric_column(transactions_df[name], name))
+    columns.extend([[user_id] * size, [now] * size, [now] * size])
+    return list(zip(*columns))
+
+def _dividend_rows(dividends_df, user_id):
+    now = datetime.utcnow()
+    size = len(dividends_df)
+    columns = [
+        _datetime_column(_parse_payment_dates(dividends_df["Ödeme Tarihi"])),
+        _text_column(dividends_df["Sermaya Piyasası Aracı"]),
+    ]
+    for name in ("Brüt Temettü Tutarı", "Stopaj*", "Net Temettü Tutarı"):
+        columns.append(_numeric_column(dividends_df[name], name))
+    columns.extend([[user_id] * size, [now] * size, [now] * size])
+    return list(zip(*columns))
+
+def _execute(cursor, query, params=None):
+    """cursor.execute, counted as a database round trip of the current metrics run"""
+    metrics.count("db_round_trips")
+    cursor.execute(query, params)
+
+def _commit(connection):
+    metrics.count("db_round_trips")
+    connection.commit()
+
+def bulk_insert(connection, table, columns, rows, row_index, batch_size=None):
+    """
+    Insert `rows` into `table` with one multi-row INSERT per batch.
+
+    Each batch runs under its own savepoint, so a bad row only rolls back its
+    batch and the connection stays usable for the rest. For failed batches
+    the rows are retried one by one to pinpoint the offending indices before
+    the batch is rolled back. Does not commit.
+
+    Returns {"inserted": int, "failed_batches": [{"rows", "offending_rows", "error"}]}.
+    """
+    batch_size = max(1, batch_size or BULK_BATCH_SIZE)
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    insert_query = f'INSERT INTO "{table}" ({column_list}) VALUES %s'
+    single_query = f'INSERT INTO "{table}" ({column_list}) VALUES ({", ".join(["%s"] * len(columns))})'
+    report = {"inserted": 0, "failed_batches": []}
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            batch_index = list(row_index[start:start + batch_size])
+            _execute(cursor, "SAVEPOINT bulk_batch")
             try:
-                transaction_date = row["Tarih"]
-                #logger.debug(f"Transaction date: {transaction_date}, type: {type(transaction_date)}")
-                
-                values = (
-                    transaction_date,
-                    str(row["İşlem Türü"]).strip(),
-                    str(row["Sembol"]).strip(),
-                    str(row["İşlem Tipi"]).strip(),
-                    str(row["İşlem Durumu"]).strip(),
-                    str(row["Para Birimi"]).strip(),
-                    safe_float(row["Emir Adedi"]),
-                    safe_float(row["Emir Tutarı"]),
-                    safe_float(row["Gerçekleşen Adet"]),
-                    safe_float(row["Ortalama İşlem Fiyatı"]),
-                    safe_float(row["İşlem Ücreti"]),
-                    safe_float(row["İşlem Tutarı"]),
-                    user_id,
-                    datetime.utcnow(),
-                    datetime.utcnow()
-                )
-                
-                cursor.execute(insert_query, values)
-                logger.debug(f"Inserted transaction: {transaction_date} - {row['Sembol']} - {row['İşlem Tipi']}")
-                
-            except psycopg2.Error as err:
-                logger.error(f"PostgreSQL Error processing row {index}: {str(err)}")
-                success = False
+                metrics.count("db_round_trips")
+                psycopg2.extras.execute_values(cursor, insert_query, batch, page_size=len(batch))
+                _execute(cursor, "RELEASE SAVEPOINT bulk_batch")
+                report["inserted"] += len(batch)
                 continue
-        
-        if success:
-            connection.commit()
-            logger.info("All transactions committed to database")
-        else:
-            logger.warning("Some transactions failed to insert, partial commit performed")
-            connection.commit()  # Commit successful ones
-            
+            except psycopg2.Error as err:
+                _execute(cursor, "ROLLBACK TO SAVEPOINT bulk_batch")
+                batch_error = str(err).strip()
+
+            offending = []
+            for index, row in zip(batch_index, batch):
+                _execute(cursor, "SAVEPOINT bulk_row")
+                try:
+                    _execute(cursor, single_query, row)
+                    _execute(cursor, "RELEASE SAVEPOINT bulk_row")
+                except psycopg2.Error:
+                    _execute(cursor, "ROLLBACK TO SAVEPOINT bulk_row")
+                    offending.append(index)
+            _execute(cursor, "ROLLBACK TO SAVEPOINT bulk_batch")
+            _execute(cursor, "RELEASE SAVEPOINT bulk_batch")
+
+            logger.error(f"{table} batch of rows {batch_index[0]}..{batch_index[-1]} failed, offending rows {offending}: {batch_error}")
+            report["failed_batches"].append({
+                "rows": batch_index,
+                "offending_rows": offending,
+                "error": batch_error
+            })
+
+    return report
+
+def bulk_insert_transactions(transactions_df, user_id, batch_size=None, connection=None):
+    """Commits on its own pooled connection unless the caller passes `connection`"""
+    rows = _transaction_rows(transactions_df, user_id)
+    if connection is not None:
+        return bulk_insert(connection, "Transaction", TRANSACTION_COLUMNS, rows, transactions_df.index, batch_size)
+    with pooled_connection() as connection:
+        report = bulk_insert(connection, "Transaction", TRANSACTION_COLUMNS, rows, transactions_df.index, batch_size)
+        _commit(connection)
+    return report
+
+def bulk_insert_dividends(dividends_df, user_id, batch_size=None, connection=None):
+    """Commits on its own pooled connection unless the caller passes `connection`"""
+    rows = _dividend_rows(dividends_df, user_id)
+    if connection is not None:
+        return bulk_insert(connection, "Dividend", DIVIDEND_COLUMNS, rows, dividends_df.index, batch_size)
+    with pooled_connection() as connection:
+        report = bulk_insert(connection, "Dividend", DIVIDEND_COLUMNS, rows, dividends_df.index, batch_size)
+        _commit(connection)
+    return report
+
+def insert_transactions(transactions_df, user_id, batch_size=None):
+    """Insert parsed statement rows; batch_size=1 gives the old row-by-row behaviour"""
+    logger.info(f"Inserting {len(transactions_df)} transactions for user {user_id}")
+    try:
+        report = bulk_insert_transactions(transactions_df, user_id, batch_size)
     except Exception as e:
         logger.error(f"Error in insert_transactions: {str(e)}", exc_info=True)
-        success = False
-        
-    finally:
-        if connection:
-            if 'cursor' in locals():
-                cursor.close()
-            connection.close()
-            logger.debug("Database connection closed")
-        
-        return success
+        return False
+
+    if report["failed_batches"]:
+        logger.warning(f"Inserted {report['inserted']} transactions, {len(report['failed_batches'])} batches failed")
+        return False
+    logger.info(f"All {report['inserted']} transactions committed to database")
+    return True
 
-def insert_dividends(dividends_df, user_id):
+def insert_dividends(dividends_df, user_id, batch_size=None):
+    """Insert parsed dividend rows; batch_size=1 gives the old row-by-row behaviour"""
     logger.info(f"Inserting {len(dividends_df)} dividend records for user {user_id}")
-    
-    connection = None
-    success = True
-    
     try:
-        connection = get_db_connection()
-        if not connection:
-            logger.error("Failed to establish database connection")
-            return False
-        
-        cursor = connection.cursor()
-        
-        # Define the SQL query
-        insert_query = """
-        INSERT INTO "Dividend" (
-            "paymentDate", symbol, "grossAmount", "taxWithheld",
-            "netAmount", "userId", "createdAt", "updatedAt"
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        logger.debug("SQL query prepared for dividends")
-        
-        for index, row in dividends_df.iterrows():
-            try:
-                # Handle the payment date
-                payment_date = row["Ödeme Tarihi"]
-                
-                # If payment_date is already a datetime object, use it directly
-                if isinstance(payment_date, datetime):
-                    logger.debug(f"Payment date is already a datetime: {payment_date}")
-                else:
-                    # Try to parse the date if it's a string
-                    try:
-                        # Check if the date is in the format DD/MM/YY
-                        date_str = str(payment_date).strip()
-                        if len(date_str) == 8 and date_str[2] == '/' and date_str[5] == '/':
-                            day = int(date_str[0:2])
-                            month = int(date_str[3:5])
-                            year = int(date_str[6:8])
-                            
-                            # Adjust the year (assuming 20xx for years less than 50, 19xx otherwise)
-                            if year < 50:
-                                year += 2000
-                            else:
-                                year += 1900
-                                
-                            # Create a datetime object
-                            payment_date = datetime(year, month, day)
-                            logger.debug(f"Parsed payment date: {date_str} -> {payment_date}")
-                        else:
-                            # Try standard parsing as fallback
-                            payment_date = datetime.strptime(date_str, "%d/%m/%y")
-                            logger.debug(f"Parsed payment date with strptime: {date_str} -> {payment_date}")
-                    except Exception as e:
-                        logger.warning(f"Error parsing payment date '{payment_date}': {str(e)}")
-                        # Use current date as fallback
-                        payment_date = datetime.now()
-                        logger.warning(f"Using current date as fallback: {payment_date}")
-                
-                values = (
-                    payment_date,
-                    str(row["Sermaya Piyasası Aracı"]).strip(),
-                    safe_float(row["Brüt Temettü Tutarı"]),
-                    safe_float(row["Stopaj*"]),
-                    safe_float(row["Net Temettü Tutarı"]),
-                    user_id,
-                    datetime.utcnow(),
-                    datetime.utcnow()
-                )
-                
-                cursor.execute(insert_query, values)
-                logger.debug(f"Inserted dividend: {payment_date} - {row['Sermaya Piyasası Aracı']} - {row['Net Temettü Tutarı']}")
-                
-            except psycopg2.Error as err:
-                logger.error(f"PostgreSQL Error processing dividend row {index}: {str(err)}")
-                success = False
-                continue
-        
-        if success:
-            connection.commit()
-            logger.info("All dividend records committed to database")
-        else:
-            logger.warning("Some dividend records failed to insert, partial commit performed")
-            connection.commit()  # Commit successful ones
-            
+        report = bulk_insert_dividends(dividends_df, user_id, batch_size)
     except Exception as e:
         logger.error(f"Error in insert_dividends: {str(e)}", exc_info=True)
-        success = False
-        
-    finally:
-        if connection:
-            if 'cursor' in locals():
-                cursor.close()
-            connection.close()
-            logger.debug("Database connection closed")
-        
-        return success
+        return False
+
+    if report["failed_batches"]:
+        logger.warning(f"Inserted {report['inserted']} dividend records, {len(report['failed_batches'])} batches failed")
+        return False
+    logger.info(f"All {report['inserted']} dividend records committed to database")
+    return True
 
 def get_user_dividends(user_id):
-    connection = get_db_connection()
-    cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    
-    try:
-        cursor.execute('SELECT * FROM "Dividend" WHERE "userId" = %s', (user_id,))
-        dividends = cursor.fetchall()
-        return dividends
-    finally:
-        cursor.close()
-        connection.close()
+    with pooled_connection() as connection:
+        with connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            _execute(cursor, 'SELECT * FROM "Dividend" WHERE "userId" = %s', (user_id,))
+            return cursor.fetchall()
 
 def get_user_transactions(user_id):
-    connection = get_db_connection()
-    cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    
-    try:
-        cursor.execute('SELECT * FROM "Transaction" WHERE "userId" = %s', (user_id,))
-        transactions = cursor.fetchall()
-        return transactions
-    finally:
-        cursor.close()
-        connection.close()
+    with pooled_connection() as connection:
+        with connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            _execute(cursor, 'SELECT * FROM "Transaction" WHERE "userId" = %s', (user_id,))
+            return cursor.fetchall()
+
+# Rows fetched per round trip by the streaming readers below
+STREAM_ITERSIZE = int(os.getenv('DB_STREAM_ITERSIZE', '10000'))
+
+def _stream(query, params, itersize=None, cursor_factory=None):
+    """
+    Batches of at most `itersize` rows of `query`, read through a named
+    (server-side) cursor so only one batch is held client-side at a time.
+    The pooled connection stays checked out until the generator is
+    exhausted or closed.
+    """
+    itersize = itersize or STREAM_ITERSIZE
+    with pooled_connection() as connection:
+        with connection.cursor(name=f"stream_{uuid.uuid4().hex}", cursor_factory=cursor_factory) as cursor:
+            cursor.itersize = itersize
+            _execute(cursor, query, params)
+            while True:
+                metrics.count("db_round_trips")
+                rows = cursor.fetchmany(itersize)
+                if rows:
+                    yield rows
+                if len(rows) < itersize:
+                    break
+
+def _history_filters(params, date_column, start=None, end=None, symbols=None, symbol_column='symbol'):
+    """
+    SQL conditions for an optional date window [start, end) and symbol
+    list; their values are added to the named `params`
+    """
+    conditions = ''
+    if start is not None:
+        conditions += f' AND {date_column} >= %(start)s'
+        params["start"] = start
+    if end is not None:
+        conditions += f' AND {date_column} < %(end)s'
+        params["end"] = end
+    if symbols is not None:
+        conditions += f' AND {symbol_column} = ANY(%(symbols)s)'
+        params["symbols"] = list(symbols)
+    return conditions
+
+def stream_user_transactions(user_id, start=None, end=None, symbols=None, itersize=None):
+    """
+    The user's transactions as DictRows of all columns in (date, id) order,
+    optionally only those dated in [start, end) and of the given symbols.
+    Rows are fetched `itersize` at a time from a server-side cursor.
+    """
+    params = {"user_id": user_id}
+    query = (
+        'SELECT * FROM "Transaction" WHERE "userId" = %(user_id)s'
+        + _history_filters(params, 'date', start, end, symbols)
+        + ' ORDER BY date, id'
+    )
+    for rows in _stream(query, params, itersize, psycopg2.extras.DictCursor):
+        yield from rows
+
+def stream_user_dividends(user_id, start=None, end=None, symbols=None, itersize=None):
+    """Like stream_user_transactions for dividends, in ("paymentDate", id) order"""
+    params = {"user_id": user_id}
+    query = (
+        'SELECT * FROM "Dividend" WHERE "userId" = %(user_id)s'
+        + _history_filters(params, '"paymentDate"', start, end, symbols)
+        + ' ORDER BY "paymentDate", id'
+    )
+    for rows in _stream(query, params, itersize, psycopg2.extras.DictCursor):
+        yield from rows
+
+# Only the columns the tax calculation reads (transaction_array.TAX_COLUMNS)
+_TAX_SELECT = ", ".join(f't."{column}"' for column in TAX_COLUMNS)
+
+# Latest USD/TRY rate on or before the transaction day, at most
+# max_fallback_days back (see get_dolar.MAX_FALLBACK_DAYS)
+_USD_RATE_JOIN = '''
+    LEFT JOIN LATERAL (
+        SELECT d."dovizAlis"
+        FROM "Dolar" d
+        WHERE d."rateDate" <= t.date::date
+          AND d."rateDate" >= t.date::date - %(max_fallback_days)s::int
+        ORDER BY d."rateDate" DESC, d.id DESC
+        LIMIT 1
+    ) r ON t.currency = 'USD'
+'''
+
+def transactions_query(after=None, with_rates=False, filters=''):
+    """
+    TAX_COLUMNS of a user's transactions in (date, id) order, with
+    %(name)s parameters: user_id, after_date/after_id with `after`,
+    max_fallback_days with `with_rates`, and those of `filters`
+    (see _history_filters)
+    """
+    if with_rates:
+        query = f'SELECT {_TAX_SELECT}, r."dovizAlis" AS "usdRate" FROM "Transaction" t' + _USD_RATE_JOIN
+    else:
+        query = f'SELECT {_TAX_SELECT} FROM "Transaction" t '
+    query += 'WHERE t."userId" = %(user_id)s'
+    if after is not None:
+        query += ' AND (t.date, t.id) > (%(after_date)s, %(after_id)s)'
+    return query + filters + ' ORDER BY t.date, t.id'
+
+def transactions_with_rates_query(after=None):
+    return transactions_query(after, with_rates=True)
+
+def _transactions_params(user_id, after, max_fallback_days=None):
+    params = {"user_id": user_id}
+    if after is not None:
+        params["after_date"], params["after_id"] = after
+    if max_fallback_days is not None:
+        params["max_fallback_days"] = max_fallback_days
+    return params
+
+def get_user_transactions_since(user_id, after=None):
+    """
+    User transactions in processing order (date, then id) as a
+    TransactionArray.
+
+    With `after` = (date, id) only transactions strictly after that
+    position are returned.
+    """
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            _execute(cursor, transactions_query(after), _transactions_params(user_id, after))
+            return TransactionArray.from_rows(cursor.fetchall())
+
+def get_user_transactions_with_rates(user_id, after=None, max_fallback_days=15):
+    """
+    Like get_user_transactions_since, with each row's applicable USD/TRY
+    rate joined in SQL into the "rate" field (NaN for non-USD rows and for
+    days without a rate). One round trip instead of a lookup per transaction.
+    """
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            _execute(
+                cursor, transactions_with_rates_query(after), _transactions_params(user_id, after, max_fallback_days)
+            )
+            return TransactionArray.from_rows(cursor.fetchall())
+
+def stream_user_transaction_chunks(user_id, after=None, with_rates=False, max_fallback_days=15,
+                                   start=None, end=None, symbols=None, itersize=None):
+    """
+    Streaming get_user_transactions_since / get_user_transactions_with_rates:
+    TransactionArrays of at most `itersize` rows in (date, id) order, read
+    from a server-side cursor and coded against one shared symbol list.
+    Optionally only transactions dated in [start, end) and of the given
+    symbols.
+    """
+    params = _transactions_params(user_id, after, max_fallback_days if with_rates else None)
+    query = transactions_query(after, with_rates, _history_filters(params, 't.date', start, end, symbols, 't.symbol'))
+    symbol_list = []
+    for rows in _stream(query, params, itersize):
+        yield TransactionArray.from_rows(rows, symbol_list)
+
+# Columns of the dividend stream below, the rate last
+DIVIDEND_RATE_COLUMNS = ["id", "paymentDate", "symbol", "grossAmount", "taxWithheld", "netAmount", "usdRate"]
+
+def stream_user_dividends_with_rates(user_id, max_fallback_days=15, itersize=None):
+    """
+    Batches of DIVIDEND_RATE_COLUMNS tuples of the user's dividends in
+    ("paymentDate", id) order, with the USD/TRY rate of the payment day
+    joined as in lib/exchange.ts getDividendsWithRates
+    """
+    query = (
+        'SELECT v.id, v."paymentDate", v.symbol, v."grossAmount", v."taxWithheld", v."netAmount", '
+        'r."dovizAlis" AS "usdRate" FROM "Dividend" v'
+        '''
+        LEFT JOIN LATERAL (
+            SELECT d."dovizAlis"
+            FROM "Dolar" d
+            WHERE d."rateDate" <= v."paymentDate"::date
+              AND d."rateDate" >= v."paymentDate"::date - %(max_fallback_days)s::int
+            ORDER BY d."rateDate" DESC, d.id DESC
+            LIMIT 1
+        ) r ON true
+        WHERE v."userId" = %(user_id)s ORDER BY v."paymentDate", v.id
+        '''
+    )
+    yield from _stream(query, {"user_id": user_id, "max_fallback_days": max_fallback_days}, itersize)
+
+def get_user_history_fingerprint(user_id, max_fallback_days=15):
+    """
+    (transaction count, sum of transaction ids, dividend count, sum of
+    dividend ids, digest of the exchange rates). Any insert or delete of
+    the user's rows, or any change to a rate their rows can be joined with,
+    changes it. Only the Dolar rows dated within the user's history (less
+    max_fallback_days) are digested, through the "rateDate" index, so the
+    check does not slow down as the rate table grows.
+    """
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            _execute(cursor,
+                '''
+                WITH span AS (
+                    SELECT
+                        LEAST(
+                            (SELECT MIN(date)::date FROM "Transaction" WHERE "userId" = %(user_id)s),
+                            (SELECT MIN("paymentDate")::date FROM "Dividend" WHERE "userId" = %(user_id)s)
+                        ) - %(max_fallback_days)s::int AS first_day,
+                        GREATEST(
+                            (SELECT MAX(date)::date FROM "Transaction" WHERE "userId" = %(user_id)s),
+                            (SELECT MAX("paymentDate")::date FROM "Dividend" WHERE "userId" = %(user_id)s)
+                        ) AS last_day
+                )
+                SELECT
+                    (SELECT COUNT(*) FROM "Transaction" WHERE "userId" = %(user_id)s),
+                    (SELECT COALESCE(SUM(id), 0) FROM "Transaction" WHERE "userId" = %(user_id)s),
+                    (SELECT COUNT(*) FROM "Dividend" WHERE "userId" = %(user_id)s),
+                    (SELECT COALESCE(SUM(id), 0) FROM "Dividend" WHERE "userId" = %(user_id)s),
+                    (SELECT md5(COALESCE(string_agg(
+                        d.id || ':' || d."dovizAlis" || ':' || d."rateDate", ',' ORDER BY d."rateDate", d.id
+                    ), '')) FROM "Dolar" d, span WHERE d."rateDate" BETWEEN span.first_day AND span.last_day)
+                ''',
+                {"user_id": user_id, "max_fallback_days": max_fallback_days}
+            )
+            transaction_count, transaction_id_sum, dividend_count, dividend_id_sum, rates_digest = cursor.fetchone()
+            return int(transaction_count), int(transaction_id_sum), int(dividend_count), int(dividend_id_sum), rates_digest
+
+# What a FIFO snapshot was computed from: (count, sum of ids) of the user's
+# transactions at or before the watermark, and one digest of the Dolar rows
+# those transactions can be joined with and of the YiUfe years up to the
+# watermark. Shared with async_db.
+FIFO_SNAPSHOT_FINGERPRINT_QUERY = '''
+    WITH upto AS (
+        SELECT COUNT(*) AS transaction_count, COALESCE(SUM(id), 0) AS transaction_id_sum,
+               MIN(date)::date AS first_day
+        FROM "Transaction"
+        WHERE "userId" = %(user_id)s AND (date, id) <= (%(until_date)s::timestamp, %(until_id)s)
+    )
+    SELECT
+        upto.transaction_count,
+        upto.transaction_id_sum,
+        md5(
+            (SELECT md5(COALESCE(string_agg(
+                d.id || ':' || d."dovizAlis" || ':' || d."rateDate", ',' ORDER BY d."rateDate", d.id
+            ), '')) FROM "Dolar" d
+             WHERE d."rateDate" BETWEEN upto.first_day - %(max_fallback_days)s::int
+                                    AND %(until_date)s::timestamp::date)
+            || ':' ||
+            (SELECT md5(COALESCE(string_agg(
+                ROW(y.yil, y.ocak, y.subat, y.mart, y.nisan, y.mayis, y.haziran,
+                    y.temmuz, y.agustos, y.eylul, y.ekim, y.kasim, y.aralik)::text, ',' ORDER BY y.yil, y.id
+            ), '')) FROM "YiUfe" y
+             WHERE y.yil <= EXTRACT(YEAR FROM %(until_date)s::timestamp))
+        )
+    FROM upto
+'''
+
+def fifo_snapshot_fingerprint_params(user_id, until, max_fallback_days=15):
+    return {"user_id": user_id, "until_date": until[0], "until_id": until[1], "max_fallback_days": max_fallback_days}
+
+def get_fifo_snapshot_fingerprint(user_id, until, max_fallback_days=15):
+    """
+    (count, sum of ids, rates digest) for a FIFO snapshot with watermark
+    `until` = (date, id); see FIFO_SNAPSHOT_FINGERPRINT_QUERY. The digest
+    changes with any Dolar row the transactions up to the watermark can use
+    (including the max_fallback_days before the first one) and any YiUfe
+    value of a year up to the watermark, e.g. a newly published month.
+    """
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            _execute(cursor, FIFO_SNAPSHOT_FINGERPRINT_QUERY,
+                     fifo_snapshot_fingerprint_params(user_id, until, max_fallback_days))
+            count, id_sum, rates_digest = cursor.fetchone()
+            return int(count), int(id_sum), rates_digest
+
+def get_fifo_snapshot(user_id):
+    with pooled_connection() as connection:
+        with connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            _execute(cursor, 'SELECT * FROM "FifoSnapshot" WHERE "userId" = %s', (user_id,))
+            return cursor.fetchone()
+
+def save_fifo_snapshot(user_id, version, watermark, transaction_count, transaction_id_sum, rates_digest, state):
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            _execute(cursor, 
+                '''
+                INSERT INTO "FifoSnapshot"
+                    ("userId", version, "watermarkDate", "watermarkId", "transactionCount", "transactionIdSum",
+                     "ratesDigest", state, "updatedAt")
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT ("userId") DO UPDATE SET
+                    version = EXCLUDED.version,
+                    "watermarkDate" = EXCLUDED."watermarkDate",
+                    "watermarkId" = EXCLUDED."watermarkId",
+                    "transactionCount" = EXCLUDED."transactionCount",
+                    "transactionIdSum" = EXCLUDED."transactionIdSum",
+                    "ratesDigest" = EXCLUDED."ratesDigest",
+                    state = EXCLUDED.state,
+                    "updatedAt" = EXCLUDED."updatedAt"
+                ''',
+                (user_id, version, watermark[0], watermark[1], transaction_count, transaction_id_sum,
+                 rates_digest, psycopg2.extras.Json(state), datetime.utcnow())
+            )
+        _commit(connection)
+
+def delete_fifo_snapshot(user_id):
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            _execute(cursor, 'DELETE FROM "FifoSnapshot" WHERE "userId" = %s', (user_id,))
+        _commit(connection)
+
+def get_user_ids_with_transactions():
+    """Ids of all users that have at least one transaction"""
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            _execute(cursor, 
+                'SELECT id FROM "User" u '
+                'WHERE EXISTS (SELECT 1 FROM "Transaction" t WHERE t."userId" = u.id) ORDER BY id'
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+def save_tax_results(tax_year, results):
+    """Upsert precomputed results, given as (user_id, result dict) pairs, in one commit"""
+    if not results:
+        return
+    computed_at = datetime.utcnow()
+    rows = [(user_id, tax_year, psycopg2.extras.Json(result), computed_at) for user_id, result in results]
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            metrics.count("db_round_trips")
+            psycopg2.extras.execute_values(
+                cursor,
+                '''
+                INSERT INTO "TaxResult" ("userId", "taxYear", result, "computedAt")
+                VALUES %s
+                ON CONFLICT ("userId", "taxYear") DO UPDATE SET
+                    result = EXCLUDED.result,
+                    "computedAt" = EXCLUDED."computedAt"
+                ''',
+                rows
+            )
+        _commit(connection)
 
 def check_transactions_in_db(user_id):
     """Check if transactions for a user exist in the database and return details"""
     connection = None
     try:
-        connection = get_db_connection()
-        if not connection:
-            logger.error("Failed to establish database connection")
-            return False
+        connection = get_pool().getconn()
         
         cursor = connection.cursor()
         
         # Check Transaction table
         try:
             logger.info("Checking Transaction table for user_id: " + user_id)
-            cursor.execute('SELECT COUNT(*) FROM "Transaction" WHERE "userId" = %s', (user_id,))
+            _execute(cursor, 'SELECT COUNT(*) FROM "Transaction" WHERE "userId" = %s', (user_id,))
             transaction_count = cursor.fetchone()[0]
             logger.info(f"Found {transaction_count} transactions for user {user_id}")
             
             if transaction_count > 0:
                 # Get sample transactions
-                cursor.execute("""
+                _execute(cursor, """
                     SELECT date, symbol, "operationType", "executedQuantity", "averagePrice", currency 
                     FROM "Transaction" 
                     WHERE "userId" = %s 
@@ -342,13 +905,13 @@ def check_transactions_in_db(user_id):
                     logger.info(f"  {tx[0]} - {tx[1]} - {tx[2]} - {tx[3]} {tx[1]} @ {tx[4]} {tx[5]}")
             
             # Check Dividend table
-            cursor.execute('SELECT COUNT(*) FROM "Dividend" WHERE "userId" = %s', (user_id,))
+            _execute(cursor, 'SELECT COUNT(*) FROM "Dividend" WHERE "userId" = %s', (user_id,))
             dividend_count = cursor.fetchone()[0]
             logger.info(f"Found {dividend_count} dividend records for user {user_id}")
             
             if dividend_count > 0:
                 # Get sample dividends
-                cursor.execute("""
+                _execute(cursor, """
                     SELECT "paymentDate", symbol, "grossAmount", "taxWithheld", "netAmount" 
                     FROM "Dividend" 
                     WHERE "userId" = %s 
@@ -378,5 +941,5 @@ def check_transactions_in_db(user_id):
         if connection:
             if 'cursor' in locals():
                 cursor.close()
-            connection.close()
-            logger.debug("Database connection closed")
\ No newline at end of file
+            get_pool().putconn(connection)
+            logger.debug("Database connection returned to pool")
\ No newline at end of file
@@ -0,0 +1,252 @@
+"""
+Batch ingestion of several statement PDFs for one user.
+
+All files are extracted concurrently, rows repeated across files (the same
+statement uploaded twice, or a monthly statement overlapping an annual one)
+are dropped, and everything is written with a single bulk transaction and
+one commit.
+
+Usage: python extract_batch.py <user_id> <pdf_path> [<pdf_path> ...]
+"""
+
+import json
+import os
+import sys
+from concurrent.futures import as_completed
+
+import pandas as pd
+
+import metrics
+from db_connection import (
+    pooled_connection, bulk_insert_transactions, bulk_insert_dividends, check_transactions_in_db
+)
+from extract_tables import (
+    TRANSACTION_COLUMNS, DIVIDEND_COLUMNS, EXTRACT_WORKERS,
+    extract_pdf_rows, _get_page_executor, _report_invalid
+)
+from logger import get_logger
+
+logger = get_logger('extract_batch')
+
+
+def _extract_file(pdf_path, target_title_prefix, with_metrics=False):
+    """
+    Process pool entry point: one whole file per worker, pages read serially.
+    Returns (parsed frames, metrics dict or None).
+    """
+    with metrics.collect(with_metrics) as run:
+        parsed = extract_pdf_rows(pdf_path, target_title_prefix, workers=1)
+    return parsed, run.to_dict() if run is not None else None
+
+
+def _extract_files(pdf_paths, target_title_prefix, workers, on_file=None):
+    """
+    Returns one (df, invalid, df_dividend, invalid_dividend) or exception per
+    file. `on_file(position, outcome)` is called as each file finishes, in
+    completion order.
+    """
+    notify = on_file or (lambda position, outcome: None)
+    if workers <= 1 or len(pdf_paths) == 1:
+        # A single file can still use page-parallel extraction
+        extracted = []
+        for position, pdf_path in enumerate(pdf_paths):
+            try:
+                extracted.append(extract_pdf_rows(pdf_path, target_title_prefix, workers))
+            except Exception as e:
+                extracted.append(e)
+            notify(position, extracted[-1])
+        return extracted
+
+    executor = _get_page_executor(workers)
+    run = metrics.active()
+    futures = {
+        executor.submit(_extract_file, pdf_path, target_title_prefix, run is not None): position
+        for position, pdf_path in enumerate(pdf_paths)
+    }
+    extracted = [None] * len(pdf_paths)
+    for future in as_completed(futures):
+        position = futures[future]
+        try:
+            parsed, worker_metrics = future.result()
+        except Exception as e:
+            extracted[position] = e
+        else:
+            extracted[position] = parsed
+            if run is not None:
+                run.merge(worker_metrics)
+        notify(position, extracted[position])
+    return extracted
+
+
+def _merge_files(frames, columns):
+    """
+    Concatenate per-file frames in upload order, dropping rows that an
+    earlier file already contained. Repeats inside one file are kept, since
+    a statement can legitimately list the same fill twice.
+
+    Returns (df, file_numbers, duplicate_count); `file_numbers[i]` is the
+    position of the file row `i` came from.
+    """
+    parts = [frame.assign(_file=number) for number, frame in frames if not frame.empty]
+    if not parts:
+        return pd.DataFrame(columns=columns), [], 0
+
+    merged = pd.concat(parts, ignore_index=True)
+    first_file = merged.groupby(columns, dropna=False, sort=False)["_file"].transform("min")
+    keep = merged["_file"] == first_file
+    file_numbers = merged.loc[keep, "_file"].tolist()
+    return merged.loc[keep, columns].reset_index(drop=True), file_numbers, int((~keep).sum())
+
+
+def _failed_files(report, file_numbers):
+    return {file_numbers[row] for batch in report["failed_batches"] for row in batch["rows"]}
+
+
+def extract_batch_and_save(pdf_paths, user_id, target_title_prefix="YATIRIM İŞLEMLERİ", workers=None,
+                           on_progress=None):
+    """
+    Extract and insert several PDFs in one transaction.
+
+    Returns {"success": bool, "results": [...]} where each result has the
+    usual {"success", "message" | "error", "hasData"} shape plus the "file",
+    and a "metrics" object for the whole batch unless metrics are disabled.
+
+    `on_progress(event)` is called as each file's extraction finishes, before
+    the commit. Files that are already settled then (missing, unreadable or
+    without rows) get {"index", "file", "final": True, **result}; files with
+    rows get {"index", "file", "final": False, "message"} and their result
+    only comes with the return value.
+    """
+    with metrics.collect() as run:
+        batch = _extract_batch_and_save(pdf_paths, user_id, target_title_prefix, workers, on_progress)
+    if run is not None:
+        batch["metrics"] = metrics.report(run, "Batch extraction", logger)
+    return batch
+
+
+def _extract_batch_and_save(pdf_paths, user_id, target_title_prefix, workers, on_progress=None):
+    workers = EXTRACT_WORKERS if workers is None else max(1, int(workers))
+    logger.info(f"Starting batch extraction of {len(pdf_paths)} PDFs for user {user_id}")
+    notify = on_progress or (lambda event: None)
+
+    results = [None] * len(pdf_paths)
+
+    def settle(number, result):
+        results[number] = result
+        notify({"index": number, "file": pdf_paths[number], "final": True, **result})
+
+    readable = []
+    for number, pdf_path in enumerate(pdf_paths):
+        if not os.path.exists(pdf_path):
+            logger.error(f"PDF file not found: {pdf_path}")
+            settle(number, {"success": False, "error": f"PDF dosyası bulunamadı: {pdf_path}", "hasData": False})
+        else:
+            readable.append(number)
+
+    transactions = []
+    dividends = []
+
+    def extracted(position, outcome):
+        number = readable[position]
+        pdf_path = pdf_paths[number]
+        if isinstance(outcome, Exception):
+            logger.error(f"PDF reading error in {pdf_path}: {str(outcome)}")
+            settle(number, {"success": False, "error": f"PDF okuma hatası: {str(outcome)}", "hasData": False})
+            return
+        df, invalid, df_dividend, invalid_dividend = outcome
+        _report_invalid(invalid, f"Transactions ({pdf_path})")
+        _report_invalid(invalid_dividend, f"Dividends ({pdf_path})")
+        if df.empty and df_dividend.empty:
+            settle(number, {
+                "success": True,
+                "message": f"{pdf_path} dosyasında işlem ve temettü verisi bulunamadı",
+                "hasData": False
+            })
+            return
+        transactions.append((number, df))
+        dividends.append((number, df_dividend))
+        notify({
+            "index": number,
+            "file": pdf_path,
+            "final": False,
+            "message": f"{len(df)} işlem ve {len(df_dividend)} temettü satırı okundu, kaydediliyor"
+        })
+
+    metrics.count("files", len(pdf_paths))
+    with metrics.stage("extract"):
+        _extract_files([pdf_paths[number] for number in readable], target_title_prefix, workers, extracted)
+    # Files finish in completion order; merging keeps upload order
+    transactions.sort(key=lambda item: item[0])
+    dividends.sort(key=lambda item: item[0])
+
+    with metrics.stage("merge"):
+        df, transaction_files, transaction_duplicates = _merge_files(transactions, TRANSACTION_COLUMNS)
+        df_dividend, dividend_files, dividend_duplicates = _merge_files(dividends, DIVIDEND_COLUMNS)
+    metrics.count("transaction_rows", len(df))
+    metrics.count("dividend_rows", len(df_dividend))
+    metrics.count("duplicate_rows", transaction_duplicates + dividend_duplicates)
+    logger.info(
+        f"Merged {len(df)} transaction rows and {len(df_dividend)} dividend rows "
+        f"({transaction_duplicates} + {dividend_duplicates} duplicates across files dropped)"
+    )
+
+    failed_transactions = set()
+    failed_dividends = set()
+    database_error = None
+    if not df.empty or not df_dividend.empty:
+        try:
+            with metrics.stage("db_insert"), pooled_connection() as connection:
+                if not df.empty:
+                    report = bulk_insert_transactions(df, user_id, connection=connection)
+                    failed_transactions = _failed_files(report, transaction_files)
+                if not df_dividend.empty:
+                    report = bulk_insert_dividends(df_dividend, user_id, connection=connection)
+                    failed_dividends = _failed_files(report, dividend_files)
+                connection.commit()
+                metrics.count("db_round_trips")
+            logger.info("Batch committed to database")
+        except Exception as e:
+            logger.error(f"Database error during batch insert: {str(e)}", exc_info=True)
+            database_error = str(e)
+
+    with_transactions = {number for number, frame in transactions if not frame.empty}
+    with_dividends = {number for number, frame in dividends if not frame.empty}
+    for number, _ in transactions:
+        has_transactions = number in with_transactions
+        has_dividends = number in with_dividends
+
+        if database_error is not None:
+            results[number] = {"success": False, "error": f"Veritabanı hatası: {database_error}", "hasData": True}
+        elif number in failed_transactions:
+            results[number] = {"success": False, "error": "Veritabanına işlemler kaydedilirken hata oluştu", "hasData": True}
+        elif number in failed_dividends:
+            results[number] = {"success": False, "error": "Veritabanına temettü verileri kaydedilirken hata oluştu", "hasData": True}
+        else:
+            saved = [name for name, present in (("işlemler", has_transactions), ("temettü verileri", has_dividends)) if present]
+            results[number] = {
+                "success": True,
+                "message": f"{pdf_paths[number]} dosyasından {' ve '.join(saved)} başarıyla kaydedildi",
+                "hasData": True
+            }
+
+    return {
+        "success": all(result["success"] for result in results),
+        "results": [{"file": pdf_path, **result} for pdf_path, result in zip(pdf_paths, results)]
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("Usage: python extract_batch.py <user_id> <pdf_path> [<pdf_path> ...]")
+
+    user_id = sys.argv[1]
+    batch = extract_batch_and_save(sys.argv[2:], user_id)
+    print(json.dumps(batch, ensure_ascii=False))
+
+    if any(result.get("hasData") for result in batch["results"]):
+        db_check = check_transactions_in_db(user_id)
+        if db_check:
+            logger.info(f"Database check result: {json.dumps(db_check)}")
+
+    if not batch["success"]:
+        sys.exit(1)
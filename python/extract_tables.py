@@ -1,15 +1,26 @@
 import pdfplumber
 import pandas as pd
+import numpy as np
 import os
 import sys
 import locale
-from db_connection import insert_transactions, insert_dividends, get_db_connection, check_transactions_in_db
+from db_connection import (
+    insert_transactions, insert_dividends, get_db_connection, check_transactions_in_db,
+    pooled_connection, bulk_insert_transactions, bulk_insert_dividends
+)
 import json
+import atexit
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from logger import get_logger
+from logger import get_logger, RowLog
+import metrics
+from metrics import peak_rss_mb
+from statement_cache import get_statement_cache, file_digest
 
 # Initialize logger
 logger = get_logger('extract_tables')
+# Per-page and per-table messages, sampled with LOG_ROW_SAMPLE
+page_log = RowLog(logger)
 
 # Set UTF-8 encoding
 os.environ['PYTHONIOENCODING'] = 'utf-8'
@@ -33,68 +44,654 @@ except locale.Error:
             locale.setlocale(locale.LC_ALL, '')
             logger.warning("Failed to set Turkish locale, using default")
 
+def _parse_number(value):
+    """clean_number without the blank handling; raises on unparseable values"""
+    if isinstance(value, str):
+        # Remove currency symbols and whitespace
+        value = value.replace('TL', '').replace('USD', '').strip()
+
+        # Handle Turkish number format (1.234,56 -> 1234.56)
+        # First, remove thousand separators
+        parts = value.split(',')
+        if len(parts) == 2:
+            # If there's a comma, treat it as decimal separator
+            integer_part = parts[0].replace('.', '')
+            decimal_part = parts[1]
+            value = f"{integer_part}.{decimal_part}"
+        else:
+            # No comma found, just remove dots (thousand separators)
+            value = value.replace('.', '')
+
+    return float(value)
+
 def clean_number(value):
     try:
         if value == '-' or value == '' or value is None:
             return 0.0
-            
-        if isinstance(value, str):
-            # Remove currency symbols and whitespace
-            value = value.replace('TL', '').replace('USD', '').strip()
-            
-            # Handle Turkish number format (1.234,56 -> 1234.56)
-            # First, remove thousand separators
-            parts = value.split(',')
-            if len(parts) == 2:
-                # If there's a comma, treat it as decimal separator
-                integer_part = parts[0].replace('.', '')
-                decimal_part = parts[1]
-                value = f"{integer_part}.{decimal_part}"
-            else:
-                # No comma found, just remove dots (thousand separators)
-                value = value.replace('.', '')
-                
-        return float(value)
+        return _parse_number(value)
     except (ValueError, TypeError) as e:
-        logger.warning(f"Error converting value '{value}' to float: {str(e)}")
+        logger.warning("Error converting value '%s' to float: %s", value, e)
         return 0.0
 
 def parse_date(date_str):
     try:
         return datetime.strptime(date_str.strip(), "%d/%m/%y %H:%M:%S")
     except Exception as e:
-        logger.warning(f"Error parsing date '{date_str}': {str(e)}")
+        logger.warning("Error parsing date '%s': %s", date_str, e)
         return None
 
+def _parse_dividend_datetime(date_str):
+    """DD/MM/YY of an already stripped string; raises on unparseable dates"""
+    # Check if the date is in the format DD/MM/YY
+    if len(date_str) == 8 and date_str[2] == '/' and date_str[5] == '/':
+        day = int(date_str[0:2])
+        month = int(date_str[3:5])
+        year = int(date_str[6:8])
+
+        # Adjust the year (assuming 20xx for years less than 50, 19xx otherwise)
+        if year < 50:
+            year += 2000
+        else:
+            year += 1900
+
+        # Create a datetime object
+        return datetime(year, month, day)
+    else:
+        # Try standard parsing as fallback
+        return datetime.strptime(date_str, "%d/%m/%y")
+
 def parse_dividend_date(date_str):
     """Parse dividend date in format DD/MM/YY"""
     try:
         # Clean the date string
         date_str = date_str.strip()
-        
-        # Check if the date is in the format DD/MM/YY
-        if len(date_str) == 8 and date_str[2] == '/' and date_str[5] == '/':
-            day = int(date_str[0:2])
-            month = int(date_str[3:5])
-            year = int(date_str[6:8])
-            
-            # Adjust the year (assuming 20xx for years less than 50, 19xx otherwise)
-            if year < 50:
-                year += 2000
-            else:
-                year += 1900
-                
-            # Create a datetime object
-            return datetime(year, month, day)
-        else:
-            # Try standard parsing as fallback
-            return datetime.strptime(date_str, "%d/%m/%y")
+        return _parse_dividend_datetime(date_str)
     except Exception as e:
-        logger.warning(f"Error parsing dividend date '{date_str}': {str(e)}")
+        logger.warning("Error parsing dividend date '%s': %s", date_str, e)
         # Return the original string if parsing fails
         return date_str
 
-def extract_tables_and_save(pdf_path, user_id, target_title_prefix="YATIRIM İŞLEMLERİ"):
+TRANSACTION_COLUMNS = [
+    "Tarih", "İşlem Türü", "Sembol", "İşlem Tipi", "İşlem Durumu", "Para Birimi",
+    "Emir Adedi", "Emir Tutarı", "Gerçekleşen Adet", "Ortalama İşlem Fiyatı",
+    "İşlem Ücreti", "İşlem Tutarı"
+]
+DIVIDEND_COLUMNS = [
+    "Ödeme Tarihi", "Sermaya Piyasası Aracı", "Brüt Temettü Tutarı", "Stopaj*", "Net Temettü Tutarı"
+]
+TRANSACTION_NUMERIC_COLUMNS = TRANSACTION_COLUMNS[6:12]
+DIVIDEND_NUMERIC_COLUMNS = DIVIDEND_COLUMNS[2:5]
+
+def _text_column(series):
+    """Column-wise str(cell).strip()"""
+    # astype(str) leaves None missing, where str(cell) gives "None"
+    return series.map(str).str.strip().astype(object)
+
+def _cells(raw, columns):
+    """The cells of several columns as one flat Series, row by row"""
+    return pd.Series(raw[columns].to_numpy().ravel(), dtype=object)
+
+def _text_mask(cells):
+    # pdfplumber cells are str or None, so the per-cell type check is rarely needed
+    if pd.api.types.infer_dtype(cells, skipna=True) in ("string", "empty"):
+        return cells.notna().to_numpy()
+    return (cells.map(type) == str).to_numpy()
+
+def _clean_numbers(cells):
+    """
+    clean_number over a flat Series of cells; returns (values, invalid)
+    arrays. Blank cells (None, "", "-") are 0.0; cells that are not blank
+    but cannot be parsed are 0.0 and marked in `invalid`.
+    """
+    blank = (cells.isna() | cells.isin(["", "-"])).to_numpy()
+    is_text = _text_mask(cells)
+    values = np.full(len(cells), np.nan)
+
+    text_cells = is_text & ~blank
+    text = cells[text_cells].str.replace("TL", "", regex=False).str.replace("USD", "", regex=False)
+    # clean_number only rewrote the comma when there was exactly one, and a
+    # dot after it never parsed; both cases must stay invalid
+    rejected = text.str.contains(",.*[.,]")
+    numbers = text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False).mask(rejected)
+    try:
+        values[text_cells] = numbers.astype(np.float64)
+    except ValueError:
+        values[text_cells] = pd.to_numeric(numbers, errors="coerce")
+    other = ~is_text & ~blank
+    if other.any():
+        values[other] = pd.to_numeric(cells[other], errors="coerce")
+
+    invalid = np.isnan(values) & ~blank
+    return np.nan_to_num(values, nan=0.0), invalid
+
+def clean_number_column(series):
+    """
+    Column-wise clean_number.
+
+    Returns (values, invalid) where `invalid` marks cells that were not blank
+    but could not be parsed; those cells are 0.0 in `values`, as before.
+    """
+    values, invalid = _clean_numbers(series.reset_index(drop=True))
+    return pd.Series(values, index=series.index), pd.Series(invalid, index=series.index)
+
+def _clean_number_block(raw, columns):
+    """clean_number_column for several columns in one pass over their cells; (values, invalid) 2-D arrays"""
+    values, invalid = _clean_numbers(_cells(raw, columns))
+    shape = (len(raw), len(columns))
+    return values.reshape(shape), invalid.reshape(shape)
+
+def _date_text(series):
+    """Stripped text of the string cells, NaN for anything else"""
+    return series.where(_text_mask(series)).astype(object).str.strip()
+
+def parse_date_column(series):
+    """Column-wise parse_date; returns (datetimes, invalid)"""
+    # %y puts 00-68 in the 2000s, as strptime does
+    values = pd.to_datetime(_date_text(series), format="%d/%m/%y %H:%M:%S", errors="coerce")
+    return values, values.isna()
+
+def _report_invalid(invalid, table_name):
+    _report_invalid_counts(invalid.sum(), table_name)
+
+def _report_invalid_counts(counts, table_name):
+    counts = counts[counts > 0]
+    if not counts.empty:
+        logger.warning(f"{table_name}: {int(counts.sum())} unparseable cells ({', '.join(f'{col}: {int(n)}' for col, n in counts.items())})")
+
+def _typed_frames(columns, invalid, keep):
+    """The parsed and invalid DataFrames of the rows in `keep`"""
+    df = pd.DataFrame(columns)
+    invalid = pd.DataFrame(invalid)
+    if not keep.all():
+        df, invalid = df[keep], invalid[keep]
+    return df.reset_index(drop=True), invalid.reset_index(drop=True)
+
+# Below this many rows the fixed cost of the column operations outweighs
+# the per-cell work they save, and rows are converted cell by cell
+COLUMNWISE_MIN_ROWS = int(os.getenv('EXTRACT_COLUMNWISE_MIN_ROWS', '5000'))
+
+def _number_cell(value):
+    """clean_number for one cell; returns (value, invalid) instead of logging"""
+    if value is None or value == '-' or value == '':
+        return 0.0, False
+    try:
+        return _parse_number(value), False
+    except (ValueError, TypeError):
+        return 0.0, True
+
+def _date_cell(value):
+    """parse_date for one cell; returns (datetime or None, invalid)"""
+    if not isinstance(value, str):
+        return None, True
+    try:
+        return datetime.strptime(value.strip(), "%d/%m/%y %H:%M:%S"), False
+    except ValueError:
+        return None, True
+
+def _dividend_date_cell(value):
+    """
+    parse_dividend_date for one cell; returns (value, invalid). Unparseable
+    dates are kept as their stripped string, cells that are not text are None.
+    """
+    if not isinstance(value, str):
+        return None, False
+    text = value.strip()
+    try:
+        return _parse_dividend_datetime(text), False
+    except ValueError:
+        return text, True
+
+def _parse_cells(raw_rows, columns, numeric_columns, date_cell):
+    """
+    The per-cell conversion: date in the first column, numbers in
+    `numeric_columns`, stripped text elsewhere. Returns ({column: values},
+    {column: invalid}), marking the same cells as the column-wise parse.
+    """
+    width = len(columns)
+    padding = [None] * width
+    cells = list(zip(*[(list(row[:width]) + padding)[:width] for row in raw_rows])) or [()] * width
+    values = {}
+    invalid = {}
+    for column, column_cells in zip(columns, cells):
+        if column == columns[0]:
+            parsed = [date_cell(cell) for cell in column_cells]
+        elif column in numeric_columns:
+            parsed = [_number_cell(cell) for cell in column_cells]
+        else:
+            values[column] = [str(cell).strip() for cell in column_cells]
+            invalid[column] = np.zeros(len(column_cells), dtype=bool)
+            continue
+        values[column] = [value for value, _ in parsed]
+        invalid[column] = np.array([bad for _, bad in parsed], dtype=bool)
+    return values, invalid
+
+def _scalar_transaction_columns(raw_rows):
+    columns, invalid = _parse_cells(raw_rows, TRANSACTION_COLUMNS, TRANSACTION_NUMERIC_COLUMNS, _date_cell)
+    dates = pd.to_datetime(pd.Series(columns[TRANSACTION_COLUMNS[0]], dtype=object))
+    columns[TRANSACTION_COLUMNS[0]] = dates.to_numpy()
+    for column in TRANSACTION_COLUMNS[1:]:
+        columns[column] = np.array(columns[column], dtype=np.float64 if column in TRANSACTION_NUMERIC_COLUMNS else object)
+    return columns, invalid, dates.notna().to_numpy()
+
+def _columnwise_transaction_columns(raw_rows):
+    raw = pd.DataFrame([row[:12] for row in raw_rows], columns=TRANSACTION_COLUMNS, dtype=object)
+    text_columns = TRANSACTION_COLUMNS[1:6]
+    dates, invalid_dates = parse_date_column(raw[TRANSACTION_COLUMNS[0]])
+    text = _text_column(_cells(raw, text_columns)).to_numpy().reshape(len(raw), len(text_columns))
+    numbers, invalid_numbers = _clean_number_block(raw, TRANSACTION_NUMERIC_COLUMNS)
+
+    columns = {TRANSACTION_COLUMNS[0]: dates.to_numpy()}
+    invalid = {TRANSACTION_COLUMNS[0]: invalid_dates.to_numpy()}
+    for i, column in enumerate(text_columns):
+        columns[column] = text[:, i]
+        invalid[column] = np.zeros(len(raw), dtype=bool)
+    for i, column in enumerate(TRANSACTION_NUMERIC_COLUMNS):
+        columns[column] = numbers[:, i]
+        invalid[column] = invalid_numbers[:, i]
+    return columns, invalid, dates.notna().to_numpy()
+
+def parse_transaction_rows(raw_rows):
+    """
+    Convert raw investment table rows into a typed DataFrame, one pass per
+    column from COLUMNWISE_MIN_ROWS rows on and cell by cell below that.
+
+    Returns (df, invalid) where `invalid` is a boolean DataFrame of the same
+    shape marking cells that could not be parsed. Rows without a valid date
+    are dropped, as in the scalar path.
+    """
+    if len(raw_rows) >= COLUMNWISE_MIN_ROWS:
+        return _typed_frames(*_columnwise_transaction_columns(raw_rows))
+    return _typed_frames(*_scalar_transaction_columns(raw_rows))
+
+def parse_dividend_rows(raw_rows):
+    """
+    Dividend counterpart of parse_transaction_rows. Dividend tables are a
+    small fraction of a statement, so they are always converted cell by cell.
+    """
+    columns, invalid = _parse_cells(raw_rows, DIVIDEND_COLUMNS, DIVIDEND_NUMERIC_COLUMNS, _dividend_date_cell)
+    values = columns[DIVIDEND_COLUMNS[0]]
+    invalid_dates = invalid[DIVIDEND_COLUMNS[0]]
+    dates = pd.to_datetime(pd.Series([None if bad else value for value, bad in zip(values, invalid_dates)], dtype=object))
+    if invalid_dates.any():
+        # Like parse_dividend_date, unparseable dates keep their string so the row survives
+        dates = dates.astype(object)
+        dates[invalid_dates] = [value for value, bad in zip(values, invalid_dates) if bad]
+    columns[DIVIDEND_COLUMNS[0]] = dates.to_numpy()
+    columns[DIVIDEND_COLUMNS[1]] = np.array(columns[DIVIDEND_COLUMNS[1]], dtype=object)
+    for column in DIVIDEND_NUMERIC_COLUMNS:
+        columns[column] = np.array(columns[column], dtype=np.float64)
+    keep = dates.notna() & (dates.astype(str) != "")
+    return _typed_frames(columns, invalid, keep.to_numpy())
+
+def _has_content(row):
+    return any(cell and str(cell).strip() for cell in row)
+
+# Bump when the table detection/row collection changes (invalidates cached
+# raw rows) or when the parse stage changes (invalidates cached DataFrames).
+EXTRACTOR_VERSION = 2
+PARSER_VERSION = 2
+# Parsed frames depend on both stages, so an extractor bump invalidates them too
+PARSED_VERSION = f"{EXTRACTOR_VERSION}.{PARSER_VERSION}"
+
+# Page-parallel extraction. Pages are split into contiguous ranges so the
+# merged result is in the same order as a serial walk.
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', '0')) or (os.cpu_count() or 1)
+PARALLEL_MIN_PAGES = int(os.getenv('EXTRACT_PARALLEL_MIN_PAGES', '8'))
+
+_page_executor = None
+_page_executor_key = None
+
+def _get_page_executor(workers):
+    """Reuse one process pool per worker count for the life of the process"""
+    global _page_executor, _page_executor_key
+    key = (os.getpid(), workers)
+    if _page_executor is None or _page_executor_key != key:
+        if _page_executor is not None and _page_executor_key[0] == os.getpid():
+            _page_executor.shutdown(wait=False)
+        _page_executor = ProcessPoolExecutor(max_workers=workers)
+        _page_executor_key = key
+    return _page_executor
+
+@atexit.register
+def _shutdown_page_executor():
+    if _page_executor is not None and _page_executor_key[0] == os.getpid():
+        _page_executor.shutdown(wait=False, cancel_futures=True)
+
+DIVIDEND_TITLE = "TEMETTÜ İŞLEMLERİ"
+
+# Midas statements draw full cell borders, so the ruling-line strategies
+# work; short edges (underlines, glyph strokes) are ignored up front instead
+# of being intersected with every other edge.
+STATEMENT_TABLE_SETTINGS = {
+    "vertical_strategy": "lines",
+    "horizontal_strategy": "lines",
+    "snap_tolerance": 3,
+    "join_tolerance": 3,
+    "intersection_tolerance": 3,
+    "edge_min_length": 10,
+}
+
+# Room above the header text for the table's top border
+_SECTION_MARGIN = 10
+
+def _section_region(page, target_title_prefix):
+    """
+    Bounding box below the first section header on the page, or None if the
+    page has no transaction or dividend section.
+
+    Uses only the character layer, which is far cheaper than table finding.
+    A table is only used when its first cell holds one of the headers, so
+    pages without the header text cannot contribute rows.
+    """
+    text = "".join(char["text"] for char in page.chars).replace(" ", "")
+    titles = [title for title in (target_title_prefix, DIVIDEND_TITLE) if title.replace(" ", "") in text]
+    if not titles:
+        return None
+
+    x0, top, x1, bottom = page.bbox
+    tops = [match["top"] for title in titles for match in page.search(title, regex=False)]
+    if tops:
+        top = max(top, min(tops) - _SECTION_MARGIN)
+    return (x0, top, x1, bottom)
+
+def _collect_page_rows(page, page_num, target_title_prefix):
+    """Raw transaction and dividend rows from the tables on one page"""
+    rows_transaction = []
+    rows_dividend = []
+    metrics.count("pages")
+    with metrics.stage("section_scan"):
+        region = _section_region(page, target_title_prefix)
+    if region is None:
+        metrics.count("pages_skipped")
+        page_log.debug("No statement section on page %d, skipping", page_num)
+        return rows_transaction, rows_dividend
+
+    with metrics.stage("find_tables"):
+        tables = page.crop(region).extract_tables(STATEMENT_TABLE_SETTINGS)
+    metrics.count("tables", len(tables))
+    page_log.debug("Found %d tables on page %d", len(tables), page_num)
+
+    for table_num, table in enumerate(tables, 1):
+        if table and table[0] and len(table[0]) > 0 and table[0][0]:
+            page_log.debug("Processing table %d with header: '%s'", table_num, table[0][0])
+
+            # Process investment transactions
+            if target_title_prefix in table[0][0]:
+                page_log.debug("Found investment transactions table on page %d: %s", page_num, table[0][0])
+                rows = [row for row in table[2:] if len(row) >= 12 and _has_content(row)]
+                rows_transaction.extend(rows)
+                page_log.debug("Collected %d transaction rows from table %d", len(rows), table_num)
+
+            # Process dividend transactions
+            elif DIVIDEND_TITLE in table[0][0]:
+                page_log.debug("Found dividend transactions table on page %d: %s", page_num, table[0][0])
+                rows = [row for row in table[2:] if len(row) >= 5 and _has_content(row)]
+                rows_dividend.extend(rows)
+                page_log.debug("Collected %d dividend rows from table %d", len(rows), table_num)
+    metrics.count("raw_transaction_rows", len(rows_transaction))
+    metrics.count("raw_dividend_rows", len(rows_dividend))
+    return rows_transaction, rows_dividend
+
+def _extract_pages(pdf, start, stop, target_title_prefix):
+    """Raw (rows, rows_dividend) collected from pages [start, stop)"""
+    all_rows = []
+    all_rows_dividend = []
+    for page_num in range(start, stop):
+        page_log.debug("Processing page %d", page_num + 1)
+        rows, rows_dividend = _collect_page_rows(pdf.pages[page_num], page_num + 1, target_title_prefix)
+        all_rows.extend(rows)
+        all_rows_dividend.extend(rows_dividend)
+    return all_rows, all_rows_dividend
+
+def _extract_page_range(pdf_path, start, stop, target_title_prefix, with_metrics=False):
+    """
+    Process pool entry point: each worker opens the PDF on its own. Returns
+    (rows, rows_dividend, metrics dict or None).
+    """
+    with metrics.collect(with_metrics) as run:
+        with metrics.stage("open"):
+            pdf = pdfplumber.open(pdf_path)
+        with pdf:
+            rows, rows_dividend = _extract_pages(pdf, start, stop, target_title_prefix)
+    return rows, rows_dividend, run.to_dict() if run is not None else None
+
+def _page_ranges(page_count, workers):
+    """Split pages into contiguous ranges, a couple per worker to even out load"""
+    chunks = min(page_count, workers * 2)
+    size, extra = divmod(page_count, chunks)
+    ranges = []
+    start = 0
+    for i in range(chunks):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+def extract_raw_rows(pdf_path, target_title_prefix="YATIRIM İŞLEMLERİ", workers=None):
+    """
+    Collect the raw transaction and dividend table rows of a statement.
+
+    With more than one worker and at least PARALLEL_MIN_PAGES pages, page
+    ranges are read in a process pool and merged in page order; otherwise
+    pages are walked serially. Both paths return the same rows.
+    """
+    workers = EXTRACT_WORKERS if workers is None else max(1, int(workers))
+
+    with metrics.stage("open"):
+        pdf = pdfplumber.open(pdf_path)
+    with pdf:
+        page_count = len(pdf.pages)
+        logger.info(f"PDF opened successfully, processing {page_count} pages")
+        if workers <= 1 or page_count < max(PARALLEL_MIN_PAGES, 2):
+            with metrics.stage("pages"):
+                return _extract_pages(pdf, 0, page_count, target_title_prefix)
+
+    ranges = _page_ranges(page_count, workers)
+    logger.info(f"Extracting {page_count} pages in {len(ranges)} ranges with {workers} workers")
+    executor = _get_page_executor(workers)
+    run = metrics.active()
+    futures = [
+        executor.submit(_extract_page_range, pdf_path, start, stop, target_title_prefix, run is not None)
+        for start, stop in ranges
+    ]
+    all_rows = []
+    all_rows_dividend = []
+    with metrics.stage("pages"):
+        for future in futures:
+            rows, rows_dividend, worker_metrics = future.result()
+            all_rows.extend(rows)
+            all_rows_dividend.extend(rows_dividend)
+            if run is not None:
+                run.merge(worker_metrics)
+    return all_rows, all_rows_dividend
+
+def extract_pdf_rows(pdf_path, target_title_prefix="YATIRIM İŞLEMLERİ", workers=None):
+    """
+    Extract and parse a statement into (df, invalid, df_dividend, invalid_dividend).
+
+    Results are cached by file content: parsed frames under PARSED_VERSION
+    and the raw table rows under EXTRACTOR_VERSION, so a repeat upload skips
+    pdfplumber entirely and a parser change only re-runs the parse stage.
+    """
+    cache = get_statement_cache()
+    with metrics.stage("cache"):
+        digest = file_digest(pdf_path, target_title_prefix) if cache.enabled else None
+        if digest is not None:
+            parsed = cache.get(digest, "parsed", PARSED_VERSION)
+            raw = cache.get(digest, "raw", EXTRACTOR_VERSION) if parsed is None else None
+        else:
+            parsed = raw = None
+    if parsed is not None:
+        metrics.count("cache_hits")
+        return parsed
+
+    if raw is None:
+        if digest is not None:
+            metrics.count("cache_misses")
+        with metrics.stage("extract"):
+            raw = extract_raw_rows(pdf_path, target_title_prefix, workers)
+        if digest is not None:
+            with metrics.stage("cache"):
+                cache.put(digest, "raw", EXTRACTOR_VERSION, raw)
+    else:
+        metrics.count("cache_hits")
+
+    all_rows, all_rows_dividend = raw
+    with metrics.stage("parse"):
+        df, invalid = parse_transaction_rows(all_rows)
+        df_dividend, invalid_dividend = parse_dividend_rows(all_rows_dividend)
+    parsed = (df, invalid, df_dividend, invalid_dividend)
+    if digest is not None:
+        with metrics.stage("cache"):
+            cache.put(digest, "parsed", PARSED_VERSION, parsed)
+    return parsed
+
+# Streaming mode: rows are parsed and inserted in chunks of this many rows
+STREAM_CHUNK_ROWS = int(os.getenv('EXTRACT_STREAM_CHUNK_ROWS', '5000'))
+STREAMING_DEFAULT = os.getenv('EXTRACT_STREAMING', '0') == '1'
+
+def iter_page_rows(pdf_path, target_title_prefix="YATIRIM İŞLEMLERİ"):
+    """Yield raw (rows, rows_dividend) page by page, releasing each page's caches"""
+    with metrics.stage("open"):
+        pdf = pdfplumber.open(pdf_path)
+    with pdf:
+        logger.info(f"PDF opened successfully, streaming {len(pdf.pages)} pages")
+        for page_num, page in enumerate(pdf.pages, 1):
+            try:
+                page_rows = _collect_page_rows(page, page_num, target_title_prefix)
+            finally:
+                page.close()
+            yield page_rows
+
+def iter_parsed_chunks(pdf_path, target_title_prefix="YATIRIM İŞLEMLERİ", chunk_rows=None):
+    """
+    Yield parsed (df, invalid, df_dividend, invalid_dividend) chunks.
+
+    Raw rows are buffered only until `chunk_rows` is reached, so memory use
+    depends on the chunk size rather than on the statement length.
+    """
+    chunk_rows = max(1, chunk_rows or STREAM_CHUNK_ROWS)
+    rows = []
+    rows_dividend = []
+    for page_rows, page_rows_dividend in iter_page_rows(pdf_path, target_title_prefix):
+        rows.extend(page_rows)
+        rows_dividend.extend(page_rows_dividend)
+        if len(rows) + len(rows_dividend) >= chunk_rows:
+            with metrics.stage("parse"):
+                chunk = parse_transaction_rows(rows) + parse_dividend_rows(rows_dividend)
+            yield chunk
+            rows = []
+            rows_dividend = []
+    if rows or rows_dividend:
+        with metrics.stage("parse"):
+            chunk = parse_transaction_rows(rows) + parse_dividend_rows(rows_dividend)
+        yield chunk
+
+def _renumber(df, offset):
+    """Give chunk rows file-wide indices so insert failures point at the right row"""
+    df.index = pd.RangeIndex(offset, offset + len(df))
+    return df
+
+def stream_tables_and_save(pdf_path, user_id, target_title_prefix="YATIRIM İŞLEMLERİ", chunk_rows=None):
+    """
+    Bounded-memory variant of extract_tables_and_save.
+
+    Pages are read one at a time and each parsed chunk is inserted right
+    away; everything is committed once at the end, so a failure still leaves
+    the statement either fully saved or not at all. Bypasses the statement
+    cache and page-parallel extraction.
+    """
+    transaction_count = 0
+    dividend_count = 0
+    failed_batches = 0
+    invalid_counts = None
+    invalid_counts_dividend = None
+
+    with pooled_connection() as connection:
+        try:
+            for df, invalid, df_dividend, invalid_dividend in iter_parsed_chunks(pdf_path, target_title_prefix, chunk_rows):
+                invalid_counts = invalid.sum() if invalid_counts is None else invalid_counts + invalid.sum()
+                invalid_counts_dividend = (invalid_dividend.sum() if invalid_counts_dividend is None
+                                           else invalid_counts_dividend + invalid_dividend.sum())
+                metrics.count("chunks")
+                with metrics.stage("db_insert"):
+                    if not df.empty:
+                        report = bulk_insert_transactions(_renumber(df, transaction_count), user_id, connection=connection)
+                        failed_batches += len(report["failed_batches"])
+                        transaction_count += len(df)
+                    if not df_dividend.empty:
+                        report = bulk_insert_dividends(_renumber(df_dividend, dividend_count), user_id, connection=connection)
+                        failed_batches += len(report["failed_batches"])
+                        dividend_count += len(df_dividend)
+                logger.debug("Streamed %d transactions and %d dividends so far, peak RSS %s MB",
+                             transaction_count, dividend_count, peak_rss_mb())
+            with metrics.stage("db_insert"):
+                connection.commit()
+            metrics.count("db_round_trips")
+        except Exception:
+            connection.rollback()
+            raise
+
+    metrics.count("transaction_rows", transaction_count)
+    metrics.count("dividend_rows", dividend_count)
+    if invalid_counts is not None:
+        _report_invalid_counts(invalid_counts, "Transactions")
+        _report_invalid_counts(invalid_counts_dividend, "Dividends")
+    logger.info(f"Streamed {transaction_count} transaction rows and {dividend_count} dividend rows")
+    return transaction_count, dividend_count, failed_batches
+
+def _stream_and_save(pdf_path, user_id, target_title_prefix):
+    try:
+        transaction_count, dividend_count, failed_batches = stream_tables_and_save(pdf_path, user_id, target_title_prefix)
+    except Exception as e:
+        logger.error(f"Streaming extraction error: {str(e)}", exc_info=True)
+        return {
+            "success": False,
+            "error": f"PDF işleme hatası: {str(e)}",
+            "hasData": False
+        }
+
+    if failed_batches:
+        return {
+            "success": False,
+            "error": "Veritabanına işlemler kaydedilirken hata oluştu",
+            "hasData": True
+        }
+    if not transaction_count and not dividend_count:
+        return {
+            "success": True,
+            "message": f"{pdf_path} dosyasında işlem ve temettü verisi bulunamadı",
+            "hasData": False
+        }
+
+    success_messages = [name for name, count in (("işlemler", transaction_count), ("temettü verileri", dividend_count)) if count]
+    success_msg = f"{pdf_path} dosyasından {' ve '.join(success_messages)} başarıyla kaydedildi"
+    logger.info(success_msg)
+    return {
+        "success": True,
+        "message": success_msg,
+        "hasData": True
+    }
+
+def extract_tables_and_save(pdf_path, user_id, target_title_prefix="YATIRIM İŞLEMLERİ", workers=None, streaming=None):
+    """
+    Extract a statement and save its rows for `user_id`.
+
+    With `streaming` (default: EXTRACT_STREAMING=1) pages are processed one
+    at a time with bounded memory.
+    """
+    streaming = STREAMING_DEFAULT if streaming is None else streaming
+    with metrics.collect() as run:
+        if streaming and os.path.exists(pdf_path):
+            logger.info(f"Starting streaming extraction for PDF: {pdf_path}, User ID: {user_id}")
+            result = _stream_and_save(pdf_path, user_id, target_title_prefix)
+        else:
+            result = _extract_and_save(pdf_path, user_id, target_title_prefix, workers)
+    if run is not None:
+        result["metrics"] = metrics.report(run, "Extraction", logger)
+    return result
+
+def _extract_and_save(pdf_path, user_id, target_title_prefix, workers):
     logger.info(f"Starting extraction for PDF: {pdf_path}, User ID: {user_id}")
     try:
         #logger.info(f"Starting extraction from PDF: {pdf_path} for user: {user_id}")
@@ -108,52 +705,10 @@ def extract_tables_and_save(pdf_path, user_id, target_title_prefix="YATIRIM İŞ
                 "hasData": False
             }
 
-        all_rows = []
-        all_rows_dividend = []
-        
         # Extract data from PDF
         try:
             logger.info(f"Opening PDF with pdfplumber: {pdf_path}")
-            with pdfplumber.open(pdf_path) as pdf:
-                logger.info(f"PDF opened successfully, processing {len(pdf.pages)} pages")
-                for page_num, page in enumerate(pdf.pages, 1):
-                    logger.debug(f"Processing page {page_num}")
-                    tables = page.extract_tables()
-                    logger.debug(f"Found {len(tables)} tables on page {page_num}")
-                    
-                    for table_num, table in enumerate(tables, 1):
-                        if table and table[0] and len(table[0]) > 0 and table[0][0]:
-                            logger.debug(f"Processing table {table_num} with header: '{table[0][0]}'")
-                            
-                            # Process investment transactions
-                            if target_title_prefix in table[0][0]:
-                                logger.info(f"Found investment transactions table: {table[0][0]}")
-                                for row_idx, row in enumerate(table[2:], 2):
-                                    if len(row) >= 12 and any(cell and str(cell).strip() for cell in row):
-                                        cleaned_row = [
-                                            parse_date(row[0]) if i == 0 else
-                                            clean_number(row[i]) if i in [6,7,8,9,10,11] else
-                                            str(row[i]).strip()
-                                            for i in range(len(row))
-                                        ]
-                                        if cleaned_row[0]:
-                                            all_rows.append(cleaned_row)
-                                            logger.debug(f"Added transaction row {row_idx}: {cleaned_row[0]} - {cleaned_row[2]}")
-                            
-                            # Process dividend transactions
-                            elif "TEMETTÜ İŞLEMLERİ" in table[0][0]:
-                                logger.info(f"Found dividend transactions table: {table[0][0]}")
-                                for row_idx, row in enumerate(table[2:], 2):
-                                    if len(row) >= 5 and any(cell and str(cell).strip() for cell in row):
-                                        cleaned_row = [
-                                            parse_dividend_date(row[0]) if i == 0 else
-                                            clean_number(row[i]) if i in [2,3,4] else
-                                            str(row[i]).strip()
-                                            for i in range(len(row))
-                                        ]
-                                        if cleaned_row[0]:
-                                            all_rows_dividend.append(cleaned_row)
-                                            logger.debug(f"Added dividend row {row_idx}: {cleaned_row[0]} - {cleaned_row[1]}")
+            df, invalid, df_dividend, invalid_dividend = extract_pdf_rows(pdf_path, target_title_prefix, workers)
         except Exception as pdf_error:
             logger.error(f"PDF reading error: {str(pdf_error)}", exc_info=True)
             return {
@@ -162,21 +717,12 @@ def extract_tables_and_save(pdf_path, user_id, target_title_prefix="YATIRIM İŞ
                 "hasData": False
             }
 
-        # Define column names
-        columns = [
-            "Tarih", "İşlem Türü", "Sembol", "İşlem Tipi", "İşlem Durumu", "Para Birimi",
-            "Emir Adedi", "Emir Tutarı", "Gerçekleşen Adet", "Ortalama İşlem Fiyatı",
-            "İşlem Ücreti", "İşlem Tutarı"
-        ]
-        columns_dividend = [
-            "Ödeme Tarihi", "Sermaya Piyasası Aracı", "Brüt Temettü Tutarı", "Stopaj*", "Net Temettü Tutarı"
-        ]
-
-        # Create DataFrames
-        df = pd.DataFrame(all_rows, columns=columns)
-        df_dividend = pd.DataFrame(all_rows_dividend, columns=columns_dividend)
+        _report_invalid(invalid, "Transactions")
+        _report_invalid(invalid_dividend, "Dividends")
 
         logger.info(f"Extracted {len(df)} transaction rows and {len(df_dividend)} dividend rows")
+        metrics.count("transaction_rows", len(df))
+        metrics.count("dividend_rows", len(df_dividend))
 
         success_messages = []
 
@@ -184,7 +730,9 @@ def extract_tables_and_save(pdf_path, user_id, target_title_prefix="YATIRIM İŞ
         if not df.empty:
             try:
                 logger.info(f"Inserting {len(df)} transactions into database")
-                if not insert_transactions(df, user_id):
+                with metrics.stage("db_insert"):
+                    inserted = insert_transactions(df, user_id)
+                if not inserted:
                     logger.error("Failed to insert transactions into database")
                     return {
                         "success": False,
@@ -205,7 +753,9 @@ def extract_tables_and_save(pdf_path, user_id, target_title_prefix="YATIRIM İŞ
         if not df_dividend.empty:
             try:
                 logger.info(f"Inserting {len(df_dividend)} dividend records into database")
-                if not insert_dividends(df_dividend, user_id):
+                with metrics.stage("db_insert"):
+                    inserted = insert_dividends(df_dividend, user_id)
+                if not inserted:
                     logger.error("Failed to insert dividend data into database")
                     return {
                         "success": False,
@@ -0,0 +1,152 @@
+"""
+Long-lived extraction worker.
+
+Keeps pandas, pdfplumber, psycopg2 and the connection pool loaded and
+processes statement PDFs sent as NDJSON jobs, one JSON object per line:
+
+    {"id": "1", "pdf_path": "/abs/path/statement.pdf", "user_id": "..."}
+
+Each job is answered with one line holding the usual extract_tables result
+plus the job id:
+
+    {"id": "1", "success": true, "message": "...", "hasData": true}
+
+A job with "pdf_paths" instead of "pdf_path" runs extract_batch for all of
+the files in one transaction and answers with per-file "results". Before
+that answer, a progress line is written as each file's extraction finishes
+(see extract_batch_and_save for the fields):
+
+    {"id": "1", "event": "file", "index": 0, "file": "...", "final": false, "message": "..."}
+
+After a user's data was changed elsewhere (e.g. reset-data),
+
+    {"id": "2", "action": "refresh_history", "user_id": "..."}
+
+rebuilds their history snapshot (history_snapshot.py), or removes it if
+nothing is left.
+
+Usage:
+    python extract_worker.py                   # jobs on stdin, results on stdout
+    python extract_worker.py --socket PATH     # jobs over a local Unix socket
+"""
+
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+
+from logger import get_logger, set_console_stream
+
+# stdout carries the NDJSON protocol, so console logging has to go elsewhere
+# before any other module sets up its logger
+set_console_stream(sys.stderr)
+
+from extract_tables import extract_tables_and_save
+from extract_batch import extract_batch_and_save
+from history_snapshot import refresh_history_snapshot
+
+logger = get_logger('extract_worker')
+
+
+def handle_job(line, emit=None):
+    """
+    Run one NDJSON job line and return the result dict. Progress lines of
+    batch jobs are passed to `emit`, if given.
+    """
+    try:
+        job = json.loads(line)
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid job line: {line!r}")
+        return {"id": None, "success": False, "error": f"Geçersiz iş tanımı: {e}", "hasData": False}
+
+    job_id = job.get("id")
+    if job.get("action") == "refresh_history":
+        return _refresh_history(job_id, job.get("user_id"))
+
+    pdf_path = job.get("pdf_path")
+    pdf_paths = job.get("pdf_paths")
+    user_id = job.get("user_id")
+    if not (pdf_path or pdf_paths) or not user_id:
+        return {"id": job_id, "success": False, "error": "pdf_path ve user_id gerekli", "hasData": False}
+
+    try:
+        if pdf_paths:
+            logger.info(f"Job {job_id}: processing {len(pdf_paths)} files for user {user_id}")
+            on_progress = None
+            if emit is not None:
+                on_progress = lambda event: emit({"id": job_id, "event": "file", **event})
+            result = extract_batch_and_save(pdf_paths, user_id, on_progress=on_progress)
+        else:
+            logger.info(f"Job {job_id}: processing {pdf_path} for user {user_id}")
+            result = extract_tables_and_save(pdf_path, user_id)
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {str(e)}", exc_info=True)
+        result = {"success": False, "error": f"PDF işleme hatası: {str(e)}", "hasData": False}
+    return {"id": job_id, **result}
+
+
+def _refresh_history(job_id, user_id):
+    if not user_id:
+        return {"id": job_id, "success": False, "error": "user_id gerekli"}
+    logger.info(f"Job {job_id}: refreshing the history snapshot of user {user_id}")
+    snapshot = refresh_history_snapshot(user_id)
+    return {"id": job_id, "success": True, "hasData": snapshot is not None}
+
+
+def serve_stream(input_stream, output_stream):
+    """Answer jobs from `input_stream` until EOF"""
+    def write(message):
+        output_stream.write(json.dumps(message, ensure_ascii=False) + "\n")
+        output_stream.flush()
+
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+        write(handle_job(line, write))
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for raw in self.rfile:
+            line = raw.decode("utf-8").strip()
+            if not line:
+                continue
+            self._write(handle_job(line, self._write))
+
+    def _write(self, message):
+        self.wfile.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+
+def serve_socket(path):
+    """Accept jobs over a Unix socket; each connection may send many jobs"""
+    if os.path.exists(path):
+        os.unlink(path)
+    with socketserver.ThreadingUnixStreamServer(path, _JobHandler) as server:
+        server.daemon_threads = True
+        logger.info(f"Extraction worker listening on {path}")
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived PDF extraction worker")
+    parser.add_argument("--socket", help="listen on this Unix socket path instead of stdin")
+    args = parser.parse_args()
+
+    if sys.platform.startswith('win'):
+        sys.stdin.reconfigure(encoding='utf-8')
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    if args.socket:
+        # Make SIGTERM unwind normally so the socket file is removed
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        serve_socket(args.socket)
+    else:
+        logger.info("Extraction worker reading jobs from stdin")
+        serve_stream(sys.stdin, sys.stdout)
@@ -0,0 +1,212 @@
+"""
+Array-based FIFO lot matching.
+
+Each symbol's open lots live in contiguous NumPy arrays (quantity, TRY cost,
+buy month index) together with the running total of quantities bought.
+Because lots are consumed strictly in order, everything sold so far is a
+single scalar `consumed`, and the lots touched by a sale are found with a
+binary search of the cumulative quantities instead of popping a queue.
+
+All trades of a symbol are resolved in one pass, however its buys and
+sells interleave: the buys are appended first, and each sell is limited to
+the quantity bought before it. What has been consumed after each sell is
+then a clamped running sum, computed with a running minimum, so the
+(sell, lot) pairs of every sale are generated at once and the inflation
+adjustment is applied to all of them in one vectorized call.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class LotBook:
+    """Open buy lots of one symbol"""
+
+    def __init__(self, capacity=16):
+        self._size = 0
+        self._quantity = np.empty(capacity)
+        self._cost = np.empty(capacity)
+        self._month = np.empty(capacity, dtype=np.int64)
+        # Cumulative quantity bought up to and including / before each lot
+        self._end = np.empty(capacity)
+        self._start = np.empty(capacity)
+        self.consumed = 0.0
+
+    @property
+    def total(self):
+        return self._end[self._size - 1] if self._size else 0.0
+
+    @property
+    def lot_count(self):
+        return self._size
+
+    @property
+    def remaining(self):
+        return self.total - self.consumed
+
+    def _grow(self, needed):
+        capacity = len(self._quantity)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("_quantity", "_cost", "_month", "_end", "_start"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add(self, quantities, costs, months):
+        """Append buy lots in order"""
+        quantities = np.asarray(quantities, dtype=np.float64)
+        count = len(quantities)
+        if not count:
+            return
+        self._grow(self._size + count)
+        at = slice(self._size, self._size + count)
+        ends = self.total + np.cumsum(quantities)
+        self._quantity[at] = quantities
+        self._cost[at] = costs
+        self._month[at] = months
+        self._end[at] = ends
+        self._start[at] = ends - quantities
+        self._size += count
+
+    def ends(self, lot_counts):
+        """Cumulative quantity of the first `lot_counts` lots (0 for none)"""
+        lot_counts = np.asarray(lot_counts, dtype=np.int64)
+        return np.where(lot_counts > 0, self._end[np.maximum(lot_counts, 1) - 1], 0.0)
+
+    def consume(self, quantities, available=None):
+        """
+        Match sells, in order, against the open lots.
+
+        `available` is, per sell, the cumulative quantity bought before it
+        (see `ends`), so sells interleaved with buys that were already added
+        only draw from lots bought earlier; by default every lot is
+        available.
+
+        Returns (has_lots, pair_sell, pair_lot, pair_quantity): `has_lots`
+        marks sells that found at least one open lot; each pair is a sell
+        position, the lot it drew from and the quantity taken. Quantity sold
+        beyond the open lots is dropped and negative quantities sell
+        nothing, as in the queue based engine.
+        """
+        quantities = np.maximum(np.asarray(quantities, dtype=np.float64), 0)
+        if available is None:
+            available = np.full(len(quantities), self.total)
+        if not len(quantities):
+            empty = np.empty(0, dtype=np.int64)
+            return np.empty(0, dtype=bool), empty, empty, np.empty(0)
+
+        # consumed[k] = min(consumed[k - 1] + quantity[k], available[k]).
+        # With sold = cumsum(quantity), consumed - sold only ever decreases,
+        # to available - sold where the clamp applies: a running minimum.
+        sold = np.cumsum(quantities)
+        limit = available - sold
+        slack = np.minimum.accumulate(np.minimum(limit, self.consumed))
+        # Exactly `available` where the clamp applies, so a book that was
+        # emptied compares equal to it
+        hi = np.where(slack == limit, available, sold + slack)
+        lo = np.empty_like(hi)
+        lo[0] = self.consumed
+        lo[1:] = hi[:-1]
+        self.consumed = float(hi[-1])
+
+        has_lots = lo < available
+        ends = self._end[:self._size]
+        first = np.searchsorted(ends, lo, side="right")
+        last = np.searchsorted(ends, hi, side="left")
+        counts = np.where(hi > lo, last - first + 1, 0)
+
+        pair_sell = np.repeat(np.arange(len(quantities)), counts)
+        offsets = np.cumsum(counts) - counts
+        pair_lot = first[pair_sell] + (np.arange(len(pair_sell)) - offsets[pair_sell])
+        pair_quantity = (np.minimum(self._end[pair_lot], hi[pair_sell])
+                         - np.maximum(self._start[pair_lot], lo[pair_sell]))
+        return has_lots, pair_sell, pair_lot, pair_quantity
+
+    def open_lots(self):
+        """(quantities, costs, months) of the lots not fully sold yet, oldest first"""
+        ends = self._end[:self._size]
+        first = int(np.searchsorted(ends, self.consumed, side="right"))
+        quantities = ends[first:] - np.maximum(self._start[first:self._size], self.consumed)
+        return quantities, self._cost[first:self._size].copy(), self._month[first:self._size].copy()
+
+    @classmethod
+    def from_lots(cls, quantities, costs, months):
+        """Rebuild a book holding only the given open lots"""
+        book = cls(max(16, len(quantities)))
+        book.add(quantities, costs, months)
+        return book
+
+    def costs(self, lots):
+        return self._cost[lots]
+
+    def months(self, lots):
+        return self._month[lots]
+
+
+def match_fifo(symbols, is_buy, quantities, prices, months, inflation_series, threshold, books=None):
+    """
+    FIFO-match trades given in processing order.
+
+    `prices` are per-unit TRY prices and `months` flat month indices of the
+    trade date; for sells the inflation window ends at `months - 1`, the
+    month before the sale. Buys with a non-positive quantity are ignored.
+
+    `books` may hold LotBooks from an earlier run, which are continued
+    in place; symbols not in it start empty.
+
+    Returns (sale_profit, books): `sale_profit` has one entry per trade,
+    NaN for buys and for sells that found no open lot; `books` maps each
+    symbol to its LotBook after matching.
+    """
+    symbols = np.asarray(symbols, dtype=object)
+    is_buy = np.asarray(is_buy, dtype=bool)
+    quantities = np.asarray(quantities, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64)
+    months = np.asarray(months, dtype=np.int64)
+
+    sale_profit = np.full(len(symbols), np.nan)
+    books = {} if books is None else books
+    codes, uniques = pd.factorize(symbols)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+    for code, symbol in enumerate(uniques):
+        rows = order[bounds[code]:bounds[code + 1]]
+        book = books.get(symbol)
+        if book is None:
+            book = books[symbol] = LotBook()
+        side = is_buy[rows]
+        kept = side & (quantities[rows] > 0)
+        lots_before = book.lot_count
+        buys = rows[kept]
+        book.add(quantities[buys], prices[buys], months[buys])
+
+        sells = rows[~side]
+        if not len(sells):
+            continue
+        # Lots bought before each sell, counting those of earlier runs
+        available = book.ends(lots_before + np.cumsum(kept)[~side])
+        has_lots, pair_sell, pair_lot, pair_quantity = book.consume(quantities[sells], available)
+        factors = inflation_series.adjustment_factors(
+            book.months(pair_lot), months[sells][pair_sell] - 1, threshold
+        )
+        pair_profit = (prices[sells][pair_sell] - book.costs(pair_lot) * factors) * pair_quantity
+        profit = np.bincount(pair_sell, weights=pair_profit, minlength=len(sells))
+        sale_profit[sells[has_lots]] = profit[has_lots]
+
+    return sale_profit, books
+
+
+def summarize(symbols, sale_profit):
+    """Per-symbol totals (in order of first matched sale) and the profit/loss split"""
+    matched = np.flatnonzero(~np.isnan(sale_profit))
+    profits = sale_profit[matched]
+    by_symbol = pd.Series(profits).groupby(np.asarray(symbols, dtype=object)[matched], sort=False).sum()
+    profit_loss = {symbol: float(total) for symbol, total in by_symbol.items()}
+    net_profit = float(profits[profits > 0].sum())
+    net_loss = float(profits[profits <= 0].sum())
+    return profit_loss, net_profit, net_loss
@@ -0,0 +1,180 @@
+"""
+Persisted FIFO state between tax calculations.
+
+After each run the open lots of every symbol, the accumulated results and a
+watermark (date, id) of the last processed transaction are saved in the
+FifoSnapshot table. The next run only replays transactions after the
+watermark.
+
+A snapshot is only trusted if the user's transactions at or before the
+watermark are exactly the ones it was built from, checked by their count and
+the sum of their ids, and if the exchange rates and Yİ-ÜFE values they were
+valued with are unchanged, checked by a digest of those rows. A back-dated
+insert, a deleted transaction, a corrected rate or a newly published index
+month changes one of these, so the snapshot is dropped and the history is
+replayed in full.
+
+Besides the all-time totals the state keeps one bucket per calendar year
+(sale profits by the year of the sale, fees by the year of the
+transaction), so the result of any tax year is available without another
+replay.
+"""
+
+import numpy as np
+
+from db_connection import (
+    get_fifo_snapshot, save_fifo_snapshot, delete_fifo_snapshot, get_fifo_snapshot_fingerprint
+)
+from fifo_engine import LotBook
+from get_dolar import MAX_FALLBACK_DAYS
+
+# Bump whenever the stored state or the matching rules change
+SNAPSHOT_VERSION = 3
+
+
+class FifoState:
+    """Open lots, accumulated results and commissions up to a watermark"""
+
+    def __init__(self):
+        self.books = {}
+        self.profit_loss = {}
+        self.net_profit = 0.0
+        self.net_loss = 0.0
+        self.commission = 0.0
+        self.years = {}
+        self.watermark = None
+        self.transaction_count = 0
+        self.transaction_id_sum = 0
+
+    def year(self, year):
+        """The totals bucket of a calendar year, created empty on first use"""
+        bucket = self.years.get(year)
+        if bucket is None:
+            bucket = self.years[year] = {
+                "profit_loss": {}, "net_profit": 0.0, "net_loss": 0.0, "commission": 0.0
+            }
+        return bucket
+
+    def advance(self, transactions):
+        """Move the watermark past a TransactionArray given in (date, id) order"""
+        if not len(transactions):
+            return
+        self.watermark = transactions.watermark()
+        self.transaction_count += len(transactions)
+        self.transaction_id_sum += int(transactions.rows["id"].sum())
+
+    def to_json(self):
+        symbols = {}
+        for symbol, book in self.books.items():
+            quantities, costs, months = book.open_lots()
+            if len(quantities):
+                symbols[symbol] = {
+                    "quantity": quantities.tolist(),
+                    "cost": costs.tolist(),
+                    "month": months.tolist(),
+                }
+        return {
+            "symbols": symbols,
+            "profit_loss": self.profit_loss,
+            "net_profit": self.net_profit,
+            "net_loss": self.net_loss,
+            "commission": self.commission,
+            "years": {str(year): bucket for year, bucket in self.years.items()},
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        state = cls()
+        data = row['state']
+        for symbol, lots in data["symbols"].items():
+            state.books[symbol] = LotBook.from_lots(
+                np.array(lots["quantity"], dtype=np.float64),
+                np.array(lots["cost"], dtype=np.float64),
+                np.array(lots["month"], dtype=np.int64),
+            )
+        state.profit_loss = {symbol: float(value) for symbol, value in data["profit_loss"].items()}
+        state.net_profit = float(data["net_profit"])
+        state.net_loss = float(data["net_loss"])
+        state.commission = float(data["commission"])
+        for year, bucket in data["years"].items():
+            state.years[int(year)] = {
+                "profit_loss": {symbol: float(value) for symbol, value in bucket["profit_loss"].items()},
+                "net_profit": float(bucket["net_profit"]),
+                "net_loss": float(bucket["net_loss"]),
+                "commission": float(bucket["commission"]),
+            }
+        state.watermark = (row['watermarkDate'], row['watermarkId'])
+        state.transaction_count = int(row['transactionCount'])
+        state.transaction_id_sum = int(row['transactionIdSum'])
+        return state
+
+
+def is_current(row):
+    """Whether a snapshot row was written with the current SNAPSHOT_VERSION"""
+    if row['version'] != SNAPSHOT_VERSION:
+        print(f"♻️  FIFO snapshot version {row['version']} is outdated, replaying full history")
+        return False
+    return True
+
+
+def matches_fingerprint(row, fingerprint):
+    """
+    Whether the (count, sum of ids, rates digest) of get_fifo_snapshot_fingerprint
+    are the ones the snapshot was built from
+    """
+    count, id_sum, rates_digest = fingerprint
+    if (count, id_sum) != (int(row['transactionCount']), int(row['transactionIdSum'])):
+        print("♻️  Transactions before the FIFO snapshot changed, replaying full history")
+        return False
+    if rates_digest != row['ratesDigest']:
+        print("♻️  Exchange rates or Yİ-ÜFE values before the FIFO snapshot changed, replaying full history")
+        return False
+    return True
+
+
+def matches_state(state, fingerprint):
+    """
+    Whether the transactions up to the watermark of a freshly computed state
+    are still the ones it applied; a back-dated insert that committed during
+    the calculation would otherwise be hidden behind the watermark
+    """
+    if fingerprint[:2] != (state.transaction_count, state.transaction_id_sum):
+        print("⚠️  Transactions changed during the calculation, not saving the FIFO snapshot")
+        return False
+    return True
+
+
+def load_snapshot(user_id):
+    """The user's saved FifoState, or None if there is none or it is stale"""
+    try:
+        row = get_fifo_snapshot(user_id)
+        if row is None:
+            return None
+        watermark = (row['watermarkDate'], row['watermarkId'])
+        valid = is_current(row) and matches_fingerprint(
+            row, get_fifo_snapshot_fingerprint(user_id, watermark, MAX_FALLBACK_DAYS)
+        )
+        if not valid:
+            delete_fifo_snapshot(user_id)
+    except Exception as e:
+        print(f"⚠️  Could not read FIFO snapshot: {e}")
+        return None
+    if not valid:
+        return None
+
+    return FifoState.from_row(row)
+
+
+def store_snapshot(user_id, state):
+    if state.watermark is None:
+        return
+    try:
+        fingerprint = get_fifo_snapshot_fingerprint(user_id, state.watermark, MAX_FALLBACK_DAYS)
+        if not matches_state(state, fingerprint):
+            return
+        save_fifo_snapshot(
+            user_id, SNAPSHOT_VERSION, state.watermark,
+            state.transaction_count, state.transaction_id_sum, fingerprint[2], state.to_json()
+        )
+    except Exception as e:
+        print(f"⚠️  Could not save FIFO snapshot: {e}")
@@ -1,27 +1,32 @@
-from db_connection import get_user_transactions
-from get_dolar import get_dolar
+import numpy as np
+
+from db_connection import get_user_transactions_since
+from get_dolar import usd_rates
+
+
+def fees_in_try(transactions, rates):
+    """
+    Fee of every row of a TransactionArray in TRY. `rates` is aligned with
+    the rows (see get_dolar.usd_rates); fees without a usable rate stay
+    unconverted.
+    """
+    fees = transactions.rows["fee"].copy()
+    convert = ~np.isnan(rates) & (rates != 0)
+    fees[convert] *= rates[convert]
+    return fees
+
+
+def commission_in_try(transactions, rates):
+    """Total transaction fees in TRY, see fees_in_try"""
+    return float(fees_in_try(transactions, rates).sum())
+
 
 def get_commissions_db(user_id):
     try:
-        transactions = get_user_transactions(user_id)
+        transactions = get_user_transactions_since(user_id)
         if not transactions:
             return 0.0
-            
-        total_commission = 0.0
-        
-        for transaction in transactions:
-            commission = transaction.get('transactionFee', 0.0)
-            if isinstance(commission, (int, float)):
-                # Convert commission to TRY if the transaction is in USD
-                if transaction.get('currency') == 'USD':
-                    date = transaction.get('date')
-                    formatted_date = date.strftime("%d.%m.%Y")
-                    exchange_rate = get_dolar(formatted_date)
-                    if exchange_rate:
-                        commission = float(commission) * exchange_rate
-                total_commission += float(commission)
-        
-        return total_commission
+        return commission_in_try(transactions, usd_rates(transactions))
         
     except Exception as e:
         return 0.0
@@ -1,30 +1,194 @@
-from db_connection import get_db_connection
+import threading
+from datetime import date, datetime
+
+import numpy as np
+
+from db_connection import pooled_connection
+
+# Bayram holidays can close the market for up to nine days in a row, so a
+# lookup may walk back at most this far before we treat the rate as missing.
+MAX_FALLBACK_DAYS = 15
+
+# One row per day in ascending order, the one with the highest id where a day
+# has several, as the SQL rate joins pick it (db_connection._USD_RATE_JOIN).
+# Dates come from the indexed "rateDate" column, so loading is a single scan
+# with no per-row date parsing however many years of rates the table holds.
+RATES_QUERY = (
+    'SELECT DISTINCT ON ("rateDate") "rateDate", "dovizAlis" FROM "Dolar" '
+    'WHERE "rateDate" IS NOT NULL AND "dovizAlis" IS NOT NULL '
+    'ORDER BY "rateDate", id DESC'
+)
+
+
+def _to_ordinal(tarih):
+    """Convert a DD.MM.YYYY string, date or datetime to a proleptic ordinal"""
+    if isinstance(tarih, datetime):
+        return tarih.date().toordinal()
+    if isinstance(tarih, date):
+        return tarih.toordinal()
+    return datetime.strptime(str(tarih).strip(), "%d.%m.%Y").date().toordinal()
+
+
+class DolarRateTable:
+    """
+    In-memory copy of the Dolar table.
+
+    Rates are kept in two parallel NumPy arrays sorted by date, so a lookup is
+    a binary search instead of a database round trip. Dates without a
+    published rate (weekends, holidays) resolve to the most recent prior rate.
+    """
+
+    def __init__(self, max_fallback_days=MAX_FALLBACK_DAYS):
+        self.max_fallback_days = max_fallback_days
+        self._ordinals = np.empty(0, dtype=np.int64)
+        self._rates = np.empty(0, dtype=np.float64)
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_rows(cls, rows, max_fallback_days=MAX_FALLBACK_DAYS):
+        """Build a table from (gecerliOlduguTarih, dovizAlis) pairs"""
+        table = cls(max_fallback_days)
+        table._set_rows(rows)
+        return table
+
+    @classmethod
+    def from_dated_rows(cls, rows, max_fallback_days=MAX_FALLBACK_DAYS):
+        """Build a table from RATES_QUERY rows: (date, dovizAlis) on distinct days in ascending order"""
+        table = cls(max_fallback_days)
+        table._set_dated_rows(rows)
+        return table
+
+    def _set_dated_rows(self, rows):
+        if rows:
+            days, rates = zip(*rows)
+            self._ordinals = np.fromiter(map(date.toordinal, days), dtype=np.int64, count=len(days))
+            self._rates = np.array(rates, dtype=np.float64)
+        else:
+            self._ordinals = np.empty(0, dtype=np.int64)
+            self._rates = np.empty(0, dtype=np.float64)
+        self._loaded = True
+
+    def _set_rows(self, rows):
+        by_ordinal = {}
+        for tarih, rate in rows:
+            if rate is None:
+                continue
+            try:
+                by_ordinal[_to_ordinal(tarih)] = float(rate)
+            except (ValueError, TypeError):
+                print(f"⚠️  Skipping malformed exchange rate row: {tarih} -> {rate}")
+
+        ordinals = np.fromiter(by_ordinal.keys(), dtype=np.int64, count=len(by_ordinal))
+        rates = np.fromiter(by_ordinal.values(), dtype=np.float64, count=len(by_ordinal))
+        order = np.argsort(ordinals)
+        self._ordinals = ordinals[order]
+        self._rates = rates[order]
+        self._loaded = True
+
+    def to_arrays(self):
+        """(ordinals, rates) of the loaded table, e.g. to hand to worker processes"""
+        self._ensure_loaded()
+        return self._ordinals, self._rates
+
+    def load_arrays(self, ordinals, rates):
+        """Install rates exported by `to_arrays` instead of querying the database"""
+        with self._lock:
+            self._ordinals = np.asarray(ordinals, dtype=np.int64)
+            self._rates = np.asarray(rates, dtype=np.float64)
+            self._loaded = True
+
+    def refresh(self):
+        """Reload every rate from the database"""
+        with pooled_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(RATES_QUERY)
+                rows = cursor.fetchall()
+
+        with self._lock:
+            self._set_dated_rows(rows)
+        print(f"💱 Loaded {len(self._rates)} exchange rates")
+
+    def invalidate(self):
+        """Drop the loaded rates; the next lookup reloads them"""
+        with self._lock:
+            self._ordinals = np.empty(0, dtype=np.int64)
+            self._rates = np.empty(0, dtype=np.float64)
+            self._loaded = False
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.refresh()
+
+    def __len__(self):
+        return len(self._rates)
+
+    def lookup(self, tarih):
+        """Return the rate valid on `tarih`, falling back to the last prior rate"""
+        self._ensure_loaded()
+        ordinal = _to_ordinal(tarih)
+        pos = int(np.searchsorted(self._ordinals, ordinal, side="right")) - 1
+        if pos < 0 or ordinal - self._ordinals[pos] > self.max_fallback_days:
+            return None
+        return float(self._rates[pos])
+
+    def lookup_many(self, dates):
+        """
+        Vectorized lookup; returns an array with NaN where no rate applies.
+        Each distinct day is resolved once, however many dates share it.
+        """
+        return self.lookup_ordinals(np.fromiter((_to_ordinal(d) for d in dates), dtype=np.int64))
+
+    def lookup_ordinals(self, ordinals):
+        """lookup_many for an array of date.toordinal() values"""
+        self._ensure_loaded()
+        days, inverse = np.unique(ordinals, return_inverse=True)
+        pos = np.searchsorted(self._ordinals, days, side="right") - 1
+        rates = np.full(len(days), np.nan)
+        valid = pos >= 0
+        valid[valid] = days[valid] - self._ordinals[pos[valid]] <= self.max_fallback_days
+        rates[valid] = self._rates[pos[valid]]
+        return rates[inverse]
+
+
+_rate_table = DolarRateTable()
+
+
+def get_rate_table():
+    """Return the process-wide exchange rate table"""
+    return _rate_table
+
+
+def refresh_rates():
+    _rate_table.refresh()
+
+
+def invalidate_rates():
+    _rate_table.invalidate()
+
+
+def usd_rates(transactions):
+    """
+    USD/TRY rate for each row of a TransactionArray, NaN for non-USD rows
+    and for dates without a rate. One lookup covers the whole set.
+    """
+    rates = np.full(len(transactions), np.nan)
+    usd = transactions.rows["usd"]
+    if usd.any():
+        rates[usd] = _rate_table.lookup_ordinals(transactions.day_ordinals()[usd])
+    return rates
+
 
 def get_dolar(tarih):
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
-        print(f"\n🔍 Looking up exchange rate for date: {tarih}")
-        # Query to find the exchange rate for the given date
-        query = "SELECT dovizAlis FROM Dolar WHERE gecerliOlduguTarih = %s"
-        cursor.execute(query, (tarih,))
-        
-        result = cursor.fetchone()
-        
-        if result:
-            rate = result['dovizAlis']
-            print(f"💱 Exchange rate found: {rate}")
-            return rate
-        else:
+        rate = _rate_table.lookup(tarih)
+        if rate is None:
             print(f"⚠️  No exchange rate found for date: {tarih}")
-            return None
-            
+        return rate
     except Exception as e:
         print(f"\n❌ Error getting exchange rate: {e}")
         return None
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'connection' in locals():
-            connection.close()
\ No newline at end of file
@@ -0,0 +1,351 @@
+"""
+Per-user columnar snapshot of the transaction and dividend history.
+
+A user's transactions (TAX_COLUMNS with the USD/TRY rate joined, as a
+TransactionArray) and dividends (with the rate of their payment day) are
+written as .npy files under HISTORY_SNAPSHOT_DIR/<user id>/ and loaded
+memory-mapped, so a recalculation reads them in place instead of pulling
+the whole history out of PostgreSQL.
+
+A snapshot is only used while get_user_history_fingerprint(), a single
+aggregate query, still matches the one it was built with, so changed rows
+or exchange rates within the user's history are never read stale.
+Uploads (extract_tables, extract_batch) therefore leave the snapshot as
+it is; the next calculation finds it out of date and rebuilds it once
+(current_history_snapshot), however many statements came in meanwhile.
+After reset-data the extraction worker's "refresh_history" job rebuilds
+it right away, or removes it if nothing is left.
+
+The files of one build are named after a build stamp and meta.json, which
+names the current stamp, is replaced atomically: readers never see half a
+build, and memory maps of an older build stay valid until released.
+Builds and deletes of one user hold an exclusive lock on
+HISTORY_SNAPSHOT_DIR/<user id>.lock, so concurrent rebuilds (two uploads,
+or an upload and a reset) run one after the other and never remove each
+other's files.
+
+Usage: python history_snapshot.py rebuild <user_id> [...] | --all
+       python history_snapshot.py delete <user_id> [...]
+       python history_snapshot.py info <user_id>
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import numpy as np
+
+import metrics
+from db_connection import (
+    get_user_history_fingerprint, get_user_ids_with_transactions,
+    stream_user_transaction_chunks, stream_user_dividends_with_rates
+)
+from get_dolar import MAX_FALLBACK_DAYS
+from logger import get_logger
+from transaction_array import TRANSACTION_DTYPE, TransactionArray
+
+logger = get_logger('history_snapshot')
+
+SNAPSHOT_DIR = os.getenv(
+    'HISTORY_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'history')
+)
+SNAPSHOTS_ENABLED = os.getenv('HISTORY_SNAPSHOTS', '1') != '0'
+
+# Bump whenever the file layout or one of the dtypes changes
+SNAPSHOT_VERSION = 1
+
+DIVIDEND_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("date", "datetime64[us]"),  # paymentDate
+    ("symbol", np.int32),        # index into HistorySnapshot.dividend_symbols
+    ("gross", np.float64),
+    ("tax", np.float64),
+    ("net", np.float64),
+    ("rate", np.float64),        # USD/TRY rate of the payment day, NaN where none
+])
+
+
+class HistorySnapshot:
+    """A user's history as loaded from disk; the arrays are read-only memory maps"""
+
+    __slots__ = ("transactions", "dividends", "dividend_symbols", "fingerprint", "built_at")
+
+    def __init__(self, transactions, dividends, dividend_symbols, fingerprint, built_at=None):
+        self.transactions = transactions
+        self.dividends = dividends
+        self.dividend_symbols = dividend_symbols
+        self.fingerprint = fingerprint
+        self.built_at = built_at
+
+
+def dividend_array(rows, symbols=None):
+    """Structured DIVIDEND_DTYPE array of db_connection.DIVIDEND_RATE_COLUMNS rows; symbols are coded against `symbols`"""
+    symbols = [] if symbols is None else symbols
+    codes = {symbol: code for code, symbol in enumerate(symbols)}
+    array = np.empty(len(rows), dtype=DIVIDEND_DTYPE)
+    if not len(rows):
+        return array
+    columns = list(zip(*rows))
+    array["id"] = columns[0]
+    array["date"] = np.array(columns[1], dtype="datetime64[us]")
+    for i, symbol in enumerate(columns[2]):
+        code = codes.get(symbol)
+        if code is None:
+            code = codes[symbol] = len(symbols)
+            symbols.append(symbol)
+        array["symbol"][i] = code
+    for field, values in zip(("gross", "tax", "net", "rate"), columns[3:]):
+        array[field] = np.array(values, dtype=np.float64)
+    return array
+
+
+def _user_directory(user_id, directory=None):
+    # User ids end up in a path
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", str(user_id)):
+        raise ValueError(f"Invalid user id for a history snapshot: {user_id!r}")
+    return os.path.join(directory or SNAPSHOT_DIR, str(user_id))
+
+
+@contextmanager
+def _user_lock(user_id, directory=None):
+    """Exclusive lock on the user's snapshot across threads and processes; a no-op without fcntl"""
+    path = _user_directory(user_id, directory)
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Next to the user directory, which a delete removes
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _stamp_of(name):
+    match = re.fullmatch(r"\w+-([0-9a-f]+)\.npy", name)
+    return int(match.group(1), 16) if match else None
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_history_snapshot(user_id, transactions, dividends, dividend_symbols, fingerprint, directory=None):
+    """Store a built history; returns the snapshot directory"""
+    path = _user_directory(user_id, directory)
+    os.makedirs(path, exist_ok=True)
+    stamp = f"{time.time_ns():x}"
+
+    # np.load cannot memory-map an empty array on every NumPy version, so
+    # empty parts are only recorded in meta.json
+    for name, array in (("transactions", transactions.rows), ("dividends", dividends)):
+        if len(array):
+            np.save(os.path.join(path, f"{name}-{stamp}.npy"), np.ascontiguousarray(array))
+
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "stamp": stamp,
+        "fingerprint": list(fingerprint),
+        "transactionCount": len(transactions),
+        "transactionSymbols": transactions.symbols,
+        "dividendCount": len(dividends),
+        "dividendSymbols": dividend_symbols,
+        "maxFallbackDays": MAX_FALLBACK_DAYS,
+        "builtAt": datetime.now().isoformat(timespec="seconds"),
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=path, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(path, "meta.json"))
+
+    # Files of earlier builds, and of builds that failed half way. Newer
+    # stamps can only come from a build running without the lock (no
+    # fcntl), which is about to replace meta.json itself.
+    current = int(stamp, 16)
+    for name in os.listdir(path):
+        file_stamp = _stamp_of(name)
+        if file_stamp is not None and file_stamp < current:
+            os.remove(os.path.join(path, name))
+    return path
+
+
+def build_history_snapshot(user_id, directory=None):
+    """
+    Read the user's history from the database and store it. Returns the
+    HistorySnapshot, or None (and removes any snapshot) for a user without
+    transactions and dividends.
+    """
+    # Held for the whole build, so the build that started last writes last
+    with _user_lock(user_id, directory):
+        return _build(user_id, directory)
+
+
+def _build(user_id, directory):
+    # Taken before the rows are read: a change in between leaves a snapshot
+    # that looks stale, never one that looks current but is not
+    fingerprint = get_user_history_fingerprint(user_id, MAX_FALLBACK_DAYS)
+    transactions = TransactionArray.concatenate(
+        stream_user_transaction_chunks(user_id, with_rates=True, max_fallback_days=MAX_FALLBACK_DAYS)
+    )
+    dividend_symbols = []
+    dividends = np.concatenate(
+        [dividend_array(rows, dividend_symbols) for rows in stream_user_dividends_with_rates(user_id, MAX_FALLBACK_DAYS)]
+        or [np.empty(0, dtype=DIVIDEND_DTYPE)]
+    )
+    if not len(transactions) and not len(dividends):
+        _delete(user_id, directory)
+        return None
+
+    write_history_snapshot(user_id, transactions, dividends, dividend_symbols, fingerprint, directory)
+    logger.info(
+        f"History snapshot of user {user_id} rebuilt: {len(transactions)} transactions, {len(dividends)} dividends, "
+        f"{(transactions.nbytes + dividends.nbytes) / 1024:.0f} KB"
+    )
+    return HistorySnapshot(transactions, dividends, dividend_symbols, fingerprint)
+
+
+def refresh_history_snapshot(user_id, directory=None):
+    """
+    Rebuild right away after the user's data changed (reset-data). Failures
+    are logged, not raised: the data change itself has already been
+    committed, and a snapshot that could not be rebuilt is removed so it is
+    not used.
+    """
+    if not SNAPSHOTS_ENABLED:
+        return None
+    try:
+        with metrics.stage("history_snapshot"):
+            return build_history_snapshot(user_id, directory)
+    except Exception as e:
+        logger.warning(f"Could not rebuild the history snapshot of user {user_id}: {str(e)}", exc_info=True)
+        try:
+            delete_history_snapshot(user_id, directory)
+        except OSError:
+            pass
+        return None
+
+
+def current_history_snapshot(user_id, directory=None):
+    """
+    The user's HistorySnapshot, rebuilt first if it is missing or no longer
+    matches the database. Build failures are logged and give None, so the
+    caller reads the database instead.
+    """
+    if not SNAPSHOTS_ENABLED:
+        return None
+    history = load_history_snapshot(user_id, directory)
+    if history is not None:
+        return history
+    try:
+        with metrics.stage("history_snapshot"), _user_lock(user_id, directory):
+            # Another calculation may have rebuilt it while this one waited for the lock
+            return load_history_snapshot(user_id, directory) or _build(user_id, directory)
+    except Exception as e:
+        logger.warning(f"Could not rebuild the history snapshot of user {user_id}: {str(e)}", exc_info=True)
+        return None
+
+
+def load_history_snapshot(user_id, directory=None, validate=True):
+    """
+    The user's HistorySnapshot with memory-mapped arrays, or None if there
+    is none or, with `validate`, if it no longer matches the database
+    """
+    if not SNAPSHOTS_ENABLED:
+        return None
+    path = _user_directory(user_id, directory)
+    try:
+        meta = _read_meta(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unreadable history snapshot metadata in {path}: {str(e)}")
+        return None
+    if meta is None or meta.get("version") != SNAPSHOT_VERSION or meta.get("maxFallbackDays") != MAX_FALLBACK_DAYS:
+        return None
+    if validate and list(get_user_history_fingerprint(user_id, MAX_FALLBACK_DAYS)) != meta["fingerprint"]:
+        logger.info(f"History snapshot of user {user_id} is out of date")
+        return None
+
+    def load(name, count, dtype):
+        if not count:
+            return np.empty(0, dtype=dtype)
+        array = np.load(os.path.join(path, f"{name}-{meta['stamp']}.npy"), mmap_mode="r")
+        if array.dtype != dtype or len(array) != count:
+            raise ValueError(f"{name} does not match its metadata")
+        return array
+
+    try:
+        transactions = load("transactions", meta["transactionCount"], TRANSACTION_DTYPE)
+        dividends = load("dividends", meta["dividendCount"], DIVIDEND_DTYPE)
+    except (OSError, ValueError) as e:
+        # Replaced by a newer build while being opened, or damaged
+        logger.warning(f"Could not load the history snapshot of user {user_id}: {str(e)}")
+        return None
+    metrics.count("history_snapshot_hits")
+    return HistorySnapshot(
+        TransactionArray(transactions, meta["transactionSymbols"]), dividends, meta["dividendSymbols"],
+        tuple(meta["fingerprint"]), meta["builtAt"]
+    )
+
+
+def delete_history_snapshot(user_id, directory=None):
+    with _user_lock(user_id, directory):
+        _delete(user_id, directory)
+
+
+def _delete(user_id, directory):
+    shutil.rmtree(_user_directory(user_id, directory), ignore_errors=True)
+
+
+def _info(user_id):
+    path = _user_directory(user_id)
+    meta = _read_meta(path)
+    if meta is None:
+        return {"userId": user_id, "exists": False}
+    size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    return {
+        "userId": user_id,
+        "exists": True,
+        "current": load_history_snapshot(user_id) is not None,
+        "transactions": meta["transactionCount"],
+        "dividends": meta["dividendCount"],
+        "sizeKb": round(size / 1024, 1),
+        "builtAt": meta["builtAt"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild", "delete", "info"])
+    parser.add_argument("user_ids", nargs="*")
+    parser.add_argument("--all", action="store_true", help="every user with transactions")
+    args = parser.parse_args()
+
+    user_ids = get_user_ids_with_transactions() if args.all else args.user_ids
+    if not user_ids:
+        parser.error("give at least one user id, or --all")
+
+    for user_id in user_ids:
+        if args.command == "rebuild":
+            built = build_history_snapshot(user_id)
+            print(json.dumps({"userId": user_id, "transactions": len(built.transactions) if built else 0}))
+        elif args.command == "delete":
+            delete_history_snapshot(user_id)
+        else:
+            print(json.dumps(_info(user_id)))
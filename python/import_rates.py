@@ -0,0 +1,458 @@
+"""
+Bulk import of USD/TRY rates and Yİ-ÜFE index values from downloaded files.
+
+Rates are read from TCMB daily bulletins (today.xml and the archived
+YYYYMM/DDMMYYYY.xml files: Tarih_Date with a Currency element per code,
+USD ForexBuying being the rate) or from CSV/XLSX/XLS exports such as EVDS
+with a date column and a rate column. Yİ-ÜFE values are read from TÜİK
+spreadsheets (.xlsx through openpyxl, .xls through xlrd) or CSV, one row
+per year and one column per month (or transposed).
+
+Dates are normalized to the DD.MM.YYYY text of "Dolar"."gecerliOlduguTarih"
+and duplicates are collapsed, later files winning. Each table is then
+loaded in one transaction: the rows are COPYed into a temporary staging
+table and merged, updating only rows whose value differs (matched by
+"rateDate" and by yil) and inserting missing days and years. Months a
+sheet leaves empty keep their stored values. Re-importing an overlapping
+file therefore only writes what changed.
+
+FIFO snapshots with a watermark at or after the earliest changed day
+(or January 1 of the earliest changed Yİ-ÜFE year) are deleted in the same
+transaction, since they hold results computed with the old values; history
+snapshots notice changed rates through their fingerprint.
+
+Usage: python import_rates.py rates <file> [...] [--rate-column NAME] [--dry-run]
+       python import_rates.py yiufe <file> [...] [--dry-run]
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import time
+from datetime import date, datetime
+from xml.etree import ElementTree
+
+from db_connection import pooled_connection
+from get_dolar import invalidate_rates
+from inflation_calculator import invalidate_inflation, months
+from logger import get_logger
+from transfer import copy_rows
+
+logger = get_logger('import_rates')
+
+_DATE_FORMATS = ("%d.%m.%Y", "%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d", "%Y.%m.%d")
+_MISSING = {"", "-", "nd", "n/a", "na"}
+_TURKISH = str.maketrans("çğıöşüÇĞİIÖŞÜ", "cgiosuCGIIOSU")
+
+
+def _fold(value):
+    """Lower-case ASCII form of a header cell, for matching Turkish names"""
+    return str(value).strip().translate(_TURKISH).lower()
+
+
+def normalize_date(value):
+    """A date from a date/datetime or a DD.MM.YYYY, DD-MM-YYYY, DD/MM/YYYY or ISO string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    # ISO timestamps as written by spreadsheets and pandas
+    if len(text) > 10 and text[4:5] == "-" and text[10] in " T":
+        text = text[:10]
+    for format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date: {value!r}")
+
+
+def parse_number(value):
+    """A float from a number or a "34.2105" / "34,2105" / "1.234,56" string; None if empty"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if math.isnan(value) else float(value)
+    text = str(value).strip().replace("\u00a0", "").replace(" ", "")
+    if text.lower() in _MISSING:
+        return None
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    return float(text)
+
+
+def _parse_year(value):
+    try:
+        number = parse_number(value)
+    except ValueError:
+        return None
+    if number is None or not number.is_integer() or not 1900 <= number <= 2100:
+        return None
+    return int(number)
+
+
+# Readers
+
+def read_tcmb_xml(path):
+    """(date, USD ForexBuying) of every bulletin in a TCMB XML file"""
+    root = ElementTree.parse(path).getroot()
+    bulletins = [root] if root.tag == "Tarih_Date" else root.iter("Tarih_Date")
+    for bulletin in bulletins:
+        day = normalize_date(bulletin.get("Tarih"))
+        for currency in bulletin.iter("Currency"):
+            if (currency.get("CurrencyCode") or currency.get("Kod")) != "USD":
+                continue
+            rate = parse_number(currency.findtext("ForexBuying"))
+            unit = parse_number(currency.findtext("Unit")) or 1
+            if rate is not None:
+                yield day, rate / unit
+
+
+def _read_grid(path):
+    """Cell values of a CSV file or of the first sheet of a workbook, row by row"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        import openpyxl
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            return [list(row) for row in workbook.worksheets[0].iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+    if extension == ".xls":
+        import xlrd
+        book = xlrd.open_workbook(path)
+        sheet = book.sheet_by_index(0)
+        grid = []
+        for index in range(sheet.nrows):
+            grid.append([
+                xlrd.xldate_as_datetime(cell.value, book.datemode) if cell.ctype == xlrd.XL_CELL_DATE else cell.value
+                for cell in sheet.row(index)
+            ])
+        return grid
+
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        return [row for row in csv.reader(f, dialect)]
+
+
+def _rate_columns(header, rate_column=None):
+    """(date column, rate column) indices of a rate table header"""
+    names = [_fold(cell) if cell is not None else "" for cell in header]
+    date_column = next((i for i, name in enumerate(names) if "tarih" in name or "date" in name), 0)
+    if rate_column is not None:
+        if _fold(rate_column) not in names:
+            raise ValueError(f"No column named {rate_column!r}, found {header}")
+        return date_column, names.index(_fold(rate_column))
+
+    usd = [i for i, name in enumerate(names) if "usd" in name and i != date_column]
+    # EVDS names buying rates TP_DK_USD_A..., selling rates TP_DK_USD_S...
+    buying = [i for i in usd if "_a" in names[i] or "alis" in names[i] or "buying" in names[i]]
+    if buying or usd:
+        return date_column, (buying or usd)[0]
+    others = [i for i, name in enumerate(names) if i != date_column and name]
+    if len(others) == 1:
+        return date_column, others[0]
+    raise ValueError(f"Cannot tell the USD buying rate column from {header}, name it with --rate-column")
+
+
+def read_rate_table(path, rate_column=None):
+    """(date, rate) rows of a CSV or spreadsheet with a date column and a rate column"""
+    grid = [row for row in _read_grid(path) if any(cell not in (None, "") for cell in row)]
+    if not grid:
+        return
+    try:
+        normalize_date(grid[0][0])
+        header, body = [], grid
+        date_column, rate_index = 0, 1
+    except ValueError:
+        header, body = grid[0], grid[1:]
+        date_column, rate_index = _rate_columns(header, rate_column)
+
+    skipped = 0
+    for row in body:
+        try:
+            day = normalize_date(row[date_column])
+            rate = parse_number(row[rate_index]) if rate_index < len(row) else None
+        except (ValueError, TypeError):
+            # Footnotes and other text rows of the export
+            skipped += 1
+            continue
+        if rate is not None:
+            yield day, rate
+    if skipped:
+        logger.warning(f"{path}: skipped {skipped} rows without a date or a readable rate")
+
+
+def _month_columns(row):
+    columns = {}
+    for i, cell in enumerate(row):
+        if cell is not None and _fold(cell) in months:
+            columns.setdefault(months.index(_fold(cell)), i)
+    return columns if len(columns) == 12 else None
+
+
+def _yiufe_from_grid(grid):
+    for header_index, header in enumerate(grid):
+        columns = _month_columns(header)
+        if columns is None:
+            continue
+        first_month_column = min(columns.values())
+        for row in grid[header_index + 1:]:
+            year = next((year for year in map(_parse_year, row[:first_month_column]) if year is not None), None)
+            if year is None:
+                continue
+            values = []
+            for month in range(12):
+                column = columns[month]
+                try:
+                    value = parse_number(row[column]) if column < len(row) else None
+                except ValueError:
+                    value = None
+                values.append(value)
+            yield year, values
+        return
+    raise LookupError
+
+
+def read_yiufe_sheet(path):
+    """(yil, [ocak..aralik]) rows of a Yİ-ÜFE table; unpublished months are None"""
+    grid = _read_grid(path)
+    try:
+        yield from _yiufe_from_grid(grid)
+        return
+    except LookupError:
+        pass
+    # Years as columns, months as rows
+    width = max((len(row) for row in grid), default=0)
+    transposed = [[row[i] if i < len(row) else None for row in grid] for i in range(width)]
+    try:
+        yield from _yiufe_from_grid(transposed)
+    except LookupError:
+        raise ValueError(f"{path}: no header row or column with the twelve month names") from None
+
+
+def read_rate_files(paths, rate_column=None):
+    """
+    Rates of several files as {date: rate}, later rows and files replacing
+    earlier ones for the same day. Non-positive rates are dropped.
+    """
+    rates = {}
+    conflicts = 0
+    for path in paths:
+        if path.lower().endswith(".xml"):
+            rows = read_tcmb_xml(path)
+        else:
+            rows = read_rate_table(path, rate_column)
+        for day, rate in rows:
+            if not rate > 0 or math.isinf(rate):
+                logger.warning(f"{path}: ignoring rate {rate} on {day}")
+                continue
+            if rates.get(day, rate) != rate:
+                conflicts += 1
+            rates[day] = rate
+    if conflicts:
+        logger.warning(f"{conflicts} days have different rates in the given files, the last one was kept")
+    return rates
+
+
+def read_yiufe_files(paths):
+    """Yİ-ÜFE rows of several files as {yil: [12 values]}; later values replace earlier ones, None never does"""
+    years = {}
+    for path in paths:
+        for year, values in read_yiufe_sheet(path):
+            merged = years.setdefault(year, [None] * 12)
+            for month, value in enumerate(values):
+                if value is not None and value > 0:
+                    merged[month] = value
+    return years
+
+
+# Merging
+
+def _drop_fifo_snapshots(cursor, since):
+    if since is None:
+        return 0
+    cursor.execute('DELETE FROM "FifoSnapshot" WHERE "watermarkDate" >= %s', (since,))
+    return cursor.rowcount
+
+
+def merge_rates(connection, rates):
+    """
+    Merge {date: rate} into "Dolar" through a staging table. Does not
+    commit. Returns {"staged", "inserted", "updated", "unchanged", "changedFrom", "fifoSnapshotsDropped"}.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE "DolarStaging" ("rateDate" date PRIMARY KEY, "gecerliOlduguTarih" text, '
+            '"dovizAlis" double precision) ON COMMIT DROP'
+        )
+        copy_rows(cursor, "DolarStaging", ["rateDate", "gecerliOlduguTarih", "dovizAlis"],
+                  ((day, day.strftime("%d.%m.%Y"), rate) for day, rate in sorted(rates.items())))
+        cursor.execute('ANALYZE "DolarStaging"')
+        # Concurrent imports wait for each other; readers are not blocked
+        cursor.execute('LOCK TABLE "Dolar" IN SHARE ROW EXCLUSIVE MODE')
+
+        # Every row of a day is updated, whichever of them the joins pick
+        cursor.execute(
+            '''
+            WITH updated AS (
+                UPDATE "Dolar" d SET "dovizAlis" = s."dovizAlis"
+                FROM "DolarStaging" s
+                WHERE d."rateDate" = s."rateDate" AND d."dovizAlis" IS DISTINCT FROM s."dovizAlis"
+                RETURNING d."rateDate"
+            )
+            SELECT COUNT(DISTINCT "rateDate"), MIN("rateDate") FROM updated
+            '''
+        )
+        updated, first_updated = cursor.fetchone()
+        # "rateDate" of the new rows is filled by the Dolar trigger
+        cursor.execute(
+            '''
+            WITH inserted AS (
+                INSERT INTO "Dolar" ("gecerliOlduguTarih", "dovizAlis")
+                SELECT s."gecerliOlduguTarih", s."dovizAlis" FROM "DolarStaging" s
+                WHERE NOT EXISTS (SELECT 1 FROM "Dolar" d WHERE d."rateDate" = s."rateDate")
+                ORDER BY s."rateDate"
+                RETURNING "rateDate"
+            )
+            SELECT COUNT(*), MIN("rateDate") FROM inserted
+            '''
+        )
+        inserted, first_inserted = cursor.fetchone()
+
+        changed_from = min((day for day in (first_updated, first_inserted) if day is not None), default=None)
+        dropped = _drop_fifo_snapshots(cursor, changed_from)
+    return {
+        "staged": len(rates),
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": len(rates) - inserted - updated,
+        "changedFrom": changed_from,
+        "fifoSnapshotsDropped": dropped,
+    }
+
+
+def merge_yiufe(connection, years):
+    """Merge {yil: [12 values]} into "YiUfe" through a staging table; like merge_rates"""
+    month_list = ", ".join(months)
+    merged = [f"COALESCE(s.{month}, y.{month})" for month in months]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE "YiUfeStaging" (yil integer PRIMARY KEY, '
+            + ", ".join(f"{month} double precision" for month in months) + ") ON COMMIT DROP"
+        )
+        copy_rows(cursor, "YiUfeStaging", ["yil"] + months,
+                  ((year, *values) for year, values in sorted(years.items())))
+        cursor.execute('LOCK TABLE "YiUfe" IN SHARE ROW EXCLUSIVE MODE')
+
+        cursor.execute(
+            f'''
+            WITH updated AS (
+                UPDATE "YiUfe" y SET ({month_list}) = ({", ".join(merged)})
+                FROM "YiUfeStaging" s
+                WHERE y.yil = s.yil AND ({", ".join(f"y.{month}" for month in months)}) IS DISTINCT FROM ({", ".join(merged)})
+                RETURNING y.yil
+            )
+            SELECT COUNT(DISTINCT yil), MIN(yil) FROM updated
+            '''
+        )
+        updated, first_updated = cursor.fetchone()
+        cursor.execute(
+            f'''
+            WITH inserted AS (
+                INSERT INTO "YiUfe" (yil, {month_list})
+                SELECT s.yil, {", ".join(f"s.{month}" for month in months)} FROM "YiUfeStaging" s
+                WHERE NOT EXISTS (SELECT 1 FROM "YiUfe" y WHERE y.yil = s.yil)
+                ORDER BY s.yil
+                RETURNING yil
+            )
+            SELECT COUNT(*), MIN(yil) FROM inserted
+            '''
+        )
+        inserted, first_inserted = cursor.fetchone()
+
+        first_year = min((year for year in (first_updated, first_inserted) if year is not None), default=None)
+        changed_from = date(first_year, 1, 1) if first_year is not None else None
+        dropped = _drop_fifo_snapshots(cursor, changed_from)
+    return {
+        "staged": len(years),
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": len(years) - inserted - updated,
+        "changedFrom": changed_from,
+        "fifoSnapshotsDropped": dropped,
+    }
+
+
+def import_files(kind, paths, rate_column=None, dry_run=False, connection=None):
+    """
+    Read `paths` and merge them into "Dolar" (kind "rates") or "YiUfe"
+    (kind "yiufe") in one transaction, rolled back with `dry_run`. Commits
+    on its own pooled connection unless the caller passes `connection`.
+    Returns the merge report with "files", "seconds" and "dryRun" added.
+    """
+    started = time.perf_counter()
+    if kind == "rates":
+        rows, merge, invalidate = read_rate_files(paths, rate_column), merge_rates, invalidate_rates
+    elif kind == "yiufe":
+        rows, merge, invalidate = read_yiufe_files(paths), merge_yiufe, invalidate_inflation
+    else:
+        raise ValueError(f"Unknown import kind: {kind}")
+    if not rows:
+        raise ValueError(f"No {kind} found in {', '.join(paths)}")
+
+    def run(connection):
+        try:
+            report = merge(connection, rows)
+        except Exception:
+            connection.rollback()
+            raise
+        if dry_run:
+            connection.rollback()
+        else:
+            connection.commit()
+        return report
+
+    if connection is not None:
+        report = run(connection)
+    else:
+        with pooled_connection() as connection:
+            report = run(connection)
+    if not dry_run:
+        invalidate()
+
+    report.update({"files": len(paths), "seconds": round(time.perf_counter() - started, 3), "dryRun": dry_run})
+    logger.info(
+        f"{'Dry run of ' if dry_run else ''}{kind} import from {len(paths)} files: {report['inserted']} inserted, "
+        f"{report['updated']} updated, {report['unchanged']} unchanged"
+        + (f", changed from {report['changedFrom']}" if report["changedFrom"] else "")
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=["rates", "yiufe"])
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--rate-column", help="header of the USD buying rate column in CSV/spreadsheet rate files")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change, then roll back")
+    args = parser.parse_args()
+
+    try:
+        report = import_files(args.kind, args.files, args.rate_column, args.dry_run)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        raise SystemExit(1)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
-from db_connection import get_db_connection
+import threading
+
+import numpy as np
+
+from db_connection import pooled_connection
 
 months = [
     "ocak", "subat", "mart", "nisan", "mayis", "haziran",
@@ -12,66 +16,173 @@ def get_previous_month(year, month):
     else:
         return year, months[month]
 
+def month_index(year, month):
+    """Flat month index for a year and a 0-based month (ocak = 0)"""
+    return year * 12 + month
+
+
+class YiUfeSeries:
+    """
+    In-memory copy of the YiUfe table as one flat monthly series.
+
+    Index values are stored in a NumPy array addressed by
+    `month_index(year, month) - base`, so looking up a month is a single
+    array access. Months without published data are NaN.
+    """
+
+    def __init__(self):
+        self._base = 0
+        self._values = np.empty(0, dtype=np.float64)
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a series from (yil, ocak, ..., aralik) rows"""
+        series = cls()
+        series._set_rows(rows)
+        return series
+
+    def _set_rows(self, rows):
+        rows = [row for row in rows if row and row[0] is not None]
+        if not rows:
+            self._base = 0
+            self._values = np.empty(0, dtype=np.float64)
+            self._loaded = True
+            return
+
+        years = [int(row[0]) for row in rows]
+        first_year = min(years)
+        values = np.full((max(years) - first_year + 1) * 12, np.nan)
+        for year, row in zip(years, rows):
+            start = (year - first_year) * 12
+            values[start:start + 12] = [np.nan if v is None else float(v) for v in row[1:13]]
+
+        self._base = month_index(first_year, 0)
+        self._values = values
+        self._loaded = True
+
+    def to_arrays(self):
+        """(base, values) of the loaded series, e.g. to hand to worker processes"""
+        self._ensure_loaded()
+        return self._base, self._values
+
+    def load_arrays(self, base, values):
+        """Install a series exported by `to_arrays` instead of querying the database"""
+        with self._lock:
+            self._base = int(base)
+            self._values = np.asarray(values, dtype=np.float64)
+            self._loaded = True
+
+    def refresh(self):
+        """Reload the whole YiUfe table from the database"""
+        with pooled_connection() as connection:
+            with connection.cursor() as cursor:
+                columns = ", ".join(months)
+                cursor.execute(f'SELECT yil, {columns} FROM "YiUfe"')
+                rows = cursor.fetchall()
+
+        with self._lock:
+            self._set_rows(rows)
+        print(f"📊 Loaded inflation data for {len(self._values) // 12} years")
+
+    def invalidate(self):
+        """Drop the loaded series; the next lookup reloads it"""
+        with self._lock:
+            self._base = 0
+            self._values = np.empty(0, dtype=np.float64)
+            self._loaded = False
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.refresh()
+
+    def value(self, index):
+        """Index value for a flat month index, or None if unpublished"""
+        self._ensure_loaded()
+        pos = index - self._base
+        if pos < 0 or pos >= len(self._values):
+            return None
+        value = self._values[pos]
+        return None if np.isnan(value) else float(value)
+
+    def values(self, indices):
+        """Vectorized `value`; returns NaN for months without data"""
+        self._ensure_loaded()
+        pos = np.asarray(indices, dtype=np.int64) - self._base
+        valid = (pos >= 0) & (pos < len(self._values))
+        result = np.full(pos.shape, np.nan)
+        result[valid] = self._values[pos[valid]]
+        return result
+
+    def inflation_rate(self, buy_index, sell_index):
+        """Percentage change between two months, or None if either is missing"""
+        start = self.value(buy_index)
+        end = self.value(sell_index)
+        if start is None or end is None or start == 0:
+            return None
+        return (end - start) / start * 100
+
+    def inflation_rates(self, buy_indices, sell_indices):
+        """
+        Vectorized `inflation_rate` for all matched lots at once.
+
+        `buy_indices` and `sell_indices` are flat month indices and are
+        broadcast against each other, so a single sell month can be paired
+        with an array of buy months. Missing data yields NaN.
+        """
+        start = self.values(buy_indices)
+        end = self.values(sell_indices)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates = (end - start) / start * 100
+        rates[~np.isfinite(rates)] = np.nan
+        return rates
+
+    def adjustment_factors(self, buy_indices, sell_indices, threshold):
+        """Cost multipliers: 1 + rate / 100 where the rate exceeds `threshold`, else 1"""
+        rates = self.inflation_rates(buy_indices, sell_indices)
+        apply = np.nan_to_num(rates, nan=-np.inf) > threshold
+        return np.where(apply, 1 + rates / 100, 1.0)
+
+
+_series = YiUfeSeries()
+
+
+def get_inflation_series():
+    """Return the process-wide YiUfe series"""
+    return _series
+
+
+def refresh_inflation():
+    _series.refresh()
+
+
+def invalidate_inflation():
+    _series.invalidate()
+
+
 # Function to get inflation for a specific year and month
 def get_inflation(year, month):
-    connection = None
-    cursor = None
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
-        print(f"\n🔍 Looking up inflation data for {month} {year}")
-        # Query to get inflation data for the specific year and month
-        query = f"SELECT {month} FROM YiUfe WHERE yil = %s"
-        cursor.execute(query, (year,))
-        
-        result = cursor.fetchone()
-        # Fetch any remaining results to avoid "unread result found" error
-        while cursor.fetchone() is not None:
-            pass
-            
-        if result:
-            rate = result[month]
-            print(f"📊 Inflation rate found: {rate}%")
-            return rate
-        else:
+        rate = _series.value(month_index(year, months.index(month)))
+        if rate is None:
             print(f"⚠️  No inflation data found for {month} {year}")
-            return None
-            
+        return rate
     except Exception as e:
         print(f"\n❌ Error getting inflation data: {e}")
         return None
-    finally:
-        if cursor:
-            try:
-                # Fetch any remaining results before closing
-                while cursor.fetchone() is not None:
-                    pass
-                cursor.close()
-            except:
-                pass
-        if connection:
-            connection.close()
 
 def calculate_inflation(first_year, first_month, second_year, second_month):
-    print(f"\n=== Calculating Inflation ===")
-    print(f"From: {months[first_month]} {first_year}")
-    print(f"To: {months[second_month]} {second_year}")
-    
-    inflation_start = get_inflation(first_year, months[first_month])
-    if inflation_start is None:
-        print("\n⚠️  Could not get starting inflation rate")
-        return None
-        
-    inflation_end = get_inflation(second_year, months[second_month])
-    if inflation_end is None:
-        print("\n⚠️  Could not get ending inflation rate")
-        return None
-    
+    # Months are 0-based; -1 means December of the previous year
     try:
-        inflation_rate = (inflation_end - inflation_start) / inflation_start * 100
-        print(f"\n✅ Inflation rate calculated: {inflation_rate:.2f}%")
-        return inflation_rate
+        return _series.inflation_rate(
+            month_index(first_year, first_month),
+            month_index(second_year, second_month)
+        )
     except Exception as e:
         print(f"\n❌ Error calculating inflation rate: {e}")
         return None
@@ -1,12 +1,15 @@
+import atexit
 import logging
+import multiprocessing.util
 import os
+import queue
 import sys
 import codecs
 import io
 import time
 import threading
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 # Create logs directory if it doesn't exist
 logs_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
@@ -16,73 +19,238 @@ os.makedirs(logs_dir, exist_ok=True)
 LOG_CATEGORIES = {
     'extract_tables': 'pdf_processing',
     'run_extract_tables': 'pdf_processing',
+    'extract_worker': 'pdf_processing',
+    'extract_batch': 'pdf_processing',
+    'statement_cache': 'pdf_processing',
     'test_pdf_processing': 'pdf_processing',
     'db_connection': 'database',
+    'async_db': 'database',
+    'history_snapshot': 'database',
+    'transfer': 'database',
+    'import_rates': 'database',
+    'test_async_db': 'database',
+    'test_async_sql': 'database',
+    'batch_tax': 'tax_calculation',
+    'tax_calculator_db': 'tax_calculation',
+    'test_fifo_engine': 'tax_calculation',
     'test_logging': 'system',
     'default': 'system'
 }
 
-# Configure the logger
-def setup_logger(name='python_script'):
-    """Set up and return a logger that writes to a categorized log file and stdout"""
-    # Create a logger
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    
-    # Clear any existing handlers
-    if logger.handlers:
-        logger.handlers.clear()
-    
-    # Determine the category for this logger
-    category = LOG_CATEGORIES.get(name, 'default')
-    
-    # Create file handler with rotation
-    log_filename = f"{category}.log"
-    file_path = os.path.join(logs_dir, log_filename)
-    
-    # Use RotatingFileHandler to limit file size and keep backups
-    file_handler = RotatingFileHandler(
-        file_path, 
-        maxBytes=10*1024*1024,  # 10MB max file size
-        backupCount=5,          # Keep 5 backup files
-        encoding='utf-8'
-    )
-    file_handler.setLevel(logging.DEBUG)
-    
+# Levels come from the environment: LOG_LEVEL for every category,
+# LOG_LEVEL_<CATEGORY> (e.g. LOG_LEVEL_PDF_PROCESSING=INFO) for one category,
+# and LOG_CONSOLE_LEVEL as an extra bound on what reaches the console.
+DEFAULT_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG')
+CONSOLE_LEVEL = os.getenv('LOG_CONSOLE_LEVEL', 'INFO')
+
+# With LOG_QUEUE=1 (default) callers only put records on a queue; a
+# background thread formats and writes them.
+USE_QUEUE = os.getenv('LOG_QUEUE', '1') != '0'
+
+# Per-row and per-page debug messages (see RowLog): 1 logs all of them,
+# N every Nth, 0 none.
+ROW_LOG_SAMPLE = int(os.getenv('LOG_ROW_SAMPLE', '1'))
+
+_formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - [PID:%(process)d] - %(levelname)s - %(message)s'
+)
+
+def _level(name, default=logging.DEBUG):
+    level = logging.getLevelName(str(name).upper())
+    return level if isinstance(level, int) else default
+
+def category_level(category):
+    """Configured level of a log category"""
+    return _level(os.getenv(f'LOG_LEVEL_{category.upper()}', DEFAULT_LEVEL))
+
+# Handlers are shared: one rotating file per category and one console
+# handler, however many modules log to them.
+_lock = threading.RLock()
+_file_handlers = {}
+_console_handler = None
+
+# Stream for console output; None means stdout. Long-lived workers that use
+# stdout as a protocol channel switch this to stderr.
+_console_stream = None
+
+def _make_console_handler():
     # Create console handler with proper encoding for Windows
+    if _console_stream is not None:
+        return logging.StreamHandler(_console_stream)
     if sys.platform == 'win32':
         # On Windows, use utf-8 encoding for console output
         try:
             # Try to use utf-8 for console output
             sys.stdout.reconfigure(encoding='utf-8')
-            console_handler = logging.StreamHandler(sys.stdout)
+            return logging.StreamHandler(sys.stdout)
         except (AttributeError, io.UnsupportedOperation):
             # For older Python versions or when reconfigure is not available
             console_stream = codecs.getwriter('utf-8')(sys.stdout.buffer)
-            console_handler = logging.StreamHandler(console_stream)
+            return logging.StreamHandler(console_stream)
+    # On other platforms, use default
+    return logging.StreamHandler(sys.stdout)
+
+def _get_console_handler():
+    global _console_handler
+    if _console_handler is None:
+        _console_handler = _make_console_handler()
+        _console_handler.setLevel(_level(CONSOLE_LEVEL, logging.INFO))
+        _console_handler.setFormatter(_formatter)
+        _console_handler._is_console = True
+    return _console_handler
+
+def _get_file_handler(category):
+    handler = _file_handlers.get(category)
+    if handler is None:
+        # Use RotatingFileHandler to limit file size and keep backups
+        handler = RotatingFileHandler(
+            os.path.join(logs_dir, f"{category}.log"),
+            maxBytes=10*1024*1024,  # 10MB max file size
+            backupCount=5,          # Keep 5 backup files
+            encoding='utf-8'
+        )
+        handler.setLevel(category_level(category))
+        handler.setFormatter(_formatter)
+        _file_handlers[category] = handler
+    return handler
+
+def set_console_stream(stream):
+    """Send console log output of all existing and future loggers to `stream`"""
+    global _console_stream
+    with _lock:
+        _console_stream = stream
+        if _console_handler is not None:
+            _console_handler.setStream(stream)
+
+
+class _CategoryRouter(logging.Handler):
+    """Writes a record to its logger's category file and to the console"""
+
+    def handle(self, record):
+        category = LOG_CATEGORIES.get(record.name, 'default')
+        for handler in (_file_handlers.get(category), _console_handler):
+            if handler is not None and record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def emit(self, record):
+        self.handle(record)
+
+
+_router = _CategoryRouter()
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Queues records as they are; formatting happens on the listener thread"""
+
+    def prepare(self, record):
+        return record
+
+    def emit(self, record):
+        if _listener is None:
+            # Listener already stopped at exit: write synchronously
+            _router.handle(record)
+        else:
+            super().emit(record)
+
+
+_queue_handler = None
+_listener = None
+
+def _start_listener():
+    global _queue_handler, _listener
+    log_queue = queue.SimpleQueue()
+    if _queue_handler is None:
+        _queue_handler = _DeferredQueueHandler(log_queue)
     else:
-        # On other platforms, use default
-        console_handler = logging.StreamHandler(sys.stdout)
-    
-    console_handler.setLevel(logging.DEBUG)
-    
-    # Create formatter with process ID and thread ID
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - [PID:%(process)d] - %(levelname)s - %(message)s'
-    )
-    file_handler.setFormatter(formatter)
-    console_handler.setFormatter(formatter)
-    
-    # Add the handlers to the logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
-    # Log startup information
-    logger.info(f"Logger initialized for {name} (category: {category})")
-    
+        _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, _router)
+    _listener.start()
+
+def _stop_listener():
+    global _listener
+    with _lock:
+        if _listener is not None:
+            # Writes out everything still queued
+            _listener.stop()
+            _listener = None
+
+def _restart_listener_in_child():
+    # A forked child (e.g. a process pool worker) inherits the queue handler
+    # but not the listener thread, and possibly a held lock
+    global _lock, _listener
+    _lock = threading.RLock()
+    if _listener is not None:
+        _listener = None
+        _start_listener()
+
+def _stop_listener_at_child_exit(_):
+    # multiprocessing children end with os._exit and skip atexit, but run
+    # finalizers registered after they start
+    multiprocessing.util.Finalize(None, _stop_listener, exitpriority=100)
+
+class _ForkHook:
+    pass
+
+_fork_hook = _ForkHook()
+atexit.register(_stop_listener)
+multiprocessing.util.register_after_fork(_fork_hook, _stop_listener_at_child_exit)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener_in_child)
+
+
+# Configure the logger
+def setup_logger(name='python_script'):
+    """
+    Return a logger that writes to its category's log file and the console.
+    Repeated calls for the same name return the configured logger.
+    """
+    logger = logging.getLogger(name)
+    if getattr(logger, '_configured', False):
+        return logger
+
+    with _lock:
+        # Determine the category for this logger
+        category = LOG_CATEGORIES.get(name, 'default')
+        file_handler = _get_file_handler(category)
+        console_handler = _get_console_handler()
+
+        logger.handlers.clear()
+        logger.setLevel(file_handler.level)
+        logger.propagate = False
+        if USE_QUEUE:
+            if _listener is None:
+                _start_listener()
+            logger.addHandler(_queue_handler)
+        else:
+            logger.addHandler(file_handler)
+            logger.addHandler(console_handler)
+        logger._configured = True
+
+    logger.debug("Logger initialized for %s (category: %s)", name, category)
     return logger
 
 # Function to get the logger for a specific module
 def get_logger(module_name):
     """Get a logger for a specific module"""
-    return setup_logger(module_name) 
\ No newline at end of file
+    return setup_logger(module_name)
+
+
+class RowLog:
+    """
+    Debug messages emitted once per row, table or page. Only every
+    ROW_LOG_SAMPLE-th call is logged, and nothing is counted or formatted
+    while DEBUG is disabled for the logger.
+    """
+
+    def __init__(self, logger, every=None):
+        self.logger = logger
+        self.every = ROW_LOG_SAMPLE if every is None else every
+        self._calls = 0
+
+    def debug(self, msg, *args):
+        if self.every <= 0 or not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        self._calls += 1
+        if self.every == 1 or self._calls % self.every == 1:
+            self.logger.debug(msg, *args)
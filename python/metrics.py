@@ -0,0 +1,154 @@
+"""
+Per-run instrumentation: nested stage timers, counters and peak memory.
+
+A run is wrapped in `collect()`, and code anywhere below it records into
+the active collector through the module functions:
+
+    with metrics.collect() as run:
+        with metrics.stage("extract"):
+            with metrics.stage("find_tables"):
+                ...
+            metrics.count("pages")
+    result["metrics"] = metrics.report(run, "Extraction", logger)
+
+Stages nest by name ("extract/find_tables") and accumulate time and calls
+when entered repeatedly. The active collector lives in a context variable,
+so threads and asyncio tasks each record into their own run.
+
+With METRICS=0, or outside collect(), stage() returns a shared no-op
+context manager and count() returns immediately.
+"""
+
+import contextvars
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_ENABLED = os.getenv('METRICS', '1') != '0'
+
+_active = contextvars.ContextVar('metrics', default=None)
+_no_stage = nullcontext()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Metrics:
+    """Stage timings and counters of one run"""
+
+    def __init__(self):
+        # "outer/inner" -> [seconds, calls], in order of first entry
+        self.stages = {}
+        self.counters = {}
+        self._path = ()
+        self._started = time.perf_counter()
+        self._peak_at_start = peak_rss_mb()
+
+    @contextmanager
+    def stage(self, name):
+        parent = self._path
+        self._path = path = parent + (name,)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_stage("/".join(path), time.perf_counter() - started, 1)
+            self._path = parent
+
+    def _add_stage(self, key, seconds, calls):
+        entry = self.stages.get(key)
+        if entry is None:
+            self.stages[key] = [seconds, calls]
+        else:
+            entry[0] += seconds
+            entry[1] += calls
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, data):
+        """
+        Add the to_dict() of a run from another process, e.g. a pool
+        worker, below the current stage. Worker stages running in parallel
+        add up, so they can exceed the wall time of the enclosing stage.
+        """
+        prefix = "/".join(self._path)
+        for key, stage in data["stages"].items():
+            self._add_stage(f"{prefix}/{key}" if prefix else key, stage["seconds"], stage["calls"])
+        for name, value in data["counters"].items():
+            self.count(name, value)
+
+    def to_dict(self):
+        return {
+            "seconds": round(time.perf_counter() - self._started, 4),
+            "stages": {
+                key: {"seconds": round(seconds, 4), "calls": calls}
+                for key, (seconds, calls) in self.stages.items()
+            },
+            "counters": dict(self.counters),
+            **self._memory(),
+        }
+
+    def _memory(self):
+        """
+        The process peak RSS so far, and how much this run raised it. The
+        peak never goes down, so the growth is 0 when an earlier run in the
+        same process (e.g. the long-lived extract worker) used more memory.
+        """
+        peak = peak_rss_mb()
+        if peak is None:
+            return {"processPeakRssMb": None, "peakRssGrowthMb": None}
+        return {"processPeakRssMb": peak, "peakRssGrowthMb": round(peak - self._peak_at_start, 1)}
+
+
+@contextmanager
+def collect(enabled=True):
+    """Run the enclosed code under a new collector; yields it, or None when disabled"""
+    if not (enabled and METRICS_ENABLED):
+        yield None
+        return
+    run = Metrics()
+    token = _active.set(run)
+    try:
+        yield run
+    finally:
+        _active.reset(token)
+
+
+def active():
+    """The collector of the current run, or None"""
+    return _active.get()
+
+
+def stage(name):
+    """Time the enclosed block as a stage of the current run"""
+    run = _active.get()
+    return _no_stage if run is None else run.stage(name)
+
+
+def count(name, n=1):
+    run = _active.get()
+    if run is not None:
+        run.count(name, n)
+
+
+def report(run, label, logger):
+    """to_dict() of a finished run, also written to `logger`; None when disabled"""
+    if run is None:
+        return None
+    data = run.to_dict()
+    logger.info("%s metrics: %s", label, json.dumps(data))
+    return data
@@ -0,0 +1,171 @@
+"""
+Content-addressed on-disk cache for statement extraction.
+
+Entries are keyed by a SHA-256 of the PDF bytes and stored per kind and
+version, e.g. `<digest>.raw.v1.pkl`:
+
+- "raw" holds the table rows collected from the PDF, versioned by the
+  extractor version, so a parser change can reuse them without running
+  pdfplumber again.
+- "parsed" holds the parsed DataFrames, versioned by both the extractor and
+  the parser version.
+
+Entries of other versions for the same digest are removed when a new one is
+stored. The total size is bounded with least-recently-used eviction based
+on file modification times, which are refreshed on every hit.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from logger import get_logger
+
+logger = get_logger('statement_cache')
+
+CACHE_DIR = os.getenv(
+    'STATEMENT_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'statements')
+)
+CACHE_MAX_MB = float(os.getenv('STATEMENT_CACHE_MAX_MB', '256'))
+# Temporary files older than this are no longer being written
+ORPHAN_TMP_SECONDS = 3600
+
+
+def file_digest(pdf_path, salt=""):
+    """SHA-256 of the file contents, optionally mixed with a salt string"""
+    digest = hashlib.sha256(salt.encode("utf-8") + b"\0")
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StatementCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=int(CACHE_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, digest, kind, version):
+        return os.path.join(self.directory, f"{digest}.{kind}.v{version}.pkl")
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, digest, kind, version):
+        """Cached value, or None on a miss"""
+        if not self.enabled:
+            return None
+        path = self._path(digest, kind, version)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            self._count("misses")
+            logger.info(f"Statement cache miss ({kind} v{version}) for {digest[:12]} {self._summary()}")
+            return None
+        except Exception as e:
+            # Truncated or incompatible entry: drop it and treat as a miss
+            logger.warning(f"Discarding unreadable cache entry {path}: {str(e)}")
+            self._remove(path)
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        logger.info(f"Statement cache hit ({kind} v{version}) for {digest[:12]} {self._summary()}")
+        return value
+
+    def put(self, digest, kind, version, value):
+        """Store a value atomically and evict old entries if over the size limit"""
+        if not self.enabled:
+            return
+        tmp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(digest, kind, version))
+        except Exception as e:
+            logger.warning(f"Could not write statement cache entry: {str(e)}")
+            if tmp_path is not None:
+                try:
+                    self._remove(tmp_path)
+                except OSError:
+                    pass
+            return
+
+        self._count("stores")
+        self._remove_stale_versions(digest, kind, version)
+        self._evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _remove_stale_versions(self, digest, kind, version):
+        prefix = f"{digest}.{kind}."
+        current = os.path.basename(self._path(digest, kind, version))
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name != current:
+                self._remove(os.path.join(self.directory, name))
+
+    def _evict(self):
+        entries = []
+        total = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith((".pkl", ".tmp")):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith(".tmp"):
+                # Left behind by a process killed while writing (a timed-out
+                # extraction worker); recent ones may still be in progress
+                if now - stat.st_mtime > ORPHAN_TMP_SECONDS:
+                    self._remove(entry.path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                self._count("evictions")
+            total -= size
+        logger.info(f"Statement cache evicted down to {total / 1024 / 1024:.1f} MB {self._summary()}")
+
+    def _summary(self):
+        return "(" + ", ".join(f"{name}: {count}" for name, count in self.counters.items()) + ")"
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                self._remove(os.path.join(self.directory, name))
+
+
+_cache = StatementCache()
+
+
+def get_statement_cache():
+    """Return the process-wide statement cache"""
+    return _cache
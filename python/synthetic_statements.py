@@ -0,0 +1,278 @@
+"""
+Synthetic Midas statements and transaction histories for benchmarks.
+
+Histories are chronological and consistent: per symbol, sells never exceed
+the shares bought before them, a share of quantities is fractional, and
+USD prices follow a random walk. They come as the raw table cells of a
+statement (strings in Turkish number format, as pdfplumber returns them)
+and can be written as a statement PDF with bordered "YATIRIM İŞLEMLERİ"
+and "TEMETTÜ İŞLEMLERİ" tables that extract_tables reads like a real one.
+
+The PDF writer has no dependencies: pages use the built-in Helvetica font
+with the Turkish letters mapped in through the font encoding.
+
+Usage:
+    python synthetic_statements.py pdf <out.pdf> [--pages N] [--rows-per-page N] [--seed S]
+    python synthetic_statements.py history <out.csv> [--transactions N] [--symbols N] [--seed S]
+"""
+
+import argparse
+import csv
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from extract_tables import TRANSACTION_COLUMNS, DIVIDEND_COLUMNS, parse_transaction_rows
+from transaction_array import TransactionArray
+
+TRANSACTION_TITLE = "YATIRIM İŞLEMLERİ"
+DIVIDEND_TITLE = "TEMETTÜ İŞLEMLERİ"
+
+SYMBOLS = ["AAPL", "TSLA", "NVDA", "MSFT", "AMZN", "GOOGL", "META", "KO", "SPY", "QQQ",
+           "AMD", "NFLX", "PLTR", "COIN", "DIS", "JPM", "V", "PEP", "INTC", "BABA"]
+
+# Statement transactions per page, and the page size (A4 landscape, points)
+ROWS_PER_PAGE = 30
+PAGE_WIDTH, PAGE_HEIGHT = 842, 595
+# One dividend page per this many statement pages
+PAGES_PER_DIVIDEND_PAGE = 10
+
+
+def turkish_number(value, decimals=2):
+    """Format like the statements do: 1.234,56"""
+    integer, decimal = f"{value:,.{decimals}f}".split(".")
+    return f"{integer.replace(',', '.')},{decimal}"
+
+
+def symbol_names(count):
+    """`count` ticker symbols, real ones first"""
+    return SYMBOLS[:count] + [f"SYM{i}" for i in range(len(SYMBOLS), count)]
+
+
+def make_history(count, symbol_count=20, seed=0, start=datetime(2019, 1, 1), end=datetime(2025, 12, 31)):
+    """
+    Raw statement rows of `count` chronological trades over `symbol_count`
+    symbols, in the column order of extract_tables.TRANSACTION_COLUMNS
+    """
+    rng = random.Random(seed)
+    symbols = symbol_names(max(1, symbol_count))
+    prices = {symbol: rng.uniform(5, 500) for symbol in symbols}
+    holdings = dict.fromkeys(symbols, 0.0)
+
+    span = (end - start).total_seconds()
+    offsets = sorted(rng.random() * span for _ in range(count))
+    rows = []
+    for offset in offsets:
+        symbol = rng.choice(symbols)
+        prices[symbol] *= rng.uniform(0.97, 1.035)
+        price = prices[symbol]
+        if holdings[symbol] > 0 and rng.random() < 0.4:
+            operation = "Satış"
+            quantity = holdings[symbol] if rng.random() < 0.3 else round(holdings[symbol] * rng.uniform(0.1, 0.9), 6)
+        else:
+            operation = "Alış"
+            quantity = float(rng.randint(1, 200)) if rng.random() < 0.8 else round(rng.uniform(0.01, 20), 6)
+        quantity = max(quantity, 0.000001)
+        holdings[symbol] = max(0.0, holdings[symbol] + (quantity if operation == "Alış" else -quantity))
+
+        amount = quantity * price
+        quantity_text = str(int(quantity)) if quantity.is_integer() else turkish_number(quantity, 6)
+        date = start + timedelta(seconds=int(offset))
+        rows.append([
+            date.strftime("%d/%m/%y %H:%M:%S"), "Hisse", symbol, operation, "Gerçekleşti", "USD",
+            quantity_text, turkish_number(amount), quantity_text, turkish_number(price),
+            "-" if rng.random() < 0.3 else turkish_number(max(amount * 0.002, 0.01)),
+            turkish_number(amount),
+        ])
+    return rows
+
+
+def make_dividends(history, count, seed=0):
+    """`count` dividend rows paid on symbols of `history` over its date range"""
+    if not history or count <= 0:
+        return []
+    rng = random.Random(seed)
+    symbols = sorted({row[2] for row in history})
+    first = datetime.strptime(history[0][0], "%d/%m/%y %H:%M:%S")
+    span = (datetime.strptime(history[-1][0], "%d/%m/%y %H:%M:%S") - first).days + 1
+
+    rows = []
+    for day in sorted(rng.randrange(span) for _ in range(count)):
+        gross = rng.uniform(0.5, 300)
+        rows.append([
+            (first + timedelta(days=day)).strftime("%d/%m/%y"), rng.choice(symbols),
+            turkish_number(gross), turkish_number(gross * 0.15), turkish_number(gross * 0.85),
+        ])
+    return rows
+
+
+def history_transactions(history):
+    """
+    `history` as the TransactionArray the database would return for it (ids
+    in order), e.g. to calculate without a database
+    """
+    df, _ = parse_transaction_rows(history)
+    return TransactionArray.from_rows(list(zip(
+        range(1, len(df) + 1), df["Tarih"].dt.to_pydatetime(), df["Sembol"], df["İşlem Tipi"], df["Para Birimi"],
+        df["Gerçekleşen Adet"].astype(float), df["Ortalama İşlem Fiyatı"].astype(float),
+        df["İşlem Ücreti"].astype(float)
+    )))
+
+
+def make_rate_arrays(start=datetime(2018, 1, 1), end=datetime(2026, 12, 31), seed=0):
+    """(ordinals, rates) for get_dolar's rate table: weekday USD/TRY rates drifting upwards"""
+    rng = np.random.default_rng(seed)
+    days = np.arange(start.toordinal(), end.toordinal() + 1, dtype=np.int64)
+    days = days[(days % 7 != 0) & (days % 7 != 6)]  # date.fromordinal(o).weekday() == (o - 1) % 7
+    rates = 5.0 * np.cumprod(1 + rng.normal(0.0012, 0.004, len(days)))
+    return days, rates
+
+
+def make_inflation_arrays(first_year=2018, last_year=2026, seed=0):
+    """(base, values) for inflation_calculator's YiUfe series, ~3% a month"""
+    rng = np.random.default_rng(seed)
+    values = 300.0 * np.cumprod(1 + rng.uniform(0.01, 0.05, (last_year - first_year + 1) * 12))
+    return first_year * 12, values
+
+
+# PDF writing
+
+# Helvetica with WinAnsiEncoding lacks İ, ı, Ş, ş, Ğ and ğ; placing them at
+# their Windows-1254 codes keeps every other letter where cp1254 has it
+_ENCODING = b"<< /BaseEncoding /WinAnsiEncoding /Differences [208 /Gbreve 221 /Idotaccent /Scedilla 240 /gbreve 253 /dotlessi /scedilla] >>"
+
+TRANSACTION_WIDTHS = [72, 44, 46, 40, 62, 42, 58, 74, 70, 82, 56, 86]
+DIVIDEND_WIDTHS = [90, 130, 110, 80, 110]
+ROW_HEIGHT = 13
+FONT_SIZE = 6
+
+
+def _text(x, y, text, size=FONT_SIZE):
+    encoded = text.encode("cp1254").replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+    return b"BT /F1 %g Tf %g %g Td (%s) Tj ET" % (size, x, y, encoded)
+
+
+def _table(title, header, rows, widths, left, top):
+    """Content operators for a bordered table; returns (operators, bottom y)"""
+    ops = []
+    right = left + sum(widths)
+    count = len(rows) + 2
+    lines = [top - i * ROW_HEIGHT for i in range(count + 1)]
+    for y in lines:
+        ops.append(b"%g %g m %g %g l S" % (left, y, right, y))
+    x = left
+    for i in range(len(widths) + 1):
+        # The title row is one cell spanning the table
+        upper = lines[0] if i in (0, len(widths)) else lines[1]
+        ops.append(b"%g %g m %g %g l S" % (x, upper, x, lines[-1]))
+        if i < len(widths):
+            x += widths[i]
+    ops.append(_text(left + 3, lines[1] + 4, title, FONT_SIZE + 1))
+    for i, row in enumerate([header] + rows):
+        x = left
+        for width, cell in zip(widths, row):
+            ops.append(_text(x + 2, lines[i + 2] + 4, cell))
+            x += width
+    return ops, lines[-1]
+
+
+def _page(number, total, sections):
+    """One statement page: letterhead, the given tables and a footer"""
+    ops = [
+        b"0.5 w",
+        _text(30, PAGE_HEIGHT - 30, "MİDAS MENKUL DEĞERLER A.Ş.", 10),
+        _text(30, PAGE_HEIGHT - 44, "HESAP EKSTRESİ - Müşteri: Deneme Kullanıcı", 8),
+        _text(PAGE_WIDTH - 90, 20, f"Sayfa {number} / {total}", 7),
+    ]
+    top = PAGE_HEIGHT - 70
+    for title, header, rows, widths in sections:
+        table_ops, bottom = _table(title, header, rows, widths, 30, top)
+        ops += table_ops
+        top = bottom - 30
+    return b"\n".join(ops)
+
+
+def write_pdf(path, page_contents):
+    """Write a PDF with one page per content stream"""
+    objects = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding %s >>" % _ENCODING, None]
+    kids = []
+    for content in page_contents:
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 1 0 R >> >> /Contents %d 0 R >>"
+            % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_statement(path, history, dividends, rows_per_page=ROWS_PER_PAGE):
+    """
+    Write `history` and `dividends` (raw rows) as a statement PDF; returns
+    the page count. Short statements get both tables on one page.
+    """
+    transaction_pages = [history[i:i + rows_per_page] for i in range(0, len(history), rows_per_page)] or [[]]
+    dividend_pages = [dividends[i:i + rows_per_page] for i in range(0, len(dividends), rows_per_page)]
+
+    sections = [[(TRANSACTION_TITLE, TRANSACTION_COLUMNS, rows, TRANSACTION_WIDTHS)] for rows in transaction_pages]
+    if dividends and len(history) + len(dividends) + 4 <= rows_per_page:
+        sections[0].append((DIVIDEND_TITLE, DIVIDEND_COLUMNS, dividends, DIVIDEND_WIDTHS))
+    else:
+        sections += [[(DIVIDEND_TITLE, DIVIDEND_COLUMNS, rows, DIVIDEND_WIDTHS)] for rows in dividend_pages]
+
+    write_pdf(path, [_page(number, len(sections), page) for number, page in enumerate(sections, 1)])
+    return len(sections)
+
+
+def make_statement(path, pages, seed=0, rows_per_page=ROWS_PER_PAGE, symbol_count=20):
+    """
+    Write a synthetic statement of `pages` pages, one in
+    PAGES_PER_DIVIDEND_PAGE of them dividends. Returns (history, dividends),
+    the raw rows extract_tables should read back.
+    """
+    if pages <= 1:
+        history = make_history(rows_per_page // 2, symbol_count, seed)
+        dividends = make_dividends(history, rows_per_page // 4, seed)
+    else:
+        dividend_pages = pages // PAGES_PER_DIVIDEND_PAGE
+        history = make_history((pages - dividend_pages) * rows_per_page, symbol_count, seed)
+        dividends = make_dividends(history, dividend_pages * rows_per_page, seed)
+    write_statement(path, history, dividends, rows_per_page)
+    return history, dividends
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=["pdf", "history"])
+    parser.add_argument("output")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--rows-per-page", type=int, default=ROWS_PER_PAGE)
+    parser.add_argument("--transactions", type=int, default=10000)
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.kind == "pdf":
+        history, dividends = make_statement(args.output, args.pages, args.seed, args.rows_per_page, args.symbols)
+        print(f"Wrote {args.pages} pages, {len(history)} transactions and {len(dividends)} dividends to {args.output}")
+    else:
+        history = make_history(args.transactions, args.symbols, args.seed)
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(TRANSACTION_COLUMNS)
+            writer.writerows(history)
+        print(f"Wrote {len(history)} transactions over {args.symbols} symbols to {args.output}")
@@ -0,0 +1,142 @@
+"""
+Tax calculation for many users on one event loop.
+
+Same results as tax_calculator_db, but snapshot, transaction and rate
+queries go through the asyncpg pool in async_db.py, so the database round
+trips of different users overlap instead of running one after another.
+Matching itself is CPU work and runs inline between the awaits.
+
+Usage: python tax_calculator_async.py [--year YYYY] [--concurrency N] <user_id> [<user_id> ...]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+
+import async_db
+import metrics
+from fifo_snapshot import SNAPSHOT_VERSION, FifoState, is_current, matches_fingerprint, matches_state
+from inflation_calculator import get_inflation_series
+from tax_calculator_db import apply_transactions, finish_results, joined_rates, tax_results
+
+# Users calculated at the same time; bounded by the pool size by default
+CONCURRENCY = int(os.getenv('TAX_ASYNC_CONCURRENCY', '0')) or int(os.getenv('PG_POOL_MAX', '10'))
+
+
+async def load_snapshot(user_id):
+    """Async fifo_snapshot.load_snapshot"""
+    try:
+        row = await async_db.get_fifo_snapshot(user_id)
+        if row is None:
+            return None
+        watermark = (row['watermarkDate'], row['watermarkId'])
+        valid = is_current(row) and matches_fingerprint(
+            row, await async_db.get_fifo_snapshot_fingerprint(user_id, watermark)
+        )
+        if not valid:
+            await async_db.delete_fifo_snapshot(user_id)
+    except Exception as e:
+        print(f"⚠️  Could not read FIFO snapshot: {e}")
+        return None
+    if not valid:
+        return None
+
+    return FifoState.from_row(row)
+
+
+async def store_snapshot(user_id, state):
+    """Async fifo_snapshot.store_snapshot"""
+    if state.watermark is None:
+        return
+    try:
+        fingerprint = await async_db.get_fifo_snapshot_fingerprint(user_id, state.watermark)
+        if not matches_state(state, fingerprint):
+            return
+        await async_db.save_fifo_snapshot(
+            user_id, SNAPSHOT_VERSION, state.watermark,
+            state.transaction_count, state.transaction_id_sum, fingerprint[2], state.to_json()
+        )
+    except Exception as e:
+        print(f"⚠️  Could not save FIFO snapshot: {e}")
+
+
+async def ensure_inflation():
+    """
+    Load the YiUfe series through the async pool if needed; matching would
+    otherwise load it with a blocking query on the first sale.
+    """
+    if not get_inflation_series().loaded:
+        await async_db.refresh_inflation()
+
+
+async def tax_calculator_async(user_id, incremental=True, tax_year=None):
+    """Async tax_calculator_db; returns the same result dict, or None without transactions"""
+    # Each asyncio task has its own context, so concurrent users collect separately
+    with metrics.collect(enabled=metrics.active() is None) as run:
+        await ensure_inflation()
+        results = await _calculate(user_id, incremental, tax_year)
+    return finish_results(results, run, f"Tax calculation for user {user_id}")
+
+
+async def _calculate(user_id, incremental, tax_year):
+    with metrics.stage("load_snapshot"):
+        state = await load_snapshot(user_id) if incremental else None
+    if state is None:
+        state = FifoState()
+    else:
+        metrics.count("snapshot_hits")
+    with metrics.stage("load_transactions"):
+        transactions = await async_db.get_user_transactions_with_rates(user_id, state.watermark)
+        rates = joined_rates(transactions)
+
+    if not transactions and state.watermark is None:
+        return None
+
+    apply_transactions(state, transactions, rates)
+    with metrics.stage("store_snapshot"):
+        await store_snapshot(user_id, state)
+    return tax_results(state, tax_year)
+
+
+async def tax_calculator_many_async(user_ids, incremental=True, tax_year=None, concurrency=None, quiet=True):
+    """
+    Calculate several users concurrently. Returns {user_id: result} with
+    None for users without transactions and {"error": ...} for failures.
+    """
+    semaphore = asyncio.Semaphore(concurrency or CONCURRENCY)
+
+    async def calculate(user_id):
+        async with semaphore:
+            try:
+                return await tax_calculator_async(user_id, incremental, tax_year)
+            except Exception as e:
+                return {"error": str(e)}
+
+    with open(os.devnull, "w") as devnull:
+        # Per-user reports from interleaved users are not readable anyway
+        with contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext():
+            # Once up front, so concurrent users do not each start a reload
+            await ensure_inflation()
+            results = await asyncio.gather(*(calculate(user_id) for user_id in user_ids))
+    return dict(zip(user_ids, results))
+
+
+async def _main(args):
+    try:
+        return await tax_calculator_many_async(
+            args.user_ids, incremental=not args.full, tax_year=args.year, concurrency=args.concurrency
+        )
+    finally:
+        await async_db.close_async_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calculate capital gains tax for several users concurrently")
+    parser.add_argument("user_ids", nargs="+")
+    parser.add_argument("--year", type=int, help="only report sales and fees of this tax year")
+    parser.add_argument("--concurrency", type=int, help=f"users in flight at once (default: {CONCURRENCY})")
+    parser.add_argument("--full", action="store_true", help="ignore FIFO snapshots and replay all transactions")
+    results = asyncio.run(_main(parser.parse_args()))
+    print(json.dumps(results, indent=2, default=str))
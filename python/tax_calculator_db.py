@@ -1,13 +1,21 @@
 import locale
 from datetime import datetime
-from collections import deque
-from get_dolar import get_dolar
-from inflation_calculator import calculate_inflation
-from db_connection import get_user_transactions
-from get_commission_db import get_commissions_db
+import numpy as np
+from get_dolar import MAX_FALLBACK_DAYS, usd_rates
+from inflation_calculator import get_inflation_series
+from fifo_engine import match_fifo, summarize
+from fifo_snapshot import FifoState, load_snapshot, store_snapshot
+from db_connection import STREAM_ITERSIZE, stream_user_transaction_chunks
+from history_snapshot import current_history_snapshot
+from get_commission_db import fees_in_try
+from logger import get_logger
+import metrics
+import argparse
 import json
 import sys
 
+logger = get_logger('tax_calculator_db')
+
 inflation_threshold = 10
 
 try:
@@ -15,128 +23,135 @@ try:
 except locale.Error:
     locale.setlocale(locale.LC_TIME, "Turkish_Turkey.1254")  # For Windows systems
 
-def tax_calculator_db(user_id):
-    print("\n=== Starting Tax Calculation ===")
-    # Get transactions from database
-    transactions = get_user_transactions(user_id)
-    
-    if not transactions:
-        # print("No transactions found for the user")
-        return None
+def joined_rates(transactions):
+    """The USD/TRY rates joined in SQL (see get_user_transactions_with_rates), NaN where NULL"""
+    return transactions.rates
+
+
+def _transaction_chunks(user_id, after, join_rates):
+    """
+    The transactions after the watermark as (TransactionArray, USD/TRY
+    rates) chunks in (date, id) order, DB_STREAM_ITERSIZE rows each, so
+    long histories are never held in full.
+
+    They are sliced from the user's memory-mapped history snapshot
+    (history_snapshot.py), rebuilt first if statements were uploaded since,
+    and streamed from a server-side cursor if there is none. From the database the rates are joined
+    in SQL, or with `join_rates=False` taken from the in-process rate table
+    (batch runs load it once and share it between users); snapshots hold
+    the rates joined in SQL, which follow the same rule.
+    """
+    with metrics.stage("load_transactions"):
+        history = current_history_snapshot(user_id)
+    if history is not None:
+        transactions = history.transactions.after(after)
+        for start in range(0, len(transactions), STREAM_ITERSIZE):
+            chunk = transactions[start:start + STREAM_ITERSIZE]
+            yield chunk, joined_rates(chunk)
+        return
+
+    chunks = stream_user_transaction_chunks(user_id, after, with_rates=join_rates, max_fallback_days=MAX_FALLBACK_DAYS)
+    while True:
+        with metrics.stage("load_transactions"):
+            transactions = next(chunks, None)
+        if transactions is None:
+            return
+        if join_rates:
+            rates = joined_rates(transactions)
+        else:
+            with metrics.stage("rate_lookup"):
+                rates = usd_rates(transactions)
+        yield transactions, rates
 
-    print(f"\nFound {len(transactions)} total transactions")
-    
-    # Separate buy and sell transactions
-    sell_transactions = [t for t in transactions if t['operationType'] == "Satış"]
-    buy_transactions = [t for t in transactions if t['operationType'] == "Alış"]
-    
-    print(f"Buy transactions: {len(buy_transactions)}")
-    print(f"Sell transactions: {len(sell_transactions)}")
-
-    # Initialize tracking dictionaries
-    fifo_queues = {}
-    profit_loss = {}
-    net_profit = 0.0
-    net_loss = 0.0
-
-    print("\n=== Processing Buy Transactions ===")
-    # Process buy transactions
-    for transaction in buy_transactions:
-        symbol = transaction['symbol']
-        quantity = float(transaction['executedQuantity'])
-        date = transaction['date']
-        price = float(transaction['averagePrice'])
-        
-        print(f"\nProcessing buy: {symbol}")
-        print(f"Original price: {price} {transaction['currency']}")
-        
-        # Convert price to TRY if needed
-        if transaction['currency'] == 'USD':
-            formatted_date = date.strftime("%d.%m.%Y")
-            exchange_rate = get_dolar(formatted_date)
-            if exchange_rate:
-                price *= exchange_rate
-                print(f"Converted price: {price} TRY (rate: {exchange_rate})")
-
-        if quantity > 0:
-            if symbol not in fifo_queues:
-                fifo_queues[symbol] = deque()
-            fifo_queues[symbol].append({"quantity": quantity, "price": price, "date": date})
-            print(f"Added to queue: {quantity} units at {price} TRY")
-
-    print("\n=== Processing Sell Transactions ===")
-    # Process sell transactions
-    for transaction in sell_transactions:
-        symbol = transaction['symbol']
-        sell_quantity = float(transaction['executedQuantity'])
-        sell_date = transaction['date']
-        sell_price = float(transaction['averagePrice'])
-        
-        print(f"\nProcessing sell: {symbol}")
-        print(f"Original sell price: {sell_price} {transaction['currency']}")
-        
-        # Convert sell price to TRY if needed
-        if transaction['currency'] == 'USD':
-            formatted_date = sell_date.strftime("%d.%m.%Y")
-            exchange_rate = get_dolar(formatted_date)
-            if exchange_rate:
-                sell_price *= exchange_rate
-                print(f"Converted sell price: {sell_price} TRY (rate: {exchange_rate})")
-
-        if symbol not in fifo_queues or not fifo_queues[symbol]:
+
+def _add_totals(bucket, profit_loss, net_profit, net_loss):
+    for symbol, profit in profit_loss.items():
+        bucket["profit_loss"][symbol] = bucket["profit_loss"].get(symbol, 0.0) + profit
+    bucket["net_profit"] += net_profit
+    bucket["net_loss"] += net_loss
+
+
+def apply_transactions(state, transactions, rates):
+    """
+    Advance a FifoState over a TransactionArray of new transactions, in
+    (date, id) order after its watermark, with their USD/TRY rates (NaN
+    where none applies). No database access, so sync and async callers
+    share it.
+    """
+    print(f"\nFound {len(transactions)} new transactions")
+    metrics.count("transactions", len(transactions))
+    metrics.count("rates_missing", int(np.isnan(rates).sum()))
+
+    # The same rates convert trade prices and fees
+    years = transactions.years()
+    with metrics.stage("commission"):
+        fees = fees_in_try(transactions, rates)
+        state.commission += float(fees.sum())
+        year_list, year_of_row = np.unique(years, return_inverse=True)
+        for year, total in zip(year_list, np.bincount(year_of_row, weights=fees, minlength=len(year_list))):
+            state.year(int(year))["commission"] += float(total)
+
+    # Trades are matched in chronological order, so replaying only the
+    # transactions after the watermark gives the same result as a full replay
+    trade_rows = np.flatnonzero(transactions.is_trade)
+    trades = transactions[trade_rows]
+    is_buy = trades.is_buy
+
+    print(f"Buy transactions: {int(is_buy.sum())}")
+    print(f"Sell transactions: {int((~is_buy).sum())}")
+    metrics.count("trades", len(trades))
+
+    if len(trades):
+        symbols = trades.symbol_names()
+        quantities = trades.rows["quantity"].copy()
+        prices = trades.rows["price"].copy()
+        months = trades.months()
+
+        # Convert USD prices to TRY; prices without a rate are left as they are
+        trade_rates = rates[trade_rows]
+        found = ~np.isnan(trade_rates) & (trade_rates != 0)
+        prices[found] *= trade_rates[found]
+
+        print("\n=== Matching Sales (FIFO) ===")
+        with metrics.stage("match"):
+            sale_profit, _ = match_fifo(
+                symbols, is_buy, quantities, prices, months, get_inflation_series(), inflation_threshold,
+                books=state.books
+            )
+        new_profit_loss, new_profit, new_loss = summarize(symbols, sale_profit)
+        for symbol, profit in new_profit_loss.items():
+            state.profit_loss[symbol] = state.profit_loss.get(symbol, 0.0) + profit
+        state.net_profit += new_profit
+        state.net_loss += new_loss
+
+        # Sales count towards the tax year they were made in
+        sale_years = years[trade_rows]
+        for year in np.unique(sale_years[~is_buy]):
+            in_year = sale_years == year
+            _add_totals(state.year(int(year)), *summarize(symbols[in_year], sale_profit[in_year]))
+
+        unmatched = (~is_buy) & np.isnan(sale_profit)
+        for symbol in sorted(set(symbols[unmatched])):
             print(f"No available purchases for symbol {symbol} to match the sale.")
-            continue
-
-        total_profit = 0.0
-        remaining_sell_quantity = sell_quantity
-        print(f"Need to sell: {remaining_sell_quantity} units")
-
-        while remaining_sell_quantity > 0 and fifo_queues[symbol]:
-            buy = fifo_queues[symbol][0]
-            buy_quantity = buy["quantity"]
-            buy_price = buy["price"]
-            buy_date = buy["date"]
-
-            print(f"\nMatching with buy: {buy_quantity} units at {buy_price} TRY")
-
-            # Calculate inflation adjustment
-            buy_year, buy_month = buy_date.year, buy_date.month - 1
-            sell_year, sell_month = sell_date.year, sell_date.month - 1
-            inflation_rate = calculate_inflation(buy_year, buy_month, sell_year, sell_month - 1)
-
-            if inflation_rate and inflation_rate > inflation_threshold:
-                print(f"Applying inflation adjustment: {inflation_rate}%")
-                print(f"Price before adjustment: {buy_price}")
-                buy_price *= (1 + inflation_rate / 100)
-                print(f"Price after adjustment: {buy_price}")
-
-            if buy_quantity <= remaining_sell_quantity:
-                profit = (sell_price - buy_price) * buy_quantity
-                total_profit += profit
-                remaining_sell_quantity -= buy_quantity
-                fifo_queues[symbol].popleft()
-                print(f"Used entire buy lot. Profit: {profit:.2f} TRY")
-                print(f"Remaining to sell: {remaining_sell_quantity}")
-            else:
-                profit = (sell_price - buy_price) * remaining_sell_quantity
-                total_profit += profit
-                buy["quantity"] -= remaining_sell_quantity
-                remaining_sell_quantity = 0
-                print(f"Used partial buy lot. Profit: {profit:.2f} TRY")
-                print(f"Remaining in buy lot: {buy['quantity']}")
-
-        print(f"\nTotal profit for this sale: {total_profit:.2f} TRY")
-
-        # Update profit/loss tracking
-        if symbol in profit_loss:
-            profit_loss[symbol] += total_profit
-        else:
-            profit_loss[symbol] = total_profit
 
-        if total_profit > 0:
-            net_profit += total_profit
-        else:
-            net_loss += total_profit
+    state.advance(transactions)
+
+
+def tax_results(state, tax_year=None):
+    """Result dict of a FifoState, all-time or for one tax year"""
+    if tax_year is None:
+        totals = {
+            "profit_loss": state.profit_loss,
+            "net_profit": state.net_profit,
+            "net_loss": state.net_loss,
+            "commission": state.commission,
+        }
+    else:
+        totals = state.year(tax_year)
+        print(f"\nTax year: {tax_year}")
+    profit_loss = totals["profit_loss"]
+    net_profit = totals["net_profit"]
+    net_loss = totals["net_loss"]
 
     print("\n=== Final Calculations ===")
     print("\nProfit/Loss by Symbol:")
@@ -146,7 +161,7 @@ def tax_calculator_db(user_id):
     total_pl = sum(profit_loss.values())
     print(f"\nTotal profit/loss before commissions: {total_pl:.2f} TRY")
     
-    commission = get_commissions_db(user_id)
+    commission = totals["commission"]
     print(f"Total commissions: {commission:.2f} TRY")
     
     final_pl = total_pl - commission
@@ -157,20 +172,73 @@ def tax_calculator_db(user_id):
         "total_profit": net_profit,
         "total_loss": net_loss,
         "total_profit_loss": total_pl,
+        "total_commission": commission,
         "total_profit_loss_after_commissions": final_pl
     }
+    if tax_year is not None:
+        results["tax_year"] = tax_year
+    return results
 
-    # Print the JSON result for the Node.js endpoint to capture
+
+def finish_results(results, run, label):
+    """
+    Attach the metrics of `run` (see metrics.collect) to a tax_results dict
+    and print it as JSON for the Node.js endpoint to capture
+    """
+    if results is None:
+        return None
+    if run is not None:
+        results["metrics"] = metrics.report(run, label, logger)
     print(json.dumps(results))
     return results
 
+
+def tax_calculator_db(user_id, incremental=True, tax_year=None, join_rates=True):
+    """
+    Capital gains and commissions of a user, all-time or, with `tax_year`,
+    only sales and fees falling in that calendar year.
+
+    The result carries a "metrics" object unless metrics are disabled or
+    the caller already collects them (batch runs merge them per user).
+    """
+    with metrics.collect(enabled=metrics.active() is None) as run:
+        results = _calculate(user_id, incremental, tax_year, join_rates)
+    return finish_results(results, run, f"Tax calculation for user {user_id}")
+
+
+def _calculate(user_id, incremental, tax_year, join_rates):
+    print("\n=== Starting Tax Calculation ===")
+    # Continue from the saved FIFO state if it is still valid
+    with metrics.stage("load_snapshot"):
+        state = load_snapshot(user_id) if incremental else None
+    if state is not None:
+        print(f"Resuming from FIFO snapshot at {state.watermark[0]} (transaction {state.watermark[1]})")
+        metrics.count("snapshot_hits")
+    else:
+        state = FifoState()
+    # Chunks are applied as they arrive; the FIFO books carry over between
+    # them just as they do between resumed runs
+    applied = False
+    for transactions, rates in _transaction_chunks(user_id, state.watermark, join_rates):
+        apply_transactions(state, transactions, rates)
+        applied = True
+
+    if not applied and state.watermark is None:
+        # print("No transactions found for the user")
+        return None
+
+    with metrics.stage("store_snapshot"):
+        store_snapshot(user_id, state)
+    return tax_results(state, tax_year)
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python tax_calculator_db.py <user_id>")
-        sys.exit(1)
-    
-    user_id = sys.argv[1]
-    results = tax_calculator_db(user_id)
+    parser = argparse.ArgumentParser(description="Calculate a user's capital gains tax")
+    parser.add_argument("user_id")
+    parser.add_argument("--full", action="store_true", help="ignore the FIFO snapshot and replay all transactions")
+    parser.add_argument("--year", type=int, help="only report sales and fees of this tax year")
+    args = parser.parse_args()
+
+    results = tax_calculator_db(args.user_id, incremental=not args.full, tax_year=args.year)
     if results:
         print("\n=== Results as JSON ===")
-        print(json.dumps(results, indent=2)) 
\ No newline at end of file
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Test script for the asyncio database layer (async_db.py) against the local
+PostgreSQL database configured in .env.
+
+Compares every async read with its blocking counterpart, inserts a few rows
+inside a transaction that is rolled back, checks that tax_calculator_async
+matches tax_calculator_db, and times sequential against concurrent reads.
+
+Usage: python test_async_db.py [<user_id>]   # default: first user with transactions
+"""
+
+import asyncio
+import contextlib
+import io
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import async_db
+import db_connection
+from get_dolar import get_rate_table, refresh_rates
+from inflation_calculator import calculate_inflation, get_inflation_series, invalidate_inflation, refresh_inflation
+from logger import get_logger
+from tax_calculator_async import tax_calculator_async
+from tax_calculator_db import tax_calculator_db
+
+logger = get_logger('test_async_db')
+
+
+def _rows(records):
+    return [dict(record) for record in records]
+
+
+def _without_metrics(result):
+    # Timings differ between any two runs
+    return {key: value for key, value in result.items() if key != "metrics"}
+
+
+def _quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+async def test_reads(user_id):
+    """Async reads return the same rows as the blocking ones"""
+    checks = {
+        "transactions": (
+            sorted(_rows(await async_db.get_user_transactions(user_id)), key=lambda t: t['id']),
+            sorted(_rows(db_connection.get_user_transactions(user_id)), key=lambda t: t['id'])
+        ),
+        "transactions since": (
+            (await async_db.get_user_transactions_since(user_id)).to_list(),
+            db_connection.get_user_transactions_since(user_id).to_list()
+        ),
+        "transactions with rates": (
+            (await async_db.get_user_transactions_with_rates(user_id)).to_list(),
+            db_connection.get_user_transactions_with_rates(user_id).to_list()
+        ),
+        "dividends": (
+            sorted(_rows(await async_db.get_user_dividends(user_id)), key=lambda d: d['id']),
+            sorted(_rows(db_connection.get_user_dividends(user_id)), key=lambda d: d['id'])
+        ),
+    }
+    ok = True
+    for name, (async_rows, sync_rows) in checks.items():
+        if async_rows != sync_rows:
+            logger.error(f"{name}: async returned {len(async_rows)} rows, blocking {len(sync_rows)}, contents differ")
+            ok = False
+        else:
+            logger.info(f"{name}: {len(async_rows)} rows match")
+    return ok
+
+
+async def test_lookups(user_id):
+    """Rates and inflation loaded through the async pool give the blocking results"""
+    transactions = await async_db.get_user_transactions(user_id)
+    dates = [t['date'] for t in transactions[:50]]
+
+    _quiet(refresh_rates)
+    _quiet(refresh_inflation)
+    expected_rates = [get_rate_table().lookup(d) for d in dates]
+    expected_inflation = calculate_inflation(2020, 0, 2023, 11)
+
+    await async_db.refresh_rates()
+    await async_db.refresh_inflation()
+    rates = [await async_db.get_dolar(d) for d in dates]
+    inflation = await async_db.calculate_inflation(2020, 0, 2023, 11)
+
+    ok = rates == expected_rates and inflation == expected_inflation
+    logger.info(f"Rate lookups for {len(dates)} dates and inflation 2020-01..2023-12 match: {ok}")
+    return ok
+
+
+async def test_insert(user_id):
+    """Bulk inserts land inside the caller's transaction; everything is rolled back"""
+    now = datetime.now()
+    transactions_df = pd.DataFrame([{
+        "Tarih": now, "İşlem Türü": "Test", "Sembol": "ASYNCTEST", "İşlem Tipi": "Alış",
+        "İşlem Durumu": "Gerçekleşti", "Para Birimi": "USD", "Emir Adedi": 1, "Emir Tutarı": 10.0,
+        "Gerçekleşen Adet": 1, "Ortalama İşlem Fiyatı": 10.0, "İşlem Ücreti": 0.1, "İşlem Tutarı": 10.0,
+    }] * 3)
+    dividends_df = pd.DataFrame([{
+        "Ödeme Tarihi": now, "Sermaya Piyasası Aracı": "ASYNCTEST",
+        "Brüt Temettü Tutarı": 1.0, "Stopaj*": 0.1, "Net Temettü Tutarı": 0.9,
+    }])
+
+    pool = await async_db.get_async_pool()
+    async with pool.acquire() as connection:
+        transaction = connection.transaction()
+        await transaction.start()
+        try:
+            transaction_report = await async_db.bulk_insert_transactions(transactions_df, user_id, connection=connection)
+            dividend_report = await async_db.bulk_insert_dividends(dividends_df, user_id, connection=connection)
+            visible = await connection.fetchval(
+                'SELECT COUNT(*) FROM "Transaction" WHERE "userId" = $1 AND symbol = $2', user_id, "ASYNCTEST"
+            )
+        finally:
+            await transaction.rollback()
+
+    left = (await async_db.fetchrow(
+        'SELECT COUNT(*) FROM "Transaction" WHERE "userId" = $1 AND symbol = $2', user_id, "ASYNCTEST"
+    ))[0]
+    ok = (transaction_report["inserted"] == 3 and dividend_report["inserted"] == 1
+          and visible == 3 and left == 0)
+    logger.info(f"Inserted {transaction_report['inserted']} transactions and {dividend_report['inserted']} dividends, "
+                f"{visible} visible in the transaction, {left} left after rollback")
+    return ok
+
+
+async def test_tax(user_id):
+    """
+    tax_calculator_async matches tax_calculator_db (both rebuild the user's
+    FIFO snapshot) and loads the YiUfe series without the blocking query
+    """
+    expected = _quiet(tax_calculator_db, user_id, incremental=False)
+
+    def blocking_refresh():
+        raise AssertionError("YiUfe loaded through the blocking connection pool")
+
+    invalidate_inflation()
+    get_inflation_series().refresh = blocking_refresh
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = await tax_calculator_async(user_id, incremental=False)
+            resumed = await tax_calculator_async(user_id, incremental=True)
+    finally:
+        del get_inflation_series().refresh
+    expected = _without_metrics(expected)
+    ok = _without_metrics(result) == expected and _without_metrics(resumed) == expected
+    logger.info(f"Async tax result matches the blocking one: {ok}")
+    return ok
+
+
+async def test_concurrency(user_ids, repeat=5):
+    """Times the same reads sequentially and overlapped on the event loop"""
+    jobs = [user_id for user_id in user_ids for _ in range(repeat)]
+
+    started = time.perf_counter()
+    for user_id in jobs:
+        await async_db.get_user_transactions_with_rates(user_id)
+    sequential = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await asyncio.gather(*(async_db.get_user_transactions_with_rates(user_id) for user_id in jobs))
+    concurrent = time.perf_counter() - started
+
+    logger.info(f"{len(jobs)} transaction reads: {sequential:.3f}s sequential, {concurrent:.3f}s concurrent "
+                f"({sequential / concurrent:.1f}x)")
+    return True
+
+
+async def run_tests(user_id=None):
+    try:
+        user_ids = db_connection.get_user_ids_with_transactions()
+        if user_id is None:
+            if not user_ids:
+                logger.error("No user with transactions found")
+                return False
+            user_id = user_ids[0]
+        logger.info(f"Testing async database layer with user {user_id}")
+
+        results = {
+            "reads": await test_reads(user_id),
+            "lookups": await test_lookups(user_id),
+            "insert": await test_insert(user_id),
+            "tax": await test_tax(user_id),
+            "concurrency": await test_concurrency(user_ids[:10] or [user_id]),
+        }
+        for name, ok in results.items():
+            logger.info(f"{name}: {'passed' if ok else 'FAILED'}")
+        return all(results.values())
+
+    except Exception as e:
+        logger.error(f"Error testing async database layer: {str(e)}", exc_info=True)
+        return False
+    finally:
+        await async_db.close_async_pool()
+
+
+if __name__ == "__main__":
+    success = asyncio.run(run_tests(sys.argv[1] if len(sys.argv) > 1 else None))
+
+    if success:
+        print("✅ Async database layer test successful!")
+    else:
+        print("❌ Async database layer test failed. Check logs for details.")
+        sys.exit(1)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Checks the SQL the asyncio database layer sends, without a database.
+
+async_db runs the psycopg2 queries of db_connection after rewriting their
+%(name)s placeholders to asyncpg's $n form (async_db._numbered). Every
+shared query is rewritten here and rendered both ways with psycopg2's own
+quoting: the two renderings must be the same SQL text, so placeholders
+keep their casts (::timestamp, ::int) and each $n gets the value of the
+name it replaced, including names used more than once. The async call
+sites are run against a fake pool to check the arguments they pass, and
+db_connection's streaming reads against a fake connection to check they
+use a named (server-side) cursor.
+
+Usage: python test_async_sql.py
+"""
+
+import asyncio
+import re
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+from psycopg2.extensions import adapt
+
+import async_db
+import db_connection
+from db_connection import (
+    FIFO_SNAPSHOT_FINGERPRINT_QUERY, _history_filters, fifo_snapshot_fingerprint_params,
+    transactions_query, transactions_with_rates_query
+)
+from logger import get_logger
+
+logger = get_logger('test_async_sql')
+
+USER_ID = "user-1"
+WATERMARK = (datetime(2024, 3, 15, 10, 30), 42)
+
+
+def _quoted(value):
+    return adapt(value).getquoted().decode("utf-8")
+
+
+def _queries():
+    """(name, psycopg2 query, params) of every query async_db rewrites"""
+    rates = {"user_id": USER_ID, "max_fallback_days": 15}
+    after = dict(rates, after_date=WATERMARK[0], after_id=WATERMARK[1])
+    filtered = dict(rates)
+    filters = _history_filters(filtered, 't.date', datetime(2023, 1, 1), datetime(2024, 1, 1), ["AAPL", "O'NEIL"], 't.symbol')
+    return [
+        ("transactions with rates", transactions_with_rates_query(), rates),
+        ("transactions with rates after", transactions_with_rates_query(WATERMARK), after),
+        ("filtered transactions with rates", transactions_query(with_rates=True, filters=filters), filtered),
+        ("FIFO snapshot fingerprint", FIFO_SNAPSHOT_FINGERPRINT_QUERY, fifo_snapshot_fingerprint_params(USER_ID, WATERMARK)),
+    ]
+
+
+def _rendered_numbered(query, args):
+    return re.sub(r"\$(\d+)", lambda match: _quoted(args[int(match.group(1)) - 1]), query)
+
+
+def test_rewriting():
+    """Both placeholder styles render to the same SQL, $1..$n in order"""
+    ok = True
+    for name, query, params in _queries():
+        numbered, args = async_db._numbered(query, params)
+        names = re.findall(r"%\((\w+)\)s", query)
+        numbers = [int(number) for number in re.findall(r"\$(\d+)", numbered)]
+        expected = query % {key: _quoted(value) for key, value in params.items()}
+        problems = []
+        if "%(" in numbered:
+            problems.append("placeholders left over")
+        if numbers != list(range(1, len(names) + 1)) or len(args) != len(names):
+            problems.append(f"placeholders {numbers} for {len(names)} parameters")
+        elif args != [params[key] for key in names]:
+            problems.append(f"arguments {args}")
+        elif _rendered_numbered(numbered, args) != expected:
+            problems.append("renders differently")
+        if problems:
+            logger.error(f"{name}: {', '.join(problems)}\n{numbered}")
+            ok = False
+        else:
+            logger.info(f"{name}: {len(args)} parameters, {len(set(names))} distinct")
+    return ok
+
+
+def test_casts():
+    """Casts written after a placeholder stay attached to its $n"""
+    query, args = async_db._numbered(
+        FIFO_SNAPSHOT_FINGERPRINT_QUERY, fifo_snapshot_fingerprint_params(USER_ID, WATERMARK)
+    )
+    timestamps = re.findall(r"\$(\d+)::timestamp", query)
+    ints = re.findall(r"\$(\d+)::int", query)
+    ok = (len(timestamps) == 3 and all(args[int(n) - 1] == WATERMARK[0] for n in timestamps)
+          and len(ints) == 1 and args[int(ints[0]) - 1] == 15)
+    logger.info(f"Casts on ${', $'.join(timestamps)} (timestamp) and ${', $'.join(ints)} (int): {'passed' if ok else 'FAILED'}")
+    return ok
+
+
+def test_missing_parameter():
+    try:
+        async_db._numbered(transactions_with_rates_query(WATERMARK), {"user_id": USER_ID, "max_fallback_days": 15})
+    except KeyError as e:
+        logger.info(f"Missing parameter {e} raises KeyError: passed")
+        return True
+    logger.error("A missing parameter was not reported")
+    return False
+
+
+async def _async_calls():
+    calls = []
+
+    async def fetch(query, *args):
+        calls.append((query, args))
+        return []
+
+    async def fetchrow(query, *args):
+        calls.append((query, args))
+        return (3, 126, "digest")
+
+    original = async_db.fetch, async_db.fetchrow
+    async_db.fetch, async_db.fetchrow = fetch, fetchrow
+    try:
+        await async_db.get_user_transactions_with_rates(USER_ID, WATERMARK, 10)
+        fingerprint = await async_db.get_fifo_snapshot_fingerprint(USER_ID, WATERMARK, 10)
+    finally:
+        async_db.fetch, async_db.fetchrow = original
+    return calls, fingerprint
+
+
+def test_call_sites():
+    """The async functions pass their arguments in the order of the rewritten query"""
+    calls, fingerprint = asyncio.run(_async_calls())
+    (rates_query, rates_args), (fingerprint_query, fingerprint_args) = calls
+    expected_rates = async_db._numbered(
+        transactions_with_rates_query(WATERMARK),
+        {"user_id": USER_ID, "max_fallback_days": 10, "after_date": WATERMARK[0], "after_id": WATERMARK[1]},
+    )
+    expected_fingerprint = async_db._numbered(
+        FIFO_SNAPSHOT_FINGERPRINT_QUERY, fifo_snapshot_fingerprint_params(USER_ID, WATERMARK, 10)
+    )
+    ok = ((rates_query, list(rates_args)) == expected_rates
+          and (fingerprint_query, list(fingerprint_args)) == expected_fingerprint
+          and fingerprint == (3, 126, "digest"))
+    logger.info(f"Async call sites: {'passed' if ok else 'FAILED'}")
+    return ok
+
+
+class _FakeCursor:
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.itersize = None
+        self.executed = None
+        self.fetches = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+    def execute(self, query, params=None):
+        self.executed = (query, params)
+
+    def fetchmany(self, size):
+        self.fetches += 1
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+class _FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.cursors = []
+        self.returned = False
+
+    def cursor(self, name=None, cursor_factory=None):
+        self.cursors.append(_FakeCursor(name, list(self.rows)))
+        return self.cursors[-1]
+
+
+def test_server_side_cursor():
+    """Streaming reads use a uniquely named cursor and fetch itersize rows at a time"""
+    connections = []
+
+    @contextmanager
+    def pooled_connection(timeout=None):
+        connection = _FakeConnection([(i,) for i in range(25)])
+        connections.append(connection)
+        try:
+            yield connection
+        finally:
+            connection.returned = True
+
+    original = db_connection.pooled_connection
+    db_connection.pooled_connection = pooled_connection
+    try:
+        rows = list(db_connection.stream_user_transactions(USER_ID, start=datetime(2023, 1, 1), itersize=10))
+        stream = db_connection.stream_user_transactions(USER_ID, itersize=10)
+        next(stream)
+        stream.close()
+    finally:
+        db_connection.pooled_connection = original
+
+    full, closed = connections
+    cursor = full.cursors[0]
+    names = [connection.cursors[0].name for connection in connections]
+    ok = (
+        len(rows) == 25 and cursor.itersize == 10 and cursor.fetches == 3
+        and all(name and name.startswith("stream_") for name in names) and len(set(names)) == 2
+        and cursor.executed[1] == {"user_id": USER_ID, "start": datetime(2023, 1, 1)}
+        and "%(start)s" in cursor.executed[0]
+        and cursor.closed and full.returned
+        # A generator closed early still releases its cursor and connection
+        and closed.cursors[0].closed and closed.returned
+    )
+    logger.info(f"Server-side cursor ({cursor.fetches} fetches of {cursor.itersize}): {'passed' if ok else 'FAILED'}")
+    return ok
+
+
+def run_tests():
+    results = {
+        "rewriting": test_rewriting(),
+        "casts": test_casts(),
+        "missing parameter": test_missing_parameter(),
+        "call sites": test_call_sites(),
+        "server-side cursor": test_server_side_cursor(),
+    }
+    for name, ok in results.items():
+        logger.info(f"{name}: {'passed' if ok else 'FAILED'}")
+    return all(results.values())
+
+
+if __name__ == "__main__":
+    if run_tests():
+        print("✅ Async SQL rewriting matches the psycopg2 queries!")
+    else:
+        print("❌ Async SQL rewriting differs from the psycopg2 queries. Check logs for details.")
+        sys.exit(1)
@@ -0,0 +1,162 @@
+"""
+Compact in-memory transactions for the tax calculation path.
+
+A user's history is one NumPy structured array of TRANSACTION_DTYPE (54
+bytes a row) with symbols stored as codes into a shared list, instead of a
+psycopg2 DictRow per transaction holding every column of the table as
+Python objects. It is filled from queries that select only TAX_COLUMNS
+(see db_connection.get_user_transactions_since), and the calculation reads
+whole columns from it.
+
+Memory for one million transactions (benchmark_transaction_memory.py):
+about 900 MB as DictRows of `SELECT t.*` with the joined rate, 53 MB here
+(roughly 300 MB at peak while the projected rows are converted).
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+# Transaction columns the tax calculation reads, in query order; queries
+# joining the USD/TRY rate add it as a ninth column
+TAX_COLUMNS = [
+    "id", "date", "symbol", "operationType", "currency",
+    "executedQuantity", "averagePrice", "transactionFee",
+]
+
+BUY = 1
+SELL = -1
+_OPERATIONS = {"Alış": BUY, "Satış": SELL}
+
+TRANSACTION_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("date", "datetime64[us]"),
+    ("symbol", np.int32),       # index into TransactionArray.symbols
+    ("operation", np.int8),     # BUY, SELL or 0 for anything else
+    ("usd", np.bool_),
+    ("quantity", np.float64),
+    ("price", np.float64),
+    ("fee", np.float64),
+    ("rate", np.float64),       # joined USD/TRY rate, NaN where none
+])
+
+# date.toordinal() of 1970-01-01, the datetime64 epoch
+_EPOCH_ORDINAL = 719163
+
+
+class TransactionArray:
+    """Transactions in processing order as one structured array"""
+
+    __slots__ = ("rows", "symbols")
+
+    def __init__(self, rows=None, symbols=None):
+        self.rows = np.empty(0, dtype=TRANSACTION_DTYPE) if rows is None else rows
+        self.symbols = [] if symbols is None else symbols
+
+    @classmethod
+    def from_rows(cls, rows, symbols=None):
+        """
+        Build from query rows with TAX_COLUMNS in order, optionally followed
+        by the USD/TRY rate. Tuples, DictRows and asyncpg Records all work.
+        Symbols are coded against `symbols` (extended in place) when given,
+        so chunks of one history can share a symbol list.
+        """
+        symbols = [] if symbols is None else symbols
+        codes = {symbol: code for code, symbol in enumerate(symbols)}
+        array = np.empty(len(rows), dtype=TRANSACTION_DTYPE)
+        if not len(rows):
+            return cls(array, symbols)
+
+        columns = list(zip(*rows))
+        array["id"] = columns[0]
+        array["date"] = np.array(columns[1], dtype="datetime64[us]")
+        symbol_codes = array["symbol"]
+        for i, symbol in enumerate(columns[2]):
+            code = codes.get(symbol)
+            if code is None:
+                code = codes[symbol] = len(symbols)
+                symbols.append(symbol)
+            symbol_codes[i] = code
+        array["operation"] = [_OPERATIONS.get(operation, 0) for operation in columns[3]]
+        array["usd"] = [currency == "USD" for currency in columns[4]]
+        # NULLs become NaN; a missing fee counts as none
+        array["quantity"] = np.array(columns[5], dtype=np.float64)
+        array["price"] = np.array(columns[6], dtype=np.float64)
+        array["fee"] = np.nan_to_num(np.array(columns[7], dtype=np.float64))
+        array["rate"] = np.array(columns[8], dtype=np.float64) if len(columns) > 8 else np.nan
+        return cls(array, symbols)
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Join arrays built against the same symbol list"""
+        parts = list(parts)
+        if not parts:
+            return cls()
+        return cls(np.concatenate([part.rows for part in parts]), parts[-1].symbols)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        """Rows selected by a slice, mask or index array, sharing the symbol list"""
+        return TransactionArray(self.rows[index], self.symbols)
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes
+
+    @property
+    def rates(self):
+        return self.rows["rate"]
+
+    @property
+    def is_buy(self):
+        return self.rows["operation"] == BUY
+
+    @property
+    def is_trade(self):
+        return self.rows["operation"] != 0
+
+    def symbol_names(self):
+        """Symbol of every row as an object array"""
+        return np.array(self.symbols, dtype=object)[self.rows["symbol"]] if self.symbols else np.empty(0, dtype=object)
+
+    def years(self):
+        return self.rows["date"].astype("datetime64[Y]").astype(np.int64) + 1970
+
+    def months(self):
+        """Flat month indices (inflation_calculator.month_index)"""
+        return self.rows["date"].astype("datetime64[M]").astype(np.int64) + 1970 * 12
+
+    def day_ordinals(self):
+        """date.toordinal() of every row"""
+        return self.rows["date"].astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+
+    def watermark(self):
+        """(date, id) of the last row, or None when empty"""
+        if not len(self.rows):
+            return None
+        last = self.rows[-1]
+        return last["date"].astype(datetime), int(last["id"])
+
+    def after(self, watermark):
+        """The rows strictly after a (date, id) watermark, as a view; all rows for None"""
+        if watermark is None:
+            return self
+        date, transaction_id = np.datetime64(watermark[0], "us"), watermark[1]
+        dates = self.rows["date"]
+        start = np.searchsorted(dates, date, "left")
+        end = np.searchsorted(dates, date, "right")
+        start += np.searchsorted(self.rows["id"][start:end], transaction_id, "right")
+        return self[start:]
+
+    def to_list(self):
+        """Rows as (id, date, symbol, operationType, is USD, quantity, price, fee, rate or None) tuples, e.g. to compare"""
+        names = self.symbol_names()
+        operations = {BUY: "Alış", SELL: "Satış"}
+        return [
+            (int(row["id"]), row["date"].astype(datetime), names[i], operations.get(int(row["operation"])),
+             bool(row["usd"]), float(row["quantity"]), float(row["price"]), float(row["fee"]),
+             None if np.isnan(row["rate"]) else float(row["rate"]))
+            for i, row in enumerate(self.rows)
+        ]
@@ -1,8 +1,37 @@
+"""
+Copy the Dolar and YiUfe tables from the old MySQL database to PostgreSQL.
+
+Every table is streamed: rows are read from MySQL in primary key order,
+TRANSFER_CHUNK_SIZE at a time (default 5000), and each chunk is written
+with COPY and committed on its own. The highest key already in the target
+is the checkpoint, so an interrupted transfer resumes after the last
+committed chunk (--restart empties the targets first). Tables are copied
+in parallel, each on its own pair of connections, and afterwards the row
+count and a SHA-256 over the mapped columns of both sides are compared.
+
+Usage: python transfer.py [--tables Dolar YiUfe] [--chunk-size N] [--workers N]
+                          [--restart] [--no-verify]
+"""
+
+import argparse
+import hashlib
+import io
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
 from dotenv import load_dotenv
 import mysql.connector
 import psycopg2
+import psycopg2.extensions
 from urllib.parse import urlparse
+from logger import get_logger
+
+logger = get_logger('transfer')
+
+CHUNK_SIZE = int(os.getenv('TRANSFER_CHUNK_SIZE', '5000'))
 
 def get_mysql_connection():
     try:
@@ -49,56 +78,22 @@ def get_postgres_connection():
     except psycopg2.Error as e:
         raise Exception(f"PostgreSQL connection error: {str(e)}")
 
-def transfer_table(mysql_conn, pg_conn, mysql_table, pg_table, column_mapping):
-    try:
-        # Fetch data from MySQL
-        mysql_cursor = mysql_conn.cursor()
-        mysql_cursor.execute(f"SELECT * FROM {mysql_table}")
-        rows = mysql_cursor.fetchall()
-        mysql_columns = [desc[0] for desc in mysql_cursor.description]
-        
-        if not rows:
-            print(f"No data found in MySQL table '{mysql_table}'")
-            return
-        
-        # Map MySQL columns to PostgreSQL columns (ensure quotes)
-        pg_columns = [f'"{column_mapping[col]}"' for col in mysql_columns]  # Explicitly quote each column
-        placeholders = ', '.join(['%s'] * len(pg_columns))
-        insert_query = f'INSERT INTO "{pg_table}" ({", ".join(pg_columns)}) VALUES ({placeholders})'
-        
-        # Debug: Print the query to verify
-        print(f"Generated INSERT query: {insert_query}")
-        
-        # Insert data into PostgreSQL
-        pg_cursor = pg_conn.cursor()
-        pg_cursor.executemany(insert_query, rows)
-        pg_conn.commit()
-        
-        print(f"Transferred {len(rows)} rows from MySQL '{mysql_table}' to PostgreSQL '{pg_table}'")
-        
-    except mysql.connector.Error as e:
-        raise Exception(f"MySQL error during transfer: {str(e)}")
-    except psycopg2.Error as e:
-        pg_conn.rollback()
-        raise Exception(f"PostgreSQL error during transfer: {str(e)}")
-    finally:
-        mysql_cursor.close()
-        pg_cursor.close()
-
-def main():
-    mysql_conn = None
-    pg_conn = None
-    try:
-        mysql_conn = get_mysql_connection()
-        pg_conn = get_postgres_connection()
-        
-        # Column mappings (MySQL -> PostgreSQL, exact camelCase match)
-        dolar_mapping = {
+# Column mappings (MySQL -> PostgreSQL, exact camelCase match), keyed by
+# the PostgreSQL table
+TABLES = {
+    "Dolar": {
+        "source": "dolar",
+        "key": "id",
+        "columns": {
             "id": "id",
             "gecerliOlduguTarih": "gecerliOlduguTarih",
             "dovizAlis": "dovizAlis"
-        }
-        yiufe_mapping = {
+        },
+    },
+    "YiUfe": {
+        "source": "yiufe",
+        "key": "id",
+        "columns": {
             "id": "id",
             "yil": "yil",
             "ocak": "ocak",
@@ -113,20 +108,248 @@ def main():
             "ekim": "ekim",
             "kasim": "kasim",
             "aralik": "aralik"
+        },
+    },
+}
+
+
+def _is_postgres(connection):
+    return isinstance(connection, psycopg2.extensions.connection)
+
+
+def _iter_chunks(connection, query, params=(), chunk_size=CHUNK_SIZE):
+    """
+    Rows of `query` in lists of at most `chunk_size`, without loading the
+    result at once: a named cursor on PostgreSQL, an unbuffered one on MySQL
+    """
+    if _is_postgres(connection):
+        cursor = connection.cursor(name=f"transfer_{time.monotonic_ns()}")
+        cursor.itersize = chunk_size
+    else:
+        cursor = connection.cursor()
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _copy_text(value):
+    """A value in COPY text format"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        text = "t" if value else "f"
+    elif isinstance(value, float):
+        text = repr(value)
+    elif isinstance(value, datetime):
+        text = value.isoformat(sep=" ")
+    else:
+        text = str(value)
+    return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_rows(pg_cursor, pg_table, pg_columns, rows):
+    """Write rows into `pg_table` with one COPY"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_text(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    columns = ", ".join(f'"{column}"' for column in pg_columns)
+    pg_cursor.copy_expert(f'COPY "{pg_table}" ({columns}) FROM STDIN', buffer)
+
+
+def _checkpoint(pg_conn, pg_table, key):
+    """Highest key already copied, None for an empty table"""
+    with pg_conn.cursor() as cursor:
+        cursor.execute(f'SELECT MAX("{key}") FROM "{pg_table}"')
+        checkpoint = cursor.fetchone()[0]
+    pg_conn.commit()
+    return checkpoint
+
+
+def transfer_table(mysql_conn, pg_conn, mysql_table, pg_table, column_mapping, key="id",
+                   chunk_size=CHUNK_SIZE, restart=False):
+    """
+    Stream `mysql_table` into `pg_table`, one committed COPY per chunk, and
+    resume after the highest key already in `pg_table`. Returns a report
+    with the rows copied and rows per second.
+    """
+    started = time.perf_counter()
+    mysql_columns = list(column_mapping)
+    pg_columns = [column_mapping[column] for column in mysql_columns]
+    try:
+        if restart:
+            with pg_conn.cursor() as cursor:
+                cursor.execute(f'DELETE FROM "{pg_table}"')
+            pg_conn.commit()
+        checkpoint = _checkpoint(pg_conn, pg_table, column_mapping[key])
+
+        query = f"SELECT {', '.join(mysql_columns)} FROM {mysql_table}"
+        params = ()
+        if checkpoint is not None:
+            query += f" WHERE {key} > %s"
+            params = (checkpoint,)
+            logger.info(f"Resuming '{pg_table}' after {key} {checkpoint}")
+        query += f" ORDER BY {key}"
+
+        copied = 0
+        with pg_conn.cursor() as pg_cursor:
+            for rows in _iter_chunks(mysql_conn, query, params, chunk_size):
+                copy_rows(pg_cursor, pg_table, pg_columns, rows)
+                pg_conn.commit()
+                copied += len(rows)
+                logger.debug(f"'{pg_table}': {copied} rows copied, last {key} {rows[-1][mysql_columns.index(key)]}")
+
+            # Explicit ids do not advance the serial sequence
+            pg_cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('\"{pg_table}\"', %s), MAX(\"{column_mapping[key]}\")) "
+                f'FROM "{pg_table}" HAVING MAX("{column_mapping[key]}") IS NOT NULL',
+                (column_mapping[key],)
+            )
+        pg_conn.commit()
+    except mysql.connector.Error as e:
+        raise Exception(f"MySQL error during transfer: {str(e)}")
+    except psycopg2.Error as e:
+        pg_conn.rollback()
+        raise Exception(f"PostgreSQL error during transfer: {str(e)}")
+
+    seconds = time.perf_counter() - started
+    report = {
+        "table": pg_table,
+        "rows": copied,
+        "resumedAfter": checkpoint,
+        "seconds": round(seconds, 3),
+        "rowsPerSecond": round(copied / seconds) if seconds > 0 else None,
+    }
+    logger.info(f"Transferred {copied} rows from MySQL '{mysql_table}' to PostgreSQL '{pg_table}' "
+                f"({report['rowsPerSecond']} rows/s)")
+    return report
+
+
+def _checksum_text(value):
+    # Both drivers must produce the same text: numbers as floats (MySQL may
+    # return Decimal or int where PostgreSQL has double precision), dates as ISO
+    if value is None:
+        return "\\N"
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return repr(float(value))
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def table_digest(connection, query, chunk_size=CHUNK_SIZE):
+    """(row count, SHA-256 hex digest) of the rows of `query`, streamed"""
+    digest = hashlib.sha256()
+    count = 0
+    for rows in _iter_chunks(connection, query, chunk_size=chunk_size):
+        for row in rows:
+            digest.update("\t".join(_checksum_text(value) for value in row).encode("utf-8"))
+            digest.update(b"\n")
+        count += len(rows)
+    if _is_postgres(connection):
+        connection.rollback()
+    return count, digest.hexdigest()
+
+
+def verify_table(mysql_conn, pg_conn, mysql_table, pg_table, column_mapping, key="id", chunk_size=CHUNK_SIZE):
+    """Compare row count and checksum of the mapped columns on both sides"""
+    mysql_columns = list(column_mapping)
+    pg_columns = ", ".join(f'"{column_mapping[column]}"' for column in mysql_columns)
+    source = table_digest(
+        mysql_conn, f"SELECT {', '.join(mysql_columns)} FROM {mysql_table} ORDER BY {key}", chunk_size
+    )
+    target = table_digest(
+        pg_conn, f'SELECT {pg_columns} FROM "{pg_table}" ORDER BY "{column_mapping[key]}"', chunk_size
+    )
+    result = {
+        "sourceRows": source[0],
+        "targetRows": target[0],
+        "checksumMatch": source[1] == target[1],
+    }
+    result["verified"] = source[0] == target[0] and result["checksumMatch"]
+    if result["verified"]:
+        logger.info(f"'{pg_table}' verified: {target[0]} rows, checksum {target[1][:12]}")
+    else:
+        logger.error(f"'{pg_table}' does not match '{mysql_table}': {result}")
+    return result
+
+
+def _transfer_one(pg_table, chunk_size, restart, verify, source_connect, target_connect):
+    spec = TABLES[pg_table]
+    mysql_conn = source_connect()
+    pg_conn = target_connect()
+    try:
+        report = transfer_table(
+            mysql_conn, pg_conn, spec["source"], pg_table, spec["columns"], spec["key"], chunk_size, restart
+        )
+        if verify:
+            report.update(verify_table(mysql_conn, pg_conn, spec["source"], pg_table, spec["columns"], spec["key"], chunk_size))
+        return report
+    finally:
+        mysql_conn.close()
+        pg_conn.close()
+
+
+def transfer_tables(tables=None, chunk_size=CHUNK_SIZE, workers=None, restart=False, verify=True,
+                    source_connect=get_mysql_connection, target_connect=get_postgres_connection):
+    """
+    Transfer several TABLES in parallel, one thread and connection pair per
+    table. `source_connect` / `target_connect` open the connections, e.g.
+    to local stand-in databases. Returns {"tables": [reports], ...}.
+    """
+    tables = list(tables or TABLES)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers or len(tables)) as executor:
+        futures = {
+            table: executor.submit(_transfer_one, table, chunk_size, restart, verify, source_connect, target_connect)
+            for table in tables
         }
-        
-        transfer_table(mysql_conn, pg_conn, "dolar", "Dolar", dolar_mapping)
-        transfer_table(mysql_conn, pg_conn, "yiufe", "YiUfe", yiufe_mapping)
-        
-        print("Data transfer completed successfully!")
-        
+        reports = []
+        for table, future in futures.items():
+            try:
+                reports.append(future.result())
+            except Exception as e:
+                logger.error(f"Transfer of '{table}' failed: {str(e)}")
+                reports.append({"table": table, "error": str(e)})
+
+    seconds = time.perf_counter() - started
+    rows = sum(report.get("rows", 0) for report in reports)
+    return {
+        "tables": reports,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rowsPerSecond": round(rows / seconds) if seconds > 0 else None,
+        "success": all("error" not in report and report.get("verified", True) for report in reports),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", nargs="*", choices=list(TABLES), default=list(TABLES))
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, help="tables copied at once (default: all)")
+    parser.add_argument("--restart", action="store_true", help="empty the target tables instead of resuming")
+    parser.add_argument("--no-verify", action="store_true", help="skip the count and checksum comparison")
+    args = parser.parse_args()
+
+    try:
+        summary = transfer_tables(args.tables, args.chunk_size, args.workers, args.restart, not args.no_verify)
     except Exception as e:
         print(f"Error: {str(e)}")
-    finally:
-        if mysql_conn and mysql_conn.is_connected():
-            mysql_conn.close()
-        if pg_conn and not pg_conn.closed:
-            pg_conn.close()
+        raise SystemExit(1)
+
+    print(json.dumps(summary, indent=2, default=str))
+    if summary["success"]:
+        print("Data transfer completed successfully!")
+    else:
+        raise SystemExit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()